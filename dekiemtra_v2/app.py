@@ -12,6 +12,7 @@ from __future__ import annotations
 
 import sys
 from pathlib import Path
+from typing import Optional
 
 # ✅ FIX IMPORT PATH (quan trọng cho Streamlit Cloud)
 APP_DIR = Path(__file__).resolve().parent
@@ -22,9 +23,9 @@ import streamlit as st
 
 from modules.ai_client import GeminiClient, DEFAULT_GEN_CONFIG
 from modules.data_loader import (
-    load_curriculum_from_docx,
-    load_sample_curriculum,
+    CurriculumEntry,
     extract_text_from_upload,
+    get_curriculum_registry,
 )
 from modules.ui_tabs import render_tab_matrix_to_exam, render_tab_question_builder, render_tab_matrix_export
 
@@ -42,8 +43,7 @@ def _init_state():
     st.session_state.setdefault("current_preview", "")  # Tab2: preview câu
     st.session_state.setdefault("temp_question_data", None)
     st.session_state.setdefault("yccd_cache", {})       # cache gợi ý YCCĐ (theo bài)
-    st.session_state.setdefault("curriculum", None)     # nested dict
-    st.session_state.setdefault("curriculum_df", None)  # dataframe chuẩn hoá
+    st.session_state.setdefault("curriculum_handle", None)  # khoá CT trong kho dùng chung (không giữ bản sao)
     st.session_state.setdefault("school_name", DEFAULT_SCHOOL)
 
 
@@ -59,6 +59,26 @@ def _get_api_key() -> str:
     return key.strip()
 
 
+def _session_id() -> str:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else ""
+    except Exception:
+        return ""
+
+
+def _current_curriculum() -> Optional[CurriculumEntry]:
+    handle = st.session_state.get("curriculum_handle")
+    entry = get_curriculum_registry().get(handle)
+    if handle and entry is None:
+        # Bị giải phóng khỏi kho (LRU) => cần nạp lại file
+        st.session_state["curriculum_handle"] = None
+        st.warning("Dữ liệu CT đã được giải phóng khỏi bộ nhớ máy chủ. Hãy nạp lại file.")
+    return entry
+
+
 def main():
     _init_state()
 
@@ -79,26 +99,32 @@ def main():
             )
 
         st.caption("📌 Streamlit Cloud → Settings → Secrets: GOOGLE_API_KEY = '...'")
+        cs = GeminiClient.cache_stats()
+        st.caption(
+            f"⚡ Cache AI: {cs['hits']} hit / {cs['misses']} miss "
+            f"({cs['hit_rate']:.0%}) • {cs['entries']} phản hồi đã lưu"
+        )
 
         st.divider()
         st.subheader("📚 Nạp dữ liệu CT (tuỳ chọn)")
-        doc = st.file_uploader("Tải lên file kế hoạch/CT (DOCX)", type=["docx"], key="curr_docx")
-        if doc is not None and st.button("Nạp dữ liệu từ DOCX", type="primary"):
+        doc = st.file_uploader("Tải lên file kế hoạch/CT (DOCX/XLSX/CSV)", type=["docx", "xlsx", "csv"], key="curr_docx")
+        if doc is not None and st.button("Nạp dữ liệu CT", type="primary"):
             with st.spinner("Đang đọc & chuẩn hoá dữ liệu..."):
-                df, nested, warn = load_curriculum_from_docx(doc.getvalue())
-                st.session_state["curriculum_df"] = df
-                st.session_state["curriculum"] = nested
-            if warn:
-                st.warning(warn)
+                entry = get_curriculum_registry().load(doc.name, doc.getvalue())
+                st.session_state["curriculum_handle"] = entry.key
+            if entry.warn:
+                st.warning(entry.warn)
             else:
-                st.success("Đã nạp dữ liệu từ DOCX.")
+                st.success(f"Đã nạp dữ liệu từ {doc.name}.")
 
         if st.button("Dùng dữ liệu mẫu (demo)", help="Chạy thử khi chưa có dữ liệu DOCX"):
-            df, nested = load_sample_curriculum()
-            st.session_state["curriculum_df"] = df
-            st.session_state["curriculum"] = nested
+            st.session_state["curriculum_handle"] = get_curriculum_registry().load_sample().key
             st.success("Đã nạp dữ liệu mẫu.")
 
+        curr = _current_curriculum()
+        if curr is not None:
+            st.caption(f"📚 Đang dùng: {curr.name}")
+
         st.divider()
         if st.button("🧹 Xoá đề/preview/cache", help="Xoá dữ liệu đã sinh để làm lại"):
             for k in ["exam_result", "exam_list", "current_preview", "temp_question_data", "yccd_cache"]:
@@ -120,8 +146,9 @@ def main():
     )
     st.markdown(f"<div class='main-header'>{APP_TITLE}</div>", unsafe_allow_html=True)
 
+    curr = _current_curriculum()
     api_key = _get_api_key()
-    client = GeminiClient(api_key=api_key)
+    client = GeminiClient(api_key=api_key, session_id=_session_id())
 
     tab1, tab2, tab3 = st.tabs(
         ["📁 Tab 1: Tạo đề từ ma trận", "✍️ Tab 2: Soạn từng câu", "📊 Tab 3: Ma trận & Xuất"]
@@ -138,15 +165,16 @@ def main():
     with tab2:
         render_tab_question_builder(
             client=client,
-            curriculum=st.session_state.get("curriculum"),
-            curriculum_df=st.session_state.get("curriculum_df"),
+            curriculum=curr.nested if curr else None,
+            curriculum_df=curr.df if curr else None,
             gen_config=DEFAULT_GEN_CONFIG,
+            curriculum_index=curr.index if curr else None,
         )
 
     with tab3:
         render_tab_matrix_export(
             school_name=st.session_state["school_name"],
-            curriculum_df=st.session_state.get("curriculum_df"),
+            curriculum_df=curr.df if curr else None,
         )
 
     st.markdown(f"<div class='footer'>🏫 {DEFAULT_FOOTER}</div>", unsafe_allow_html=True)
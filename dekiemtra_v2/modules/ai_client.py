@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
 import random
+import re
+import threading
 import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple, Union
 
-import streamlit as st
+from modules.model_router import get_model_router
+from modules.prompt_budget import estimate_tokens, fit_to_budget
+from modules.response_cache import get_response_cache
 
 DEFAULT_GEN_CONFIG: Dict[str, Any] = {
     "temperature": 0.4,
@@ -14,17 +24,424 @@ DEFAULT_GEN_CONFIG: Dict[str, Any] = {
     "max_output_tokens": 2048,
 }
 
-MAX_PROMPT_CHARS = 20_000
+MAX_PROMPT_TOKENS = 8_000  # ngân sách token đầu vào mỗi lời gọi (cắt theo dòng khi vượt)
+MAX_BATCH_WORKERS = 4
+MAX_ROUTING_PASSES = 2
+MAX_ASYNC_CONCURRENCY = 8
+REQUEST_TIMEOUT_SECONDS = 90.0
+MODEL_LIST_TTL_SECONDS = 3600.0
+MODEL_LIST_FAILURE_TTL_SECONDS = 60.0  # key sai/không có model: nhớ kết quả rỗng 1 lúc, không gọi lại mỗi rerun
+DEFAULT_RPM = float(os.environ.get("GEMINI_RPM", 15))
+DEFAULT_TPM = float(os.environ.get("GEMINI_TPM", 1_000_000))
+RATE_LIMIT_HEADROOM = 0.9
+RATE_LIMIT_MAX_WAIT_SECONDS = 120.0
+RATE_LIMIT_POLL_SECONDS = 0.05  # chu kỳ kiểm tra lượt của aacquire (không giữ luồng nào khi chờ)
 
+_BLOCKED_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII"}
+_TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+_GRPC_STATUS = {"RESOURCE_EXHAUSTED": 429, "INTERNAL": 500, "UNAVAILABLE": 503, "DEADLINE_EXCEEDED": 504}
+# Chỉ dùng khi lỗi không mang mã trạng thái; khớp nguyên từ ("generateContent" không phải "rate")
+_RATE_LIMIT_RE = re.compile(r"\b429\b|resource[_ ]exhausted|rate[- ]?limit|too many requests|\bquota\b", re.I)
+_TRANSIENT_RE = re.compile(
+    r"\b(?:429|500|502|503|504)\b|resource[_ ]exhausted|rate[- ]?limit|too many requests"
+    r"|temporarily|\bunavailable\b|timed? ?out|deadline",
+    re.I,
+)
 
-def _truncate(s: str, max_chars: int) -> str:
-    s = s or ""
-    return s if len(s) <= max_chars else s[:max_chars] + "\n\n[...ĐÃ CẮT BỚT DO QUÁ DÀI...]"
+try:
+    from google.api_core import exceptions as _gexc
 
+    _RATE_LIMIT_ERRORS: Tuple[type, ...] = (_gexc.ResourceExhausted, _gexc.TooManyRequests)
+    _TRANSIENT_ERRORS: Tuple[type, ...] = (_gexc.ServiceUnavailable, _gexc.DeadlineExceeded, _gexc.InternalServerError)
+except ImportError:
+    _RATE_LIMIT_ERRORS = _TRANSIENT_ERRORS = ()
 
-def _backoff(attempt: int) -> None:
-    base = min(8.0, 2.0 ** attempt)
-    time.sleep(base + random.random() * 0.6)
+
+def _backoff_delay(attempt: int) -> float:
+    return min(8.0, 2.0 ** attempt) + random.random() * 0.6
+
+
+def _status_code(err: BaseException) -> Optional[int]:
+    """Mã HTTP của lỗi (google.api_core: .code; grpc: .code() -> StatusCode); None nếu lỗi không mang mã."""
+    code = getattr(err, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return None
+        return _GRPC_STATUS.get(getattr(code, "name", ""), 0)
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_transient(err: BaseException) -> bool:
+    if isinstance(err, _RATE_LIMIT_ERRORS + _TRANSIENT_ERRORS):
+        return True
+    code = _status_code(err)
+    if code is not None:
+        return code in _TRANSIENT_STATUS
+    return bool(_TRANSIENT_RE.search(str(err)))
+
+
+def _is_rate_limited(err: BaseException) -> bool:
+    if isinstance(err, _RATE_LIMIT_ERRORS):
+        return True
+    code = _status_code(err)
+    if code is not None:
+        return code == 429
+    return bool(_RATE_LIMIT_RE.search(str(err)))
+
+
+# Semaphore dùng chung theo event loop (asyncio.Semaphore gắn với 1 loop)
+_ASYNC_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _async_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _ASYNC_SEMAPHORES.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(MAX_ASYNC_CONCURRENCY)
+        _ASYNC_SEMAPHORES[loop] = sem
+    return sem
+
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+# Client gRPC riêng cho từng API key: key đi kèm mỗi request, không dùng genai.configure
+# (cấu hình toàn cục của process => session này có thể gọi bằng key của session khác)
+_CLIENTS_LOCK = threading.Lock()
+_SERVICE_CLIENTS: Dict[Tuple[str, str], Any] = {}
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _service_client(api_key: str, kind: str = "generate") -> Any:
+    """GenerativeServiceClient ("generate") hoặc ModelServiceClient ("models") của 1 key, tạo 1 lần/process."""
+    import google.ai.generativelanguage as glm
+
+    k = (_key_hash(api_key), kind)
+    with _CLIENTS_LOCK:
+        client = _SERVICE_CLIENTS.get(k)
+        if client is None:
+            cls = glm.GenerativeServiceClient if kind == "generate" else glm.ModelServiceClient
+            client = _SERVICE_CLIENTS[k] = cls(client_options={"api_key": api_key})
+    return client
+
+
+def _async_service_client(api_key: str) -> Any:
+    """Client async gắn với event loop đang chạy (grpc.aio không dùng chung được giữa các loop)."""
+    import google.ai.generativelanguage as glm
+
+    loop = asyncio.get_running_loop()
+    kh = _key_hash(api_key)
+    with _CLIENTS_LOCK:
+        per_loop = _ASYNC_CLIENTS.get(loop)
+        if per_loop is None:
+            per_loop = _ASYNC_CLIENTS[loop] = {}
+        client = per_loop.get(kh)
+        if client is None:
+            client = per_loop[kh] = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return client
+
+
+def _content_request(model_name: str, prompt: str, cfg: Dict[str, Any]) -> Any:
+    import google.ai.generativelanguage as glm
+
+    return glm.GenerateContentRequest(
+        model=model_name,
+        contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+        generation_config=glm.GenerationConfig(**cfg),
+    )
+
+
+def _response_text(resp: Any) -> str:
+    """Text của ứng viên đầu tiên (rỗng nếu bị chặn/không có ứng viên)."""
+    for cand in getattr(resp, "candidates", None) or []:
+        parts = getattr(getattr(cand, "content", None), "parts", None) or []
+        return "".join(getattr(p, "text", "") or "" for p in parts)
+    return ""
+
+
+def _block_reason(resp: Any) -> Optional[str]:
+    reason = getattr(getattr(resp, "prompt_feedback", None), "block_reason", None)
+    if reason:
+        return f"Prompt bị chặn ({getattr(reason, 'name', reason)})."
+    for cand in getattr(resp, "candidates", None) or []:
+        finish = getattr(getattr(cand, "finish_reason", None), "name", "")
+        return f"Phản hồi bị chặn ({finish})." if finish in _BLOCKED_FINISH_REASONS else None
+    return None
+
+
+def _discover_models(api_key: str) -> List[str]:
+    all_models = list(_service_client(api_key, "models").list_models())
+    valid = [
+        m.name
+        for m in all_models
+        if "generateContent" in getattr(m, "supported_generation_methods", [])
+    ]
+
+    priority: List[str] = []
+    for m in valid:
+        ml = m.lower()
+        if "1.5" in ml and "flash" in ml:
+            priority.append(m)
+    for m in valid:
+        ml = m.lower()
+        if "1.5" in ml and "pro" in ml and m not in priority:
+            priority.append(m)
+    for m in valid:
+        if m not in priority:
+            priority.append(m)
+    return priority
+
+
+class _ModelCatalog:
+    """
+    Cache danh sách model cấp process, khoá theo hash API key:
+    - Lần đầu: gọi list_models (các session cùng key chờ chung 1 lời gọi)
+    - Quá TTL: vẫn trả danh sách cũ ngay, làm mới ở luồng nền
+    - Lỗi (key sai...) hoặc rỗng: không ném lỗi, nhớ danh sách rỗng trong failure_ttl_seconds
+    """
+
+    def __init__(
+        self, ttl_seconds: float = MODEL_LIST_TTL_SECONDS, failure_ttl_seconds: float = MODEL_LIST_FAILURE_TTL_SECONDS
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self._entries: Dict[str, Tuple[float, List[str]]] = {}
+        self._errors: Dict[str, str] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> List[str]:
+        kh = _key_hash(api_key)
+        with self._lock:
+            entry = self._entries.get(kh)
+            key_lock = self._key_locks.setdefault(kh, threading.Lock())
+        if entry is not None and self._fresh(entry):
+            if entry[1] and time.time() - entry[0] > self.ttl_seconds:
+                self._refresh_in_background(api_key, kh)
+            return list(entry[1])
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(kh)
+            if entry is None or not self._fresh(entry):
+                try:
+                    models, err = _discover_models(api_key), None
+                except Exception as e:
+                    models, err = [], str(e)
+                entry = (time.time(), models)
+                with self._lock:
+                    self._entries[kh] = entry
+                    if err:
+                        self._errors[kh] = err
+                    else:
+                        self._errors.pop(kh, None)
+        return list(entry[1])
+
+    def _fresh(self, entry: Tuple[float, List[str]]) -> bool:
+        # Danh sách có model: luôn dùng được (quá TTL thì làm mới nền); rỗng: chỉ tin trong failure_ttl
+        return bool(entry[1]) or time.time() - entry[0] <= self.failure_ttl_seconds
+
+    def cached(self, api_key: str) -> Optional[List[str]]:
+        """Danh sách model đang có trong cache (không gọi mạng); chưa từng lấy thì None."""
+        with self._lock:
+            entry = self._entries.get(_key_hash(api_key))
+        return None if entry is None else list(entry[1])
+
+    def last_error(self, api_key: str) -> Optional[str]:
+        with self._lock:
+            return self._errors.get(_key_hash(api_key))
+
+    def _refresh_in_background(self, api_key: str, kh: str) -> None:
+        with self._lock:
+            if kh in self._refreshing:
+                return
+            self._refreshing.add(kh)
+
+        def _run() -> None:
+            try:
+                models = _discover_models(api_key)
+                if models:
+                    with self._lock:
+                        self._entries[kh] = (time.time(), models)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(kh)
+
+        threading.Thread(target=_run, name="gemini-list-models", daemon=True).start()
+
+    def invalidate(self, api_key: Optional[str] = None) -> None:
+        with self._lock:
+            if api_key is None:
+                self._entries.clear()
+                self._errors.clear()
+            else:
+                self._entries.pop(_key_hash(api_key), None)
+                self._errors.pop(_key_hash(api_key), None)
+
+
+_MODEL_CATALOG = _ModelCatalog()
+
+
+class RateLimiter:
+    """
+    Token bucket cấp process cho 1 API key (RPM + TPM), chừa khoảng dư để không chạm quota.
+    Hàng đợi công bằng: mỗi session có hàng riêng, phục vụ xoay vòng giữa các session
+    nên một session gửi nhiều request không chặn session khác.
+    """
+
+    def __init__(self, rpm: float, tpm: float, headroom: float = RATE_LIMIT_HEADROOM):
+        self.req_capacity = max(1.0, rpm * headroom)
+        self.tok_capacity = max(1.0, tpm * headroom)
+        self._req = self.req_capacity
+        self._tok = self.tok_capacity
+        self._stamp = time.monotonic()
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, Deque[object]]" = OrderedDict()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        dt = now - self._stamp
+        self._stamp = now
+        self._req = min(self.req_capacity, self._req + dt * self.req_capacity / 60.0)
+        self._tok = min(self.tok_capacity, self._tok + dt * self.tok_capacity / 60.0)
+
+    def _wait_needed(self, tokens: float) -> float:
+        need_req = max(0.0, 1.0 - self._req) * 60.0 / self.req_capacity
+        need_tok = max(0.0, tokens - self._tok) * 60.0 / self.tok_capacity
+        return max(need_req, need_tok)
+
+    def _is_turn(self, session_id: str, ticket: object) -> bool:
+        first = next(iter(self._queues))
+        return first == session_id and self._queues[session_id][0] is ticket
+
+    def _leave(self, session_id: str, ticket: object, served: bool) -> None:
+        q = self._queues[session_id]
+        q.remove(ticket)
+        if not q:
+            del self._queues[session_id]
+        elif served:
+            self._queues.move_to_end(session_id)
+
+    def acquire(self, tokens: float, session_id: str = "", timeout: Optional[float] = None) -> bool:
+        """Chờ tới lượt và đủ quota; trả False nếu quá timeout (timeout=0: chỉ thử ngay)."""
+        tokens = min(float(tokens), self.tok_capacity)
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            try:
+                while True:
+                    wait = self._try_take(tokens, session_id, ticket)
+                    if wait is None:
+                        ticket = None
+                        return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = min(wait, remaining) if wait > 0 else remaining
+                    self._cond.wait(timeout=max(0.01, wait) if wait > 0 else None)
+            finally:
+                if ticket is not None:
+                    self._leave(session_id, ticket, served=False)
+                self._cond.notify_all()
+
+    def _try_take(self, tokens: float, session_id: str, ticket: object) -> Optional[float]:
+        """(Giữ _cond) Tới lượt và đủ quota thì trừ quota, trả None; chưa thì trả số giây cần chờ (0: chờ lượt)."""
+        self._refill()
+        wait = self._wait_needed(tokens)
+        if self._is_turn(session_id, ticket) and wait <= 0:
+            self._req -= 1.0
+            self._tok -= tokens
+            self._leave(session_id, ticket, served=True)
+            return None
+        return wait
+
+    async def aacquire(self, tokens: float, session_id: str = "", timeout: Optional[float] = None) -> bool:
+        """
+        Bản asyncio của acquire: chờ bằng asyncio.sleep (không chiếm luồng nào),
+        task bị huỷ thì vé được rút khỏi hàng đợi ngay (không chặn session khác, không tiêu quota).
+        """
+        tokens = min(float(tokens), self.tok_capacity)
+        ticket: Optional[object] = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(tokens, session_id, ticket)
+                    if wait is None:
+                        ticket = None
+                        self._cond.notify_all()
+                        return True
+                delay = wait if wait > 0 else RATE_LIMIT_POLL_SECONDS
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    delay = min(delay, remaining)
+                await asyncio.sleep(max(0.01, delay))
+        finally:
+            if ticket is not None:
+                with self._cond:
+                    self._leave(session_id, ticket, served=False)
+                    self._cond.notify_all()
+
+    def spare(self) -> float:
+        """Tỉ lệ quota request đang rảnh (0..1); có session đang xếp hàng thì coi như 0."""
+        with self._cond:
+            self._refill()
+            return 0.0 if self._queues else self._req / self.req_capacity
+
+    def adjust(self, token_delta: float) -> None:
+        """Bù/trừ chênh lệch giữa token ước lượng và token thực tế sau khi có phản hồi."""
+        with self._cond:
+            self._refill()
+            self._tok = min(self.tok_capacity, self._tok - token_delta)
+            self._cond.notify_all()
+
+    def refund(self, tokens: float) -> None:
+        """Trả lại quota của 1 lần gọi hỏng không bị tính (lỗi mạng/5xx/timeout, không phải 429)."""
+        with self._cond:
+            self._refill()
+            self._req = min(self.req_capacity, self._req + 1.0)
+            self._tok = min(self.tok_capacity, self._tok + min(float(tokens), self.tok_capacity))
+            self._cond.notify_all()
+
+
+# Quota tính theo từng API key => mỗi key 1 bucket (theo hash key)
+_RATE_LIMITERS: Dict[str, RateLimiter] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def _rate_limiter_for(api_key: str) -> RateLimiter:
+    kh = _key_hash(api_key or "")
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.get(kh)
+        if limiter is None:
+            limiter = _RATE_LIMITERS[kh] = RateLimiter(DEFAULT_RPM, DEFAULT_TPM)
+    return limiter
+
+
+def _estimate_tokens(prompt: str, gen_config: Dict[str, Any]) -> int:
+    # Token đầu vào ước lượng + nửa số token đầu ra tối đa
+    return estimate_tokens(prompt) + int(gen_config.get("max_output_tokens", 0) or 0) // 2
+
+
+def _usage_tokens(resp: Any) -> Optional[int]:
+    usage = getattr(resp, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None) if usage is not None else None
+    return int(total) if total else None
 
 
 @dataclass
@@ -32,100 +449,379 @@ class GenResult:
     text: Optional[str] = None
     model: Optional[str] = None
     error: Optional[str] = None
+    cached: bool = False
+
+
+class GenStream:
+    """
+    Các đoạn text theo thứ tự về từ model (dùng với st.write_stream / placeholder).
+    Sau khi duyệt hết, .result là GenResult đầy đủ để kiểm tra định dạng & lưu.
+    """
+
+    def __init__(self, chunks: Optional[Iterator[str]] = None):
+        self._chunks = chunks if chunks is not None else iter(())
+        self.result = GenResult()
+
+    def __iter__(self) -> Iterator[str]:
+        return self._chunks
+
+
+class _ContentError(RuntimeError):
+    """Phản hồi rỗng/bị chặn: do nội dung prompt chứ không phải model hỏng => không tính vào cầu dao."""
+
+
+_OVERLOADED = "Hệ thống đang quá tải (vượt giới hạn gọi API). Thử lại sau ít phút."
+
+
+class _RoutedCall:
+    """
+    Vòng thử chung của generate/agenerate/stream: thứ tự model theo router, xin quota trước mỗi lần gọi,
+    ghi sức khoẻ model, quyết định chờ rồi thử lượt sau. Nơi gọi chỉ gửi request rồi báo done/fail.
+    """
+
+    def __init__(self, client: "GeminiClient", models: List[str], est_tokens: int):
+        self.client = client
+        self.models = models
+        self.est_tokens = est_tokens
+        # Lời gọi chạy nền (record_health=False) không được làm lệch sức khoẻ model của người dùng thật
+        self.router = get_model_router()
+        self.key = _key_hash(client.api_key)
+        self.record_health = client.record_health
+        self.limiter = client.rate_limiter()
+        self.last_err: Optional[str] = None
+        self.overloaded = False
+        self._transient = False
+        self._t0 = 0.0
+
+    def _steps(self) -> Iterator[Union[str, float]]:
+        """Tên model cần thử, hoặc số giây cần chờ giữa 2 lượt."""
+        for attempt in range(MAX_ROUTING_PASSES):
+            self._transient = False
+            yield from self.router.order(self.models, self.key)
+            # Chỉ chờ khi cả lượt đều lỗi tạm thời; lỗi ở 1 model thì chuyển ngay model khác
+            if not self._transient or attempt == MAX_ROUTING_PASSES - 1:
+                return
+            yield _backoff_delay(attempt)
+
+    def attempts(self) -> Iterator[str]:
+        for step in self._steps():
+            if isinstance(step, float):
+                time.sleep(step)
+                continue
+            if not self.limiter.acquire(self.est_tokens, self.client.session_id, timeout=self.client.rate_limit_wait):
+                self.overloaded = True
+                return
+            self._t0 = time.monotonic()
+            yield step
+
+    async def aattempts(self) -> AsyncIterator[str]:
+        for step in self._steps():
+            if isinstance(step, float):
+                # Chờ không chặn luồng: các request khác vẫn chạy tiếp
+                await asyncio.sleep(step)
+                continue
+            if not await self.limiter.aacquire(self.est_tokens, self.client.session_id, self.client.rate_limit_wait):
+                self.overloaded = True
+                return
+            self._t0 = time.monotonic()
+            yield step
+
+    def done(self, model_name: str, text: str, resp: Any) -> str:
+        """Ghi nhận lần gọi thành công; text rỗng/bị chặn thì ném _ContentError."""
+        used = _usage_tokens(resp)
+        if used:
+            self.limiter.adjust(used - self.est_tokens)
+        if not text.strip():
+            raise _ContentError(_block_reason(resp) or "Model trả về rỗng.")
+        if self.record_health:
+            self.router.record_success(model_name, time.monotonic() - self._t0, self.key)
+        return text
+
+    def fail(self, model_name: str, err: BaseException) -> None:
+        if isinstance(err, asyncio.TimeoutError):
+            self.last_err = str(err) or "Quá thời gian chờ."
+            if self.record_health:
+                self.router.record_failure(model_name, key=self.key)
+            self.limiter.refund(self.est_tokens)
+            self._transient = True
+            return
+        self.last_err = str(err)
+        if isinstance(err, _ContentError):
+            return  # model đã xử lý (token đã trừ theo usage) nhưng nội dung bị chặn/rỗng
+        rate_limited = _is_rate_limited(err)
+        if self.record_health:
+            self.router.record_failure(model_name, rate_limited=rate_limited, key=self.key)
+        if not rate_limited:
+            self.limiter.refund(self.est_tokens)
+        self._transient = self._transient or _is_transient(err)
+
+    def error(self) -> GenResult:
+        if self.overloaded:
+            return GenResult(error=_OVERLOADED)
+        return GenResult(error=f"Hết model khả dụng. Lỗi cuối: {self.last_err}")
 
 
 class GeminiClient:
     """
-    Wrapper cho google-generativeai:
-    - Cache danh sách model theo session (tránh list_models liên tục)
-    - Rotate model + retry nhẹ khi lỗi tạm thời
+    Wrapper gọi Gemini (google-generativeai / generativelanguage), mỗi API key 1 client riêng:
+    - Cache danh sách model cấp process theo hash API key (tránh list_models mỗi session)
+    - Chọn model theo sức khoẻ (độ trễ/lỗi/429 + cầu dao), chuyển model ngay khi lỗi
     - Cắt prompt nếu quá dài để giảm InvalidArgument
+    - Cache phản hồi trên đĩa (dùng chung mọi session/process)
+    - Giới hạn RPM/TPM theo từng API key (dùng chung process), xoay vòng công bằng giữa các session
     """
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        session_id: str = "",
+        rate_limit_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+        record_health: bool = True,
+    ):
         self.api_key = (api_key or "").strip()
-        self._configured = False
+        self.session_id = session_id or ""
+        self.rate_limit_wait = rate_limit_wait  # 0: hết quota thì bỏ luôn (dùng cho việc chạy nền)
+        self.record_health = record_health
 
     def ready(self) -> bool:
         return bool(self.api_key)
 
-    def _ensure_configured(self) -> None:
-        if not self.api_key:
-            return
-        if st.session_state.get("_genai_api_key") == self.api_key and self._configured:
-            return
-        import google.generativeai as genai
-
-        genai.configure(api_key=self.api_key)
-        st.session_state["_genai_api_key"] = self.api_key
-        st.session_state.pop("_genai_model_priority", None)
-        self._configured = True
-
     def _model_priority(self) -> List[str]:
-        self._ensure_configured()
         if not self.api_key:
             return []
+        return _MODEL_CATALOG.get(self.api_key)
 
-        if "_genai_model_priority" in st.session_state:
-            return st.session_state["_genai_model_priority"]
-
-        import google.generativeai as genai
-
-        all_models = list(genai.list_models())
-        valid = [
-            m.name
-            for m in all_models
-            if "generateContent" in getattr(m, "supported_generation_methods", [])
-        ]
-
-        priority: List[str] = []
-        for m in valid:
-            ml = m.lower()
-            if "1.5" in ml and "flash" in ml:
-                priority.append(m)
-        for m in valid:
-            ml = m.lower()
-            if "1.5" in ml and "pro" in ml and m not in priority:
-                priority.append(m)
-        for m in valid:
-            if m not in priority:
-                priority.append(m)
-
-        st.session_state["_genai_model_priority"] = priority
-        return priority
-
-    def generate(self, prompt: str, gen_config: Optional[Dict[str, Any]] = None) -> GenResult:
+    def _prepare(self, prompt: str) -> Tuple[str, List[str], Optional[str]]:
+        """Kiểm tra key/prompt + lấy danh sách model (dùng cache cấp process)."""
         if not self.api_key:
-            return GenResult(error="Chưa có GOOGLE_API_KEY. Nhập ở Sidebar hoặc đặt trong st.secrets.")
+            return "", [], "Chưa có GOOGLE_API_KEY. Nhập ở Sidebar hoặc đặt trong st.secrets."
         prompt = (prompt or "").strip()
         if not prompt:
-            return GenResult(error="Prompt rỗng.")
-        if len(prompt) > MAX_PROMPT_CHARS:
-            prompt = _truncate(prompt, MAX_PROMPT_CHARS)
+            return "", [], "Prompt rỗng."
+        prompt = fit_to_budget(prompt, MAX_PROMPT_TOKENS)
 
-        self._ensure_configured()
         models = self._model_priority()
         if not models:
-            return GenResult(error="Không tìm thấy model generateContent khả dụng.")
+            err = _MODEL_CATALOG.last_error(self.api_key)
+            if err:
+                return prompt, [], f"Không lấy được danh sách model (kiểm tra API key): {err}"
+            return prompt, [], "Không tìm thấy model generateContent khả dụng."
+        return prompt, models, None
+
+    def _generate_prepared(
+        self,
+        prompt: str,
+        models: List[str],
+        gen_config: Optional[Dict[str, Any]],
+        use_cache: bool,
+    ) -> GenResult:
+        cfg = gen_config or DEFAULT_GEN_CONFIG
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            hit = cache.lookup(prompt, models, cfg)
+            if hit:
+                return GenResult(text=hit[1], model=hit[0], cached=True)
+
+        call = _RoutedCall(self, models, _estimate_tokens(prompt, cfg))
+        for model_name in call.attempts():
+            try:
+                resp = _service_client(self.api_key).generate_content(
+                    _content_request(model_name, prompt, cfg), timeout=REQUEST_TIMEOUT_SECONDS
+                )
+                text = call.done(model_name, _response_text(resp), resp)
+            except Exception as e:
+                call.fail(model_name, e)
+                continue
+            if cache is not None:
+                cache.put(prompt, model_name, cfg, text)
+            return GenResult(text=text, model=model_name)
+        return call.error()
+
+    async def _agenerate_prepared(
+        self,
+        prompt: str,
+        models: List[str],
+        gen_config: Optional[Dict[str, Any]],
+        use_cache: bool,
+        timeout: float,
+    ) -> GenResult:
+        cfg = gen_config or DEFAULT_GEN_CONFIG
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            hit = cache.lookup(prompt, models, cfg)
+            if hit:
+                return GenResult(text=hit[1], model=hit[0], cached=True)
 
-        last_err: Optional[str] = None
-        import google.generativeai as genai
+        call = _RoutedCall(self, models, _estimate_tokens(prompt, cfg))
+        async for model_name in call.aattempts():
+            try:
+                async with _async_semaphore():
+                    resp = await asyncio.wait_for(
+                        _async_service_client(self.api_key).generate_content(_content_request(model_name, prompt, cfg)),
+                        timeout=timeout,
+                    )
+                text = call.done(model_name, _response_text(resp), resp)
+            except asyncio.TimeoutError:
+                call.fail(model_name, asyncio.TimeoutError(f"Quá thời gian chờ ({timeout:.0f}s)."))
+                continue
+            except Exception as e:
+                call.fail(model_name, e)
+                continue
+            if cache is not None:
+                cache.put(prompt, model_name, cfg, text)
+            return GenResult(text=text, model=model_name)
+        return call.error()
 
-        for model_name in models:
-            for attempt in range(2):
+    async def agenerate(
+        self,
+        prompt: str,
+        gen_config: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        timeout: float = REQUEST_TIMEOUT_SECONDS,
+    ) -> GenResult:
+        """
+        Bản asyncio của generate: giới hạn đồng thời bằng semaphore dùng chung,
+        backoff bằng asyncio.sleep, timeout cho từng request; huỷ task sẽ huỷ luôn request.
+        """
+        prompt, models, err = self._prepare(prompt)
+        if err:
+            return GenResult(error=err)
+        return await self._agenerate_prepared(prompt, models, gen_config, use_cache, timeout)
+
+    async def agenerate_many(
+        self,
+        prompts: List[str],
+        gen_config: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        timeout: float = REQUEST_TIMEOUT_SECONDS,
+    ) -> List[GenResult]:
+        """Chạy nhiều agenerate cùng lúc trên 1 event loop, kết quả giữ thứ tự đầu vào."""
+        return list(
+            await asyncio.gather(
+                *(self.agenerate(p, gen_config=gen_config, use_cache=use_cache, timeout=timeout) for p in prompts)
+            )
+        )
+
+    def peek_cache(self, prompt: str, gen_config: Optional[Dict[str, Any]] = None) -> Optional[GenResult]:
+        """
+        Phản hồi đã có sẵn trong cache (không tính hit/miss); chưa có thì None.
+        Không gọi mạng (kể cả list_models): chưa có danh sách model trong cache thì None => dùng được lúc render.
+        """
+        models = _MODEL_CATALOG.cached(self.api_key) if self.api_key else None
+        prompt = fit_to_budget((prompt or "").strip(), MAX_PROMPT_TOKENS)
+        if not models or not prompt:
+            return None
+        hit = get_response_cache().lookup(prompt, models, gen_config or DEFAULT_GEN_CONFIG, count=False)
+        return GenResult(text=hit[1], model=hit[0], cached=True) if hit else None
+
+    def generate(
+        self,
+        prompt: str,
+        gen_config: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+    ) -> GenResult:
+        prompt, models, err = self._prepare(prompt)
+        if err:
+            return GenResult(error=err)
+        return self._generate_prepared(prompt, models, gen_config, use_cache)
+
+    def generate_stream(
+        self,
+        prompt: str,
+        gen_config: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+    ) -> GenStream:
+        """Như generate nhưng trả từng đoạn ngay khi model sinh ra (giảm thời gian chờ chữ đầu tiên)."""
+        stream = GenStream()
+        stream._chunks = self._stream_chunks(stream, prompt, gen_config, use_cache)
+        return stream
+
+    def _stream_chunks(
+        self,
+        stream: GenStream,
+        prompt: str,
+        gen_config: Optional[Dict[str, Any]],
+        use_cache: bool,
+    ) -> Iterator[str]:
+        prompt, models, err = self._prepare(prompt)
+        if err:
+            stream.result = GenResult(error=err)
+            return
+
+        cfg = gen_config or DEFAULT_GEN_CONFIG
+        cache = get_response_cache() if use_cache else None
+        if cache is not None:
+            hit = cache.lookup(prompt, models, cfg)
+            if hit:
+                stream.result = GenResult(text=hit[1], model=hit[0], cached=True)
+                yield hit[1]
+                return
+
+        call = _RoutedCall(self, models, _estimate_tokens(prompt, cfg))
+        for model_name in call.attempts():
+            parts: List[str] = []
+            try:
+                last_chunk = None
+                for chunk in _service_client(self.api_key).stream_generate_content(
+                    _content_request(model_name, prompt, cfg), timeout=REQUEST_TIMEOUT_SECONDS
+                ):
+                    last_chunk = chunk
+                    piece = _response_text(chunk)
+                    if piece:
+                        parts.append(piece)
+                        yield piece
+                text = call.done(model_name, "".join(parts), last_chunk)
+            except Exception as e:
+                call.fail(model_name, e)
+                if parts:
+                    # Đã hiển thị một phần => không chuyển model nữa (tránh trộn 2 câu trả lời)
+                    stream.result = GenResult(
+                        text="".join(parts), model=model_name, error=f"Luồng sinh bị ngắt: {call.last_err}"
+                    )
+                    return
+                continue
+            if cache is not None:
+                cache.put(prompt, model_name, cfg, text)
+            stream.result = GenResult(text=text, model=model_name)
+            return
+        stream.result = call.error()
+
+    def generate_many(
+        self,
+        prompts: List[str],
+        gen_config: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        max_workers: int = MAX_BATCH_WORKERS,
+    ) -> List[GenResult]:
+        """
+        Gọi song song nhiều prompt (giới hạn số luồng), kết quả giữ đúng thứ tự đầu vào.
+        Thời gian ≈ lời gọi chậm nhất thay vì tổng các lời gọi.
+        """
+        if not prompts:
+            return []
+        prepared = [self._prepare(p) for p in prompts]
+        results: List[GenResult] = [GenResult(error=err) if err else GenResult() for _, _, err in prepared]
+        todo = [i for i, (_, _, err) in enumerate(prepared) if not err]
+        if not todo:
+            return results
+
+        workers = max(1, min(int(max_workers), len(todo)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini") as pool:
+            futures = {
+                pool.submit(self._generate_prepared, prepared[i][0], prepared[i][1], gen_config, use_cache): i
+                for i in todo
+            }
+            for fut in as_completed(futures):
+                i = futures[fut]
                 try:
-                    model = genai.GenerativeModel(model_name)
-                    resp = model.generate_content(prompt, generation_config=(gen_config or DEFAULT_GEN_CONFIG))
-                    text = getattr(resp, "text", None) or ""
-                    if not text.strip():
-                        raise RuntimeError("Model trả về rỗng.")
-                    return GenResult(text=text, model=model_name)
+                    results[i] = fut.result()
                 except Exception as e:
-                    last_err = str(e)
-                    low = last_err.lower()
-                    if any(k in low for k in ["429", "rate", "resource_exhausted", "temporarily", "unavailable"]):
-                        _backoff(attempt)
-                        continue
-                    break
-
-        return GenResult(error=f"Hết model khả dụng. Lỗi cuối: {last_err}")
+                    results[i] = GenResult(error=str(e))
+        return results
+
+    def rate_limiter(self) -> RateLimiter:
+        return _rate_limiter_for(self.api_key)
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        return get_response_cache().stats()
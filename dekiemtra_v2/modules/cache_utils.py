@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+CACHE_DIR_ENV = "DEKIEMTRA_CACHE_DIR"
+
+
+def cache_dir() -> Path:
+    """Thư mục cache dùng chung giữa các session/process (đổi bằng biến môi trường DEKIEMTRA_CACHE_DIR)."""
+    p = Path(os.environ.get(CACHE_DIR_ENV) or (Path(tempfile.gettempdir()) / "dekiemtra_v2_cache"))
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
+def content_hash(data: bytes) -> str:
+    """Hash nhanh của nội dung file (blake2b) để làm khoá cache."""
+    return hashlib.blake2b(data or b"", digest_size=20).hexdigest()
+
+
+class LRUCache(Generic[V]):
+    """Cache trong bộ nhớ, giới hạn số mục, an toàn đa luồng (dùng chung mọi session của process)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[Hashable, V]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
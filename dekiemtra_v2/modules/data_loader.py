@@ -1,30 +1,74 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import bisect
+import csv
 import io
+import os
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import tempfile
+import threading
+import unicodedata
+from collections import deque
+from pathlib import Path
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
 
 import pandas as pd
 from docx import Document
 
+from modules.cache_utils import LRUCache, cache_dir, content_hash
+from modules.docx_reader import read_docx_table_rows
+from modules.matrix_parser import MatrixCell, parse_matrix_rows
+from modules.process_pool import MAX_PROCESS_WORKERS, discard_process_pool, get_process_pool
+from modules.prompt_budget import compact_table_text, estimate_tokens, fit_to_budget
+
 try:
     import pypdf  # type: ignore
     PDF_ENABLED = True
 except Exception:
     PDF_ENABLED = False
 
-MAX_FILE_TEXT_CHARS = 60_000
+try:
+    import pyarrow  # type: ignore  # noqa: F401
+    PARQUET_ENABLED = True
+except Exception:
+    PARQUET_ENABLED = False
+
+MAX_FILE_TEXT_TOKENS = 6_000  # để text ma trận + yêu cầu vừa MAX_PROMPT_TOKENS của ai_client
 MAX_XLSX_ROWS_FOR_PROMPT = 200
+EXTRACT_CACHE_ENTRIES = 64
+CURRICULUM_CACHE_VERSION = 2
+CURRICULUM_REGISTRY_ENTRIES = 16
+MAX_PDF_PAGES = 500
+PDF_PAGE_CAP_NOTE = "[Lưu ý: file PDF có {total} trang, chỉ đọc {n} trang đầu.]"
+PDF_PARALLEL_MIN_PAGES = 40
+PDF_PAGES_PER_JOB = 10
+PDF_MAX_INFLIGHT = MAX_PROCESS_WORKERS  # số khoảng trang nộp trước cho pool mỗi file
 
+# (đường dẫn file tạm, reader) của file PDF gần nhất trong từng process con
+_PDF_WORKER_READER: Optional[Tuple[str, Any]] = None
 
-def _truncate(s: str, max_chars: int) -> str:
-    s = s or ""
-    return s if len(s) <= max_chars else s[:max_chars] + "\n\n[...ĐÃ CẮT BỚT...]"
+# Kết quả trích text theo (hash nội dung, đuôi file), dùng chung mọi session
+_EXTRACT_CACHE: LRUCache[Tuple[Optional[str], Optional[str]]] = LRUCache(EXTRACT_CACHE_ENTRIES)
+_CELLS_CACHE: LRUCache[List[MatrixCell]] = LRUCache(EXTRACT_CACHE_ENTRIES)
 
 
 def extract_text_from_upload(filename: str, data: bytes) -> Tuple[Optional[str], Optional[str]]:
-    """Đọc file ma trận (xlsx/docx/pdf) => text để đưa vào prompt (Tab 1)."""
+    """Đọc file ma trận (xlsx/docx/pdf) => text để đưa vào prompt (Tab 1). Có cache theo hash nội dung."""
+    key = (content_hash(data), os.path.splitext((filename or "").lower())[1])
+    hit = _EXTRACT_CACHE.get(key)
+    if hit is not None:
+        return hit
+    result = _extract_text(filename, data)
+    _EXTRACT_CACHE.put(key, result)
+    return result
+
+
+def _extract_text(filename: str, data: bytes) -> Tuple[Optional[str], Optional[str]]:
     try:
         name = (filename or "").lower()
         bio = io.BytesIO(data)
@@ -32,106 +76,256 @@ def extract_text_from_upload(filename: str, data: bytes) -> Tuple[Optional[str],
         if name.endswith(".xlsx"):
             df = pd.read_excel(bio)
             df2 = df.head(MAX_XLSX_ROWS_FOR_PROMPT).copy()
-            df2 = df2.fillna("").astype(str)
-            text = df2.to_csv(index=False)
-            return _truncate(text, MAX_FILE_TEXT_CHARS), None
+            df2 = df2.fillna("").astype(str).replace(r"\s*\n\s*", " ", regex=True)
+            df2.columns = ["" if str(c).startswith("Unnamed:") else str(c) for c in df2.columns]
+            text = compact_table_text(df2.to_csv(index=False), sep=",")
+            return fit_to_budget(text, MAX_FILE_TEXT_TOKENS), None
 
         if name.endswith(".docx"):
-            doc = Document(bio)
-            parts: List[str] = []
-            for table in doc.tables:
-                for row in table.rows:
-                    parts.append(" | ".join((c.text or "").strip() for c in row.cells))
-            if not parts:
-                parts = [p.text for p in doc.paragraphs if (p.text or "").strip()]
-            text = "\n".join(parts)
-            return _truncate(text, MAX_FILE_TEXT_CHARS), None
+            parts: List[str] = [" | ".join(c.replace("\n", " ") for c in r) for r in read_docx_table_rows(data)]
+            if parts:
+                text = compact_table_text("\n".join(parts), sep=" | ")
+            else:
+                doc = Document(bio)
+                text = compact_table_text("\n".join(p.text for p in doc.paragraphs if (p.text or "").strip()))
+            return fit_to_budget(text, MAX_FILE_TEXT_TOKENS), None
 
         if name.endswith(".pdf"):
             if not PDF_ENABLED:
                 return None, "Thiếu thư viện pypdf. Cài: pip install pypdf"
-            reader = pypdf.PdfReader(bio)
-            pages: List[str] = []
-            for page in reader.pages:
-                t = page.extract_text() or ""
-                if t.strip():
-                    pages.append(t)
-            text = "\n".join(pages).strip()
+            text, capped_pages = _extract_pdf_text(data, MAX_FILE_TEXT_TOKENS)
             if not text:
                 return None, "Không trích xuất được text PDF (có thể là file scan ảnh)."
-            return _truncate(text, MAX_FILE_TEXT_CHARS), None
+            text = fit_to_budget(compact_table_text(text), MAX_FILE_TEXT_TOKENS)
+            if capped_pages:
+                # Ghi ở đầu để người dùng thấy ngay trong khung xem trước (và AI cũng biết)
+                text = PDF_PAGE_CAP_NOTE.format(total=capped_pages, n=MAX_PDF_PAGES) + "\n" + text
+            return text, None
 
         return None, "Định dạng không hỗ trợ (chỉ xlsx/docx/pdf)."
     except Exception as e:
         return None, f"Lỗi đọc file: {e}"
 
 
+def extract_table_rows(filename: str, data: bytes) -> Tuple[Optional[List[List[str]]], Optional[str]]:
+    """Các dòng bảng (mỗi ô là text) của file ma trận xlsx/docx để tách ô ma trận (Tab 1); PDF không hỗ trợ."""
+    try:
+        name = (filename or "").lower()
+        if name.endswith(".xlsx"):
+            df = pd.read_excel(io.BytesIO(data), header=None, dtype=str).fillna("")
+            return df.to_numpy().tolist(), None
+        if name.endswith(".docx"):
+            return read_docx_table_rows(data), None
+        return None, "Chỉ tách được ô ma trận từ bảng xlsx/docx."
+    except Exception as e:
+        return None, f"Lỗi đọc bảng: {e}"
+
+
+def extract_matrix_cells(filename: str, data: bytes) -> List[MatrixCell]:
+    """Các ô ma trận tách từ bảng xlsx/docx (Tab 1); có cache theo hash nội dung như extract_text_from_upload."""
+    key = (content_hash(data), os.path.splitext((filename or "").lower())[1])
+    hit = _CELLS_CACHE.get(key)
+    if hit is not None:
+        return hit
+    rows, _ = extract_table_rows(filename, data)
+    cells = parse_matrix_rows(rows or [])
+    _CELLS_CACHE.put(key, cells)
+    return cells
+
+
+def _pdf_worker_pages(path: str, start: int, stop: int) -> List[str]:
+    """Chạy trong process con của pool dùng chung: trích text các trang [start, stop) của file PDF tạm."""
+    global _PDF_WORKER_READER
+    if _PDF_WORKER_READER is None or _PDF_WORKER_READER[0] != path:
+        _PDF_WORKER_READER = (path, pypdf.PdfReader(path))
+    reader = _PDF_WORKER_READER[1]
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pdf_pages(data: bytes, max_pages: int = MAX_PDF_PAGES, reader: Any = None) -> Iterator[str]:
+    """
+    Trả text từng trang (tối đa max_pages) theo thứ tự, dừng được giữa chừng (generator).
+    File nhiều trang: ghi ra file tạm rồi chia khoảng trang cho process pool dùng chung, chỉ nộp trước
+    vài khoảng nên khi người gọi dừng sớm thì các khoảng còn lại không bị đọc.
+    """
+    reader = reader if reader is not None else pypdf.PdfReader(io.BytesIO(data))
+    n = min(len(reader.pages), max_pages)
+    inflight = min(PDF_MAX_INFLIGHT, n // PDF_PAGES_PER_JOB)
+    pool = get_process_pool() if n >= PDF_PARALLEL_MIN_PAGES and inflight >= 2 else None
+    done = 0
+    if pool is not None:
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=cache_dir())
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        ranges = iter([(s, min(s + PDF_PAGES_PER_JOB, n)) for s in range(0, n, PDF_PAGES_PER_JOB)])
+        pending: Deque[Future] = deque()
+        try:
+            pending.extend(pool.submit(_pdf_worker_pages, path, *r) for r in islice(ranges, inflight))
+            while pending:
+                pages = pending.popleft().result()
+                nxt = next(ranges, None)
+                if nxt is not None:
+                    pending.append(pool.submit(_pdf_worker_pages, path, *nxt))
+                for t in pages:
+                    done += 1
+                    yield t
+        except BrokenProcessPool:
+            discard_process_pool(pool)  # process con chết: đọc tiếp phần còn lại ngay trong process này
+        finally:
+            for fut in pending:
+                fut.cancel()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    for i in range(done, n):
+        yield reader.pages[i].extract_text() or ""
+
+
+def _extract_pdf_text(data: bytes, max_tokens: int) -> Tuple[str, int]:
+    """
+    Gom text các trang tới khi vượt ngân sách token thì dừng (không đọc hết file).
+    Trả (text, tổng số trang nếu đã đọc tới giới hạn MAX_PDF_PAGES mà file còn trang, ngược lại 0).
+    """
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    parts: List[str] = []
+    total = 0
+    capped = 0
+    pages = iter_pdf_pages(data, reader=reader)
+    try:
+        for t in pages:
+            if not t.strip():
+                continue
+            parts.append(t)
+            total += estimate_tokens(t)
+            if total > max_tokens:
+                break
+        else:
+            capped = len(reader.pages) if len(reader.pages) > MAX_PDF_PAGES else 0
+    finally:
+        pages.close()
+    return "\n".join(parts).strip(), capped
+
+
 def _normalize_header(s: str) -> str:
     s = (s or "").strip().lower()
     s = re.sub(r"\s+", " ", s)
     return s
 
 
+_NESTED_LEVELS = ["lop", "mon", "hoc_ky", "chu_de"]
+
+
 def build_nested_curriculum(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Lớp → Môn → Học kì → Chủ đề → [Bài], giữ thứ tự xuất hiện đầu tiên và bỏ bài trùng.
+    Dùng groupby/drop_duplicates thay cho iterrows + kiểm tra `in list` (O(n²) theo số bài).
+    """
     nested: Dict[str, Any] = {}
     if df is None or df.empty:
         return nested
 
-    for _, r in df.iterrows():
-        lop = (r.get("lop") or "").strip() or "Khác"
-        mon = (r.get("mon") or "").strip() or "Khác"
-        hk = (r.get("hoc_ky") or "").strip() or "Khác"
-        cd = (r.get("chu_de") or "").strip() or "Khác"
-        bai = (r.get("bai") or "").strip() or ""
-
-        nested.setdefault(lop, {}).setdefault(mon, {}).setdefault(hk, {}).setdefault(cd, [])
-        if bai and bai not in nested[lop][mon][hk][cd]:
-            nested[lop][mon][hk][cd].append(bai)
+    flat = pd.DataFrame(
+        {
+            c: (df[c].fillna("").astype(str).str.strip() if c in df.columns else "")
+            for c in _NESTED_LEVELS + ["bai"]
+        },
+        index=df.index,
+    )
+    flat[_NESTED_LEVELS] = flat[_NESTED_LEVELS].replace("", "Khác")
+
+    paths = flat[_NESTED_LEVELS].drop_duplicates()
+    with_lesson = flat[flat["bai"] != ""].drop_duplicates()
+    lessons = with_lesson.groupby(_NESTED_LEVELS, sort=False)["bai"].agg(list).to_dict()
+
+    for lop, mon, hk, cd in paths.itertuples(index=False, name=None):
+        nested.setdefault(lop, {}).setdefault(mon, {}).setdefault(hk, {})[cd] = lessons.get((lop, mon, hk, cd), [])
     return nested
 
 
-def load_curriculum_from_docx(docx_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str, Any], str]:
-    """
-    Đọc DOCX dạng bảng (Học kì/Lớp/Môn/Chủ đề/Bài...) và chuẩn hoá:
-    - df: bảng phẳng
-    - nested: dict để dropdown
-    - warn: cảnh báo thiếu cột (Tiết, YCCĐ, Bộ sách...)
-    """
-    doc = Document(io.BytesIO(docx_bytes))
+def fold_text(s: str) -> str:
+    """Bỏ dấu tiếng Việt + chữ thường để tìm kiếm không phân biệt dấu ("Hỗn hợp" ~ "hon hop")."""
+    s = unicodedata.normalize("NFD", (s or "").replace("đ", "d").replace("Đ", "D"))
+    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    return re.sub(r"\s+", " ", s.lower()).strip()
 
-    rows: List[List[str]] = []
-    for table in doc.tables:
-        for row in table.rows:
-            rows.append([(cell.text or "").strip() for cell in row.cells])
 
-    if not rows:
-        lines = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
-        df = pd.DataFrame({"raw": lines})
-        return df, {}, "DOCX không có bảng. Khuyến nghị dùng file có bảng hoặc dùng Excel làm nguồn chuẩn."
+LessonPath = Tuple[str, str, str, str, str]  # (lớp, môn, học kì, chủ đề, bài)
 
-    header_idx = None
+
+class CurriculumIndex:
+    """
+    Chỉ mục dựng 1 lần khi nạp CT (dùng cho dropdown Tab 2):
+    - options(*path): danh sách lựa chọn đã sắp xếp sẵn cho từng cấp (bài giữ thứ tự trong CT)
+    - paths_for_lesson(bài): tra ngược bài → đường dẫn lớp/môn/học kì/chủ đề
+    - search(query): tìm theo tiền tố từ, không phân biệt dấu, trên tên bài + chủ đề
+    """
+
+    def __init__(self, nested: Dict[str, Any]):
+        self.nested = nested or {}
+        self._options: Dict[Tuple[str, ...], List[str]] = {}
+        self._lesson_paths: Dict[str, List[LessonPath]] = {}
+        self.entries: List[LessonPath] = []
+        postings: Dict[str, List[int]] = {}
+
+        self._options[()] = sorted(self.nested.keys())
+        for lop, by_mon in self.nested.items():
+            self._options[(lop,)] = sorted(by_mon.keys())
+            for mon, by_hk in by_mon.items():
+                self._options[(lop, mon)] = sorted(by_hk.keys())
+                for hk, by_cd in by_hk.items():
+                    self._options[(lop, mon, hk)] = sorted(by_cd.keys())
+                    for cd, lessons in by_cd.items():
+                        self._options[(lop, mon, hk, cd)] = list(lessons)
+                        for bai in (lessons or [""]):
+                            path = (lop, mon, hk, cd, bai)
+                            eid = len(self.entries)
+                            self.entries.append(path)
+                            if bai:
+                                self._lesson_paths.setdefault(bai, []).append(path)
+                            for tok in set(fold_text(f"{cd} {bai}").split()):
+                                postings.setdefault(tok, []).append(eid)
+
+        self._postings = postings
+        self._tokens = sorted(postings)
+
+    def options(self, *path: str) -> List[str]:
+        return self._options.get(tuple(path), [])
+
+    def paths_for_lesson(self, lesson: str) -> List[LessonPath]:
+        return list(self._lesson_paths.get(lesson, []))
+
+    def _prefix_ids(self, prefix: str) -> set:
+        ids: set = set()
+        i = bisect.bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            ids.update(self._postings[self._tokens[i]])
+            i += 1
+        return ids
+
+    def search(self, query: str, limit: int = 20) -> List[LessonPath]:
+        terms = fold_text(query).split()
+        if not terms:
+            return []
+        ids: Optional[set] = None
+        for t in sorted(terms, key=len, reverse=True):  # từ dài thường ít kết quả hơn => giao nhanh hơn
+            found = self._prefix_ids(t)
+            ids = found if ids is None else (ids & found)
+            if not ids:
+                return []
+        return [self.entries[i] for i in sorted(ids)[:limit]]
+
+
+def _find_header_idx(rows: List[List[str]]) -> int:
     for i, r in enumerate(rows[:30]):
         joined = " ".join(_normalize_header(x) for x in r)
         if "lớp" in joined and "môn" in joined:
-            header_idx = i
-            break
-    if header_idx is None:
-        header_idx = 0
+            return i
+    return 0
 
-    header = rows[header_idx]
-    cols = [_normalize_header(c) for c in header]
-
-    data_rows: List[List[str]] = []
-    for r in rows[header_idx + 1 :]:
-        if len(r) < 3:
-            continue
-        jr = " ".join(_normalize_header(x) for x in r)
-        if "lớp" in jr and "môn" in jr and "chủ đề" in jr:
-            continue
-        data_rows.append(r + [""] * (len(cols) - len(r)))
-
-    df = pd.DataFrame(data_rows, columns=[c if c else f"col_{i}" for i, c in enumerate(cols)])
 
+def _map_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Đổi tên cột tiếng Việt (đã chuẩn hoá) sang tên chuẩn; thêm cột bắt buộc còn thiếu."""
     col_map = {}
     for c in df.columns:
         if "học kì" in c or "hoc ki" in c:
@@ -157,9 +351,11 @@ def load_curriculum_from_docx(docx_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str
         if must not in df.columns:
             df[must] = ""
 
-    for c in df.columns:
-        df[c] = df[c].astype(str).str.strip()
+    # Ô đã strip khi đọc; chỉ cần ép kiểu 1 lần cho cả bảng (kể cả cột trùng tên)
+    return df.astype(str)
 
+
+def _curriculum_result(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any], str]:
     missing = [c for c in ["bo_sach", "tiet", "yccd"] if c not in df.columns]
     warn = ""
     if missing:
@@ -169,6 +365,109 @@ def load_curriculum_from_docx(docx_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str
     return df, nested, warn
 
 
+def load_curriculum_from_docx(docx_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str, Any], str]:
+    """
+    Đọc DOCX dạng bảng (Học kì/Lớp/Môn/Chủ đề/Bài...) và chuẩn hoá:
+    - df: bảng phẳng
+    - nested: dict để dropdown
+    - warn: cảnh báo thiếu cột (Tiết, YCCĐ, Bộ sách...)
+    """
+    rows = read_docx_table_rows(docx_bytes)
+
+    if not rows:
+        doc = Document(io.BytesIO(docx_bytes))
+        lines = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
+        df = pd.DataFrame({"raw": lines})
+        return df, {}, "DOCX không có bảng. Khuyến nghị dùng file có bảng hoặc dùng Excel làm nguồn chuẩn."
+
+    header_idx = _find_header_idx(rows)
+    header = rows[header_idx]
+    cols = [_normalize_header(c) for c in header]
+
+    data_rows: List[List[str]] = []
+    for r in rows[header_idx + 1 :]:
+        if len(r) < 3:
+            continue
+        # Chỉ chuẩn hoá (regex) khi dòng có vẻ là header lặp lại
+        if "lớp" in " ".join(r).lower():
+            jr = " ".join(_normalize_header(x) for x in r)
+            if "lớp" in jr and "môn" in jr and "chủ đề" in jr:
+                continue
+        data_rows.append(r + [""] * (len(cols) - len(r)))
+
+    df = pd.DataFrame(data_rows, columns=[c if c else f"col_{i}" for i, c in enumerate(cols)])
+    return _curriculum_result(_map_columns(df))
+
+
+def _csv_table(data: bytes) -> pd.DataFrame:
+    """CSV thành bảng chữ; dòng ngắn (vd dòng tiêu đề 1 ô phía trên header) được đệm đủ số cột dòng dài nhất."""
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"), newline="")))
+    width = max((len(r) for r in rows), default=0)
+    return pd.DataFrame([r + [""] * (width - len(r)) for r in rows], dtype=str)
+
+
+def load_curriculum_from_table(filename: str, data: bytes) -> Tuple[pd.DataFrame, Dict[str, Any], str]:
+    """Đọc kế hoạch/CT từ Excel (.xlsx) hoặc CSV, cùng quy tắc ánh xạ cột như DOCX."""
+    try:
+        if (filename or "").lower().endswith(".csv"):
+            raw = _csv_table(data)
+        else:
+            raw = pd.read_excel(io.BytesIO(data), header=None, dtype=str)
+    except Exception as e:
+        return pd.DataFrame(), {}, f"Lỗi đọc file: {e}"
+    raw = raw.fillna("").apply(lambda col: col.str.strip())
+    if raw.empty:
+        return pd.DataFrame(), {}, "File không có dữ liệu."
+
+    header_idx = _find_header_idx(raw.head(30).values.tolist())
+    cols = [_normalize_header(c) for c in raw.iloc[header_idx]]
+    df = raw.iloc[header_idx + 1 :].reset_index(drop=True)
+    df.columns = [c if c else f"col_{i}" for i, c in enumerate(cols)]
+    df = df[(df != "").any(axis=1)]
+    df = _map_columns(df)
+
+    # Bỏ các dòng header lặp lại (bảng dán nối nhiều trang)
+    repeated = (df["lop"].str.lower().str.strip() == "lớp") & (df["mon"].str.lower().str.strip() == "môn")
+    df = df[~repeated].reset_index(drop=True)
+    return _curriculum_result(df)
+
+
+def _curriculum_cache_path(key: str) -> Path:
+    return cache_dir() / "curriculum" / f"{key}.parquet"
+
+
+def load_curriculum(filename: str, data: bytes) -> Tuple[pd.DataFrame, Dict[str, Any], str]:
+    """
+    Nạp CT từ DOCX/XLSX/CSV, có cache dạng cột (Parquet) trên đĩa theo hash nội dung file:
+    file đã gặp thì chỉ đọc lại bảng chuẩn hoá (vài ms), không phải phân tích lại.
+    """
+    name = (filename or "").lower()
+    key = f"v{CURRICULUM_CACHE_VERSION}-{content_hash(data)}"
+    path = _curriculum_cache_path(key)
+    if PARQUET_ENABLED and path.exists():
+        try:
+            return _curriculum_result(pd.read_parquet(path))
+        except Exception:
+            pass
+
+    if name.endswith(".docx"):
+        df, nested, warn = load_curriculum_from_docx(data)
+    elif name.endswith((".xlsx", ".csv")):
+        df, nested, warn = load_curriculum_from_table(filename, data)
+    else:
+        return pd.DataFrame(), {}, "Định dạng không hỗ trợ (chỉ docx/xlsx/csv)."
+
+    if PARQUET_ENABLED and nested:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)  # ghi nguyên tử: process khác không đọc phải file dở
+        except Exception:
+            pass
+    return df, nested, warn
+
+
 def load_sample_curriculum() -> Tuple[pd.DataFrame, Dict[str, Any]]:
     sample = [
         {"hoc_ky": "Học kì I", "lop": "Lớp 5", "mon": "Khoa học", "chu_de": "Chất và sự biến đổi", "bai": "Hỗn hợp và dung dịch", "tiet": "1", "yccd": ""},
@@ -177,3 +476,73 @@ def load_sample_curriculum() -> Tuple[pd.DataFrame, Dict[str, Any]]:
     ]
     df = pd.DataFrame(sample)
     return df, build_nested_curriculum(df)
+
+
+SAMPLE_CURRICULUM_KEY = "sample"
+
+
+@dataclass
+class CurriculumEntry:
+    key: str
+    name: str
+    df: pd.DataFrame
+    nested: Dict[str, Any]
+    index: CurriculumIndex
+    warn: str = ""
+
+
+class CurriculumRegistry:
+    """
+    Kho CT dùng chung cả process, khử trùng theo hash nội dung file:
+    session chỉ giữ khoá (handle); N giáo viên nạp cùng 1 file => 1 bản trong bộ nhớ, phân tích 1 lần.
+    Giữ tối đa CURRICULUM_REGISTRY_ENTRIES bộ CT khác nhau (LRU).
+    """
+
+    def __init__(self, max_entries: int = CURRICULUM_REGISTRY_ENTRIES):
+        self._entries: LRUCache[CurriculumEntry] = LRUCache(max_entries)
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key: Optional[str]) -> Optional[CurriculumEntry]:
+        if not key:
+            return None
+        entry = self._entries.get(key)
+        if entry is None and key == SAMPLE_CURRICULUM_KEY:
+            entry = self.load_sample()
+        return entry
+
+    def _get_or_build(self, key: str, name: str, build) -> CurriculumEntry:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        with self._key_lock(key):  # nhiều session nạp cùng file cùng lúc => chỉ 1 lần phân tích
+            entry = self._entries.get(key)
+            if entry is None:
+                df, nested, warn = build()
+                entry = CurriculumEntry(key=key, name=name, df=df, nested=nested, index=CurriculumIndex(nested), warn=warn)
+                self._entries.put(key, entry)
+        return entry
+
+    def load(self, filename: str, data: bytes) -> CurriculumEntry:
+        return self._get_or_build(content_hash(data), filename, lambda: load_curriculum(filename, data))
+
+    def load_sample(self) -> CurriculumEntry:
+        def _build() -> Tuple[pd.DataFrame, Dict[str, Any], str]:
+            df, nested = load_sample_curriculum()
+            return df, nested, ""
+
+        return self._get_or_build(SAMPLE_CURRICULUM_KEY, "Dữ liệu mẫu", _build)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_REGISTRY = CurriculumRegistry()
+
+
+def get_curriculum_registry() -> CurriculumRegistry:
+    return _REGISTRY
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from modules.question_bank import QuestionBank, get_question_bank
+from modules.question_model import parse_question
+
+# 64 hàm băm chia 16 dải x 4 hàng: cặp có Jaccard ~0.5 trở lên gần như chắc chắn thành ứng viên
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+DUP_THRESHOLD = 0.8
+SHINGLE_WORDS = 3
+
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**32, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**32, size=NUM_PERM, dtype=np.uint64)
+
+_EMPTY_SIG = np.empty(0, dtype=np.uint32)
+_EMPTY_SIG.flags.writeable = False
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_NUMBER_PREFIX_RE = re.compile(r"^\s*câu\s*\d+\s*[:.)]\s*", re.IGNORECASE)
+
+
+def _shingles(text: str) -> np.ndarray:
+    """Các cụm 3 từ liên tiếp của phần in trên đề (bỏ "Câu n:" và dòng đáp án), băm về uint32 (rỗng nếu không có từ)."""
+    body = _NUMBER_PREFIX_RE.sub("", parse_question(text or "").body)
+    words = _WORD_RE.findall(body.lower())
+    k = min(SHINGLE_WORDS, len(words))
+    grams = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)} if words else set()
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+@lru_cache(maxsize=8192)
+def signature(text: str) -> np.ndarray:
+    """
+    Chữ ký MinHash (NUM_PERM số uint32) của câu hỏi; cùng nội dung => cùng chữ ký (có cache).
+    Câu không có chữ nào => chữ ký rỗng, không giống câu nào (kể cả câu rỗng khác).
+    """
+    sh = _shingles(text)
+    if not sh.size:
+        return _EMPTY_SIG
+    # băm nhân-dịch (multiply-shift) trên uint64, tràn số là chủ ý
+    h = (_A[:, None] * sh[None, :] + _B[:, None]) >> np.uint64(32)
+    sig = h.min(axis=1).astype(np.uint32)
+    sig.flags.writeable = False
+    return sig
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Ước lượng Jaccard giữa hai câu = tỉ lệ vị trí chữ ký trùng nhau."""
+    if not sig_a.size or not sig_b.size:
+        return 0.0
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+class DedupIndex:
+    """
+    Chỉ mục LSH trong bộ nhớ (an toàn đa luồng): mỗi dải chữ ký -> danh sách khoá,
+    tra 1 câu chỉ so với các ứng viên chung dải (không quét cả ngân hàng).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: List[Dict[bytes, List[Any]]] = [{} for _ in range(LSH_BANDS)]
+        self._sigs: Dict[Any, np.ndarray] = {}
+        self.last_bank_id = 0
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    def add(self, key: Any, text: str) -> None:
+        sig = signature(text)
+        if not sig.size:
+            return
+        with self._lock:
+            if key in self._sigs:
+                return
+            self._sigs[key] = sig
+            for b in range(LSH_BANDS):
+                band = sig[b * LSH_ROWS:(b + 1) * LSH_ROWS].tobytes()
+                self._buckets[b].setdefault(band, []).append(key)
+
+    def query(self, text: str, threshold: float = DUP_THRESHOLD) -> Optional[Tuple[Any, float]]:
+        """Khoá có độ giống cao nhất (>= threshold) cùng độ giống, hoặc None."""
+        sig = signature(text)
+        if not sig.size:
+            return None
+        with self._lock:
+            cands = set()
+            for b in range(LSH_BANDS):
+                cands.update(self._buckets[b].get(sig[b * LSH_ROWS:(b + 1) * LSH_ROWS].tobytes(), ()))
+            best: Optional[Tuple[Any, float]] = None
+            for key in cands:
+                s = similarity(sig, self._sigs[key])
+                if s >= threshold and (best is None or s > best[1]):
+                    best = (key, s)
+        return best
+
+    def sync(self, bank: QuestionBank) -> None:
+        """Nạp thêm các câu mới trong ngân hàng (kể cả do process khác ghi) kể từ lần nạp trước."""
+        for qid, content in bank.iter_contents(after=self.last_bank_id):
+            self.add(qid, content)
+            self.last_bank_id = qid
+
+
+_BANK_INDEX: Optional[DedupIndex] = None
+_BANK_INDEX_LOCK = threading.Lock()
+
+
+def get_bank_dedup_index(bank: Optional[QuestionBank] = None) -> DedupIndex:
+    """Chỉ mục trùng của ngân hàng câu hỏi, dựng lười lần đầu rồi chỉ nạp phần mới mỗi lần gọi."""
+    global _BANK_INDEX
+    with _BANK_INDEX_LOCK:
+        if _BANK_INDEX is None:
+            _BANK_INDEX = DedupIndex()
+        idx = _BANK_INDEX
+        idx.sync(bank or get_question_bank())
+    return idx
+
+
+@dataclass
+class DuplicateHit:
+    source: str          # "exam" | "bank"
+    ref: Any             # vị trí (1-based) trong đề hoặc id trong ngân hàng
+    similarity: float
+
+    def describe(self) -> str:
+        where = f"câu {self.ref} trong đề" if self.source == "exam" else f"câu #{self.ref} trong ngân hàng"
+        return f"gần trùng {where} (giống ~{self.similarity:.0%})"
+
+
+def find_in_exam(text: str, exam_list: Iterable[Dict[str, Any]], threshold: float = DUP_THRESHOLD) -> Optional[DuplicateHit]:
+    """So câu với các câu đã có trong đề (đề nhỏ => so trực tiếp ma trận chữ ký)."""
+    sig = signature(text)
+    if not sig.size:
+        return None
+    rows = [(i, s) for i, s in enumerate(signature(q.get("content", "")) for q in exam_list) if s.size]
+    if not rows:
+        return None
+    sims = np.count_nonzero(np.stack([s for _, s in rows]) == sig, axis=1) / NUM_PERM
+    j = int(sims.argmax())
+    return DuplicateHit("exam", rows[j][0] + 1, float(sims[j])) if sims[j] >= threshold else None
+
+
+def find_duplicate(
+    text: str,
+    exam_list: Iterable[Dict[str, Any]],
+    check_bank: bool = True,
+    threshold: float = DUP_THRESHOLD,
+) -> Optional[DuplicateHit]:
+    """Ưu tiên báo trùng trong đề; sau đó mới tra ngân hàng câu hỏi."""
+    hit = find_in_exam(text, exam_list, threshold)
+    if hit is not None or not check_bank:
+        return hit
+    found = get_bank_dedup_index().query(text, threshold)
+    return DuplicateHit("bank", found[0], found[1]) if found else None
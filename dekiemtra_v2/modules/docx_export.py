@@ -1,14 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import hashlib
 import io
+import json
 import re
+import time
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from typing import Any, Dict, List, Tuple
 
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from modules.cache_utils import LRUCache
+from modules.process_pool import discard_process_pool, get_process_pool
+from modules.question_model import get_parsed
+from modules.variants import make_variant
+
+EXPORT_CACHE_ENTRIES = 32
+BULK_EXPORT_MIN_PARALLEL_FILES = 3  # ít file hơn thì dựng ngay trong process (đỡ tốn chuyển dữ liệu sang process con)
+
+# File Word đã dựng theo dấu vân tay nội dung => rerun không phải dựng lại
+_EXPORT_CACHE: LRUCache[bytes] = LRUCache(EXPORT_CACHE_ENTRIES)
+
 
 def _set_font(doc: Document) -> None:
     style = doc.styles["Normal"]
@@ -16,16 +34,6 @@ def _set_font(doc: Document) -> None:
     style.font.size = Pt(13)
 
 
-def _split_answer(content: str) -> Tuple[str, str]:
-    content = (content or "").strip()
-    m = re.search(r"(?im)^\s*đáp\s*án\s*:\s*(.+)$", content)
-    if not m:
-        return content, ""
-    ans = m.group(1).strip()
-    stem = re.sub(r"(?im)^\s*đáp\s*án\s*:\s*.+$", "", content).strip()
-    return stem, ans
-
-
 def create_exam_docx(
     school_name: str,
     subject: str,
@@ -59,10 +67,10 @@ def create_exam_docx(
 
     answers: List[str] = []
     for idx, q in enumerate(exam_list, start=1):
-        stem, ans = _split_answer(q.get("content", ""))
+        parsed = get_parsed(q)
+        stem, ans = parsed.body, parsed.answer
 
-        already_numbered = bool(re.match(r"(?is)^\s*câu\s+\d+", stem.strip()))
-        if not already_numbered:
+        if not parsed.numbered:
             p = doc.add_paragraph()
             run = p.add_run(f"Câu {idx} ({q.get('points','')} điểm): ")
             run.bold = True
@@ -119,3 +127,142 @@ def create_matrix_docx(subject: str, grade: str, exam_list: List[Dict[str, Any]]
     doc.save(buf)
     buf.seek(0)
     return buf
+
+
+def _fingerprint(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def exam_docx_bytes(
+    school_name: str,
+    subject: str,
+    grade: str,
+    exam_term: str,
+    exam_list: List[Dict[str, Any]],
+    include_answers: bool,
+) -> bytes:
+    """Như create_exam_docx nhưng cache theo (nội dung đề, trường, kỳ, có đáp án)."""
+    key = (
+        "exam",
+        _fingerprint(
+            school_name, subject, grade, exam_term, include_answers,
+            [(q.get("content", ""), q.get("points", "")) for q in exam_list],
+        ),
+    )
+    data = _EXPORT_CACHE.get(key)
+    if data is None:
+        data = create_exam_docx(school_name, subject, grade, exam_term, exam_list, include_answers).getvalue()
+        _EXPORT_CACHE.put(key, data)
+    return data
+
+
+def matrix_docx_bytes(subject: str, grade: str, exam_list: List[Dict[str, Any]]) -> bytes:
+    """Như create_matrix_docx nhưng cache theo các cột có trong bảng ma trận."""
+    key = (
+        "matrix",
+        _fingerprint(
+            subject, grade,
+            [[q.get(k, "") for k in ("topic", "lesson", "yccd", "type", "level", "points")] for q in exam_list],
+        ),
+    )
+    data = _EXPORT_CACHE.get(key)
+    if data is None:
+        data = create_matrix_docx(subject, grade, exam_list).getvalue()
+        _EXPORT_CACHE.put(key, data)
+    return data
+
+
+@dataclass
+class VariantSpec:
+    code: str             # mã đề: A/B/C/D...
+    class_name: str = ""  # lớp in trên đề (5A, 5B...)
+    seed: int = 0         # cùng seed => cùng đề (thứ tự câu + thứ tự lựa chọn)
+    shuffle_choices: bool = True
+
+
+def _safe_name(s: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", (s or "").strip(), flags=re.UNICODE).strip("_")
+
+
+def _build_export_job(job: Tuple[str, str, Dict[str, Any]]) -> Tuple[str, bytes, float]:
+    """Chạy trong process con: dựng 1 file Word, trả (tên file, bytes, số giây)."""
+    filename, kind, kw = job
+    t0 = time.perf_counter()
+    if kind == "matrix":
+        buf = create_matrix_docx(**kw)
+    else:
+        buf = create_exam_docx(**kw)
+    return filename, buf.getvalue(), time.perf_counter() - t0
+
+
+def bulk_export_jobs(
+    school_name: str,
+    subject: str,
+    grade: str,
+    exam_term: str,
+    exam_list: List[Dict[str, Any]],
+    variants: List[VariantSpec],
+    with_answers: bool = True,
+    include_matrix: bool = True,
+) -> List[Tuple[str, str, Dict[str, Any]]]:
+    jobs: List[Tuple[str, str, Dict[str, Any]]] = []
+    base = _safe_name(f"{subject}_{grade}")
+    for v in variants:
+        items = make_variant(exam_list, v.seed, shuffle_choices=v.shuffle_choices)
+        label = f"{exam_term}\n{('LỚP ' + v.class_name + ' — ') if v.class_name else ''}MÃ ĐỀ {v.code}"
+        stem = "_".join(x for x in [base, _safe_name(v.class_name), f"De_{_safe_name(v.code)}"] if x)
+        kw = dict(
+            school_name=school_name, subject=subject, grade=grade, exam_term=label,
+            exam_list=items, include_answers=False,
+        )
+        jobs.append((f"{stem}.docx", "exam", kw))
+        if with_answers:
+            jobs.append((f"{stem}_dap_an.docx", "exam", dict(kw, include_answers=True)))
+    if include_matrix:
+        jobs.append((f"Ma_tran_{base}.docx", "matrix", dict(subject=subject, grade=grade, exam_list=exam_list)))
+    return jobs
+
+
+def bulk_export_zip(
+    school_name: str,
+    subject: str,
+    grade: str,
+    exam_term: str,
+    exam_list: List[Dict[str, Any]],
+    variants: List[VariantSpec],
+    with_answers: bool = True,
+    include_matrix: bool = True,
+    parallel: bool = True,
+) -> Tuple[bytes, List[Dict[str, Any]]]:
+    """
+    Xuất hàng loạt (nhiều mã đề × nhiều lớp, có/không đáp án, kèm ma trận) vào 1 file zip.
+    Mỗi mã đề dùng make_variant (đảo câu + đảo A/B/C/D, sửa đáp án) theo seed.
+    Các file được dựng song song trên process pool dùng chung của app, xong file nào ghi ngay file đó vào zip.
+    Trả (bytes zip, thời gian dựng từng file).
+    """
+    jobs = bulk_export_jobs(
+        school_name, subject, grade, exam_term, exam_list, variants, with_answers, include_matrix
+    )
+    report: List[Dict[str, Any]] = []
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+
+        def _add(filename: str, data: bytes, seconds: float) -> None:
+            zf.writestr(filename, data)
+            report.append({"file": filename, "seconds": round(seconds, 3), "bytes": len(data)})
+
+        pool = get_process_pool() if parallel and len(jobs) >= BULK_EXPORT_MIN_PARALLEL_FILES else None
+        done: set = set()
+        if pool is not None:
+            try:
+                futures = {pool.submit(_build_export_job, job): i for i, job in enumerate(jobs)}
+                for fut in as_completed(futures):
+                    _add(*fut.result())
+                    done.add(futures[fut])
+            except BrokenProcessPool:
+                discard_process_pool(pool)  # process con chết: dựng nốt các file còn lại ngay tại đây
+        for i, job in enumerate(jobs):
+            if i not in done:
+                _add(*_build_export_job(job))
+    return out.getvalue(), report
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, Optional, Tuple
+
+# Đọc nhanh mặc định; đặt False để quay về python-docx
+DOCX_FAST_READER = True
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_BODY = _W + "body"
+_TBL = _W + "tbl"
+_TR = _W + "tr"
+_TC = _W + "tc"
+_P = _W + "p"
+_R = _W + "r"
+_HYPERLINK = _W + "hyperlink"
+_VAL = _W + "val"
+_TYPE = _W + "type"
+
+
+def _run_text(r: ET.Element) -> str:
+    out: List[str] = []
+    for ch in r:
+        tag = ch.tag
+        if tag == _W + "t":
+            out.append(ch.text or "")
+        elif tag in (_W + "tab", _W + "ptab"):
+            out.append("\t")
+        elif tag == _W + "br":
+            out.append("\n" if ch.get(_TYPE) in (None, "textWrapping") else "")
+        elif tag == _W + "cr":
+            out.append("\n")
+        elif tag == _W + "noBreakHyphen":
+            out.append("-")
+    return "".join(out)
+
+
+def _paragraph_text(p: ET.Element) -> str:
+    out: List[str] = []
+    for ch in p:
+        if ch.tag == _R:
+            out.append(_run_text(ch))
+        elif ch.tag == _HYPERLINK:
+            out.extend(_run_text(r) for r in ch if r.tag == _R)
+    return "".join(out)
+
+
+def _cell_text(tc: ET.Element) -> str:
+    # Giống _Cell.text của python-docx: chỉ các đoạn con trực tiếp (bỏ bảng lồng trong ô)
+    return "\n".join(_paragraph_text(p) for p in tc if p.tag == _P)
+
+
+def _cell_props(tc: ET.Element) -> Tuple[int, bool]:
+    span, vmerge_continue = 1, False
+    tcpr = tc.find(_W + "tcPr")
+    if tcpr is not None:
+        gs = tcpr.find(_W + "gridSpan")
+        if gs is not None:
+            try:
+                span = max(1, int(gs.get(_VAL) or 1))
+            except ValueError:
+                span = 1
+        vm = tcpr.find(_W + "vMerge")
+        if vm is not None:
+            vmerge_continue = (vm.get(_VAL) or "continue") == "continue"
+    return span, vmerge_continue
+
+
+def iter_docx_table_rows(data: bytes) -> Iterator[List[str]]:
+    """
+    Đọc thẳng word/document.xml trong file zip bằng iterparse (bộ nhớ gần như cố định),
+    trả từng dòng của các bảng cấp thân văn bản (như doc.tables), mỗi ô là text đã strip.
+    Ô gộp ngang lặp lại theo gridSpan, ô gộp dọc lấy text ô phía trên — giống python-docx.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zf, zf.open("word/document.xml") as fh:
+        stack: List[str] = []
+        tables: List[bool] = []   # bảng đang mở có phải bảng cấp body không
+        prev_row: List[str] = []
+        row: List[str] = []
+        for event, el in ET.iterparse(fh, events=("start", "end")):
+            tag = el.tag
+            if event == "start":
+                if tag == _TBL:
+                    top = bool(stack) and stack[-1] == _BODY
+                    tables.append(top)
+                    if top:
+                        prev_row = []
+                elif tag == _TR and tables and tables[-1]:
+                    row = []
+                stack.append(tag)
+                continue
+
+            stack.pop()
+            in_top_table = bool(tables) and tables[-1]
+            if tag == _TC and in_top_table:
+                span, cont = _cell_props(el)
+                if cont:
+                    start = len(row)
+                    above = prev_row[start:start + span]
+                    row.extend(above + [""] * (span - len(above)))
+                else:
+                    row.extend([_cell_text(el).strip()] * span)
+                el.clear()
+            elif tag == _TR and in_top_table:
+                yield row
+                prev_row = row
+                el.clear()
+            elif tag == _TBL:
+                tables.pop()
+            if stack and stack[-1] == _BODY:
+                el.clear()  # phần tử cấp body đã xử lý xong => giải phóng
+
+
+def _python_docx_rows(data: bytes) -> List[List[str]]:
+    from docx import Document  # chỉ đường dự phòng mới cần python-docx
+
+    doc = Document(io.BytesIO(data))
+    rows: List[List[str]] = []
+    for table in doc.tables:
+        for row in table.rows:
+            rows.append([(cell.text or "").strip() for cell in row.cells])
+    return rows
+
+
+def read_docx_table_rows(data: bytes, fast: Optional[bool] = None) -> List[List[str]]:
+    """Các dòng bảng trong DOCX; đường nhanh (iterparse) lỗi thì tự quay về python-docx."""
+    if DOCX_FAST_READER if fast is None else fast:
+        try:
+            return list(iter_docx_table_rows(data))
+        except (KeyError, zipfile.BadZipFile, ET.ParseError):
+            pass
+    return _python_docx_rows(data)
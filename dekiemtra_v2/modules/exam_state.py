@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from modules.question_bank import question_hash
+from modules.question_model import parse_question
+from modules.validators import validate_question_format
+
+# (tên cột trên bảng Tab 3, khoá trong câu hỏi)
+MATRIX_COLUMNS: List[Tuple[str, str]] = [
+    ("Học kì", "semester"),
+    ("Lớp", "grade"),
+    ("Môn", "subject"),
+    ("Chủ đề", "topic"),
+    ("Bài học", "lesson"),
+    ("YCCĐ", "yccd"),
+    ("Dạng", "type"),
+    ("Mức", "level"),
+    ("Điểm", "points"),
+    ("Nội dung", "content"),
+]
+COLUMN_TO_KEY = dict(MATRIX_COLUMNS)
+
+
+@dataclass
+class ItemCheck:
+    points: float
+    points_ok: bool
+    format_ok: bool
+    format_errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Bucket:
+    count: int = 0
+    points: float = 0.0
+
+
+def _cell_value(key: str, value: Any) -> Any:
+    if key == "points":
+        try:
+            return float(value or 0)
+        except (TypeError, ValueError):
+            return value
+    return "" if value is None else value
+
+
+def _points(q: Dict[str, Any]) -> Tuple[float, bool]:
+    try:
+        return float(q.get("points", 0) or 0), True
+    except (TypeError, ValueError):
+        return 0.0, False
+
+
+class ExamState:
+    """
+    Trạng thái đề (bọc list câu hỏi) giữ sẵn tổng điểm, kết quả kiểm tra từng câu
+    và thống kê theo mức/dạng; thêm/xoá/sửa chỉ tính lại phần thay đổi.
+    Mỗi câu có "_id" cố định (dùng làm key widget), version tăng sau mỗi thay đổi.
+    """
+
+    def __init__(self, items: Optional[List[Dict[str, Any]]] = None):
+        self.items: List[Dict[str, Any]] = items if items is not None else []
+        self.version = 0
+        self.total = 0.0
+        self.by_level: Dict[str, Bucket] = defaultdict(Bucket)
+        self.by_type: Dict[str, Bucket] = defaultdict(Bucket)
+        self._checks: Dict[int, ItemCheck] = {}
+        self._refs: Dict[int, int] = {}          # _id -> id() của dict câu hỏi đã đăng ký
+        self._hashes: Dict[int, str] = {}        # _id -> question_hash(nội dung)
+        self._hash_counts: Counter = Counter()   # hash -> số câu trong đề có nội dung đó
+        self._bad_points: set = set()
+        self._bad_format: set = set()
+        self._next_id = 1
+        self._pos: Optional[Dict[int, int]] = None
+        self._df: Optional[pd.DataFrame] = None
+        for q in self.items:
+            self._register(q)
+
+    # ---- cập nhật từng câu ----
+    def _register(self, q: Dict[str, Any]) -> None:
+        if not isinstance(q.get("_id"), int) or q["_id"] in self._checks:
+            q["_id"] = self._next_id
+        self._next_id = max(self._next_id, q["_id"] + 1)
+        self._account(q, +1)
+
+    def _account(self, q: Dict[str, Any], sign: int) -> None:
+        qid = q["_id"]
+        if sign > 0:
+            pts, pts_ok = _points(q)
+            content, q_type = q.get("content", "") or "", q.get("type", "")
+            ok, errs = validate_question_format(content, q_type, parse_question(content))
+            q["format_ok"], q["format_errors"] = ok, errs
+            chk = self._checks[qid] = ItemCheck(pts, pts_ok, ok, errs)
+            self._refs[qid] = id(q)
+            h = self._hashes[qid] = question_hash(content)
+            self._hash_counts[h] += 1
+        else:
+            chk = self._checks.pop(qid)
+            self._refs.pop(qid, None)
+            h = self._hashes.pop(qid)
+            self._hash_counts[h] -= 1
+            if self._hash_counts[h] <= 0:
+                del self._hash_counts[h]
+        self.total += sign * chk.points
+        for agg, key in ((self.by_level, q.get("level", "")), (self.by_type, q.get("type", ""))):
+            b = agg[key]
+            b.count += sign
+            b.points += sign * chk.points
+            if b.count <= 0:
+                del agg[key]
+        for bad, flag in ((self._bad_points, chk.points_ok), (self._bad_format, chk.format_ok)):
+            if sign > 0 and not flag:
+                bad.add(qid)
+            elif sign < 0:
+                bad.discard(qid)
+
+    def _touch(self) -> None:
+        self.version += 1
+
+    # ---- thao tác ----
+    def add(self, q: Dict[str, Any]) -> Dict[str, Any]:
+        self.items.append(q)
+        self._register(q)
+        if self._pos is not None:
+            self._pos[q["_id"]] = len(self.items) - 1
+        self._df = None
+        self._touch()
+        return q
+
+    def extend(self, qs: Iterable[Dict[str, Any]]) -> None:
+        for q in qs:
+            self.add(q)
+
+    def remove(self, index: int) -> Dict[str, Any]:
+        q = self.items.pop(index)
+        self._account(q, -1)
+        self._pos = None
+        self._df = None
+        self._touch()
+        return q
+
+    def remove_id(self, qid: int) -> Optional[Dict[str, Any]]:
+        i = self.index_of(qid)
+        return None if i is None else self.remove(i)
+
+    def update(self, index: int, changes: Dict[str, Any]) -> bool:
+        """Sửa các trường của câu thứ index; không có gì khác thì bỏ qua. Trả về True nếu có thay đổi."""
+        q = self.items[index]
+        diff = {k: v for k, v in changes.items() if q.get(k) != v}
+        if not diff:
+            return False
+        self._account(q, -1)
+        q.update(diff)
+        self._account(q, +1)
+        if self._df is not None:
+            try:
+                for col, key in MATRIX_COLUMNS:
+                    if key in diff:
+                        self._df.at[index, col] = q.get(key, "")
+            except (TypeError, ValueError):
+                self._df = None  # giá trị không hợp kiểu cột (vd điểm là chữ) => dựng lại bảng
+        self._touch()
+        return True
+
+    # ---- tra cứu ----
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def consistent(self) -> bool:
+        """False nếu list bị sửa ngoài ExamState: thêm/xoá/thay câu (so từng dict đã đăng ký theo _id)."""
+        refs = self._refs
+        return len(self.items) == len(refs) and all(refs.get(q.get("_id")) == id(q) for q in self.items)
+
+    def index_of(self, qid: int) -> Optional[int]:
+        if self._pos is None:
+            self._pos = {q["_id"]: i for i, q in enumerate(self.items)}
+        return self._pos.get(qid)
+
+    def rows_key(self) -> str:
+        """Dấu vân tay thứ tự các câu (theo _id): đổi khi thêm/xoá/đổi chỗ câu, sửa ô thì giữ nguyên."""
+        ids = ",".join(str(q.get("_id")) for q in self.items)
+        return hashlib.blake2b(ids.encode("ascii"), digest_size=8).hexdigest()
+
+    def hashes(self) -> AbstractSet[str]:
+        """question_hash của mọi câu trong đề (giữ sẵn, không băm lại mỗi lần rerun)."""
+        return self._hash_counts.keys()
+
+    def hash_of(self, qid: int) -> str:
+        return self._hashes[qid]
+
+    def check(self, qid: int) -> ItemCheck:
+        return self._checks[qid]
+
+    def _numbers(self, ids: set) -> List[int]:
+        return sorted(i + 1 for i in (self.index_of(qid) for qid in ids) if i is not None)
+
+    def errors(self) -> List[str]:
+        """Lỗi của cả đề (chưa có câu, điểm sai, tổng điểm = 0); chỉ duyệt các câu đang lỗi."""
+        if not self.items:
+            return ["Chưa có câu hỏi nào trong đề."]
+        errs = [f"Câu {n}: điểm không hợp lệ." for n in self._numbers(self._bad_points)]
+        if self.total <= 0:
+            errs.append("Tổng điểm = 0. Bạn hãy nhập điểm cho từng câu.")
+        return errs
+
+    def format_issues(self) -> List[int]:
+        """Số thứ tự các câu chưa đúng định dạng theo dạng câu hỏi."""
+        return self._numbers(self._bad_format)
+
+    def page(self, page: int, size: int) -> List[Tuple[int, Dict[str, Any]]]:
+        start = max(0, page) * size
+        return list(enumerate(self.items[start:start + size], start=start))
+
+    def dataframe(self) -> pd.DataFrame:
+        """
+        Bảng Tab 3, dựng lại khi thêm/xoá câu; sửa câu thì chỉ cập nhật ô tương ứng.
+        Trả bản sao: bảng đã đưa cho st.data_editor không bị sửa ngầm ở lần update sau.
+        """
+        if self._df is None:
+            self._df = pd.DataFrame(
+                [{"STT": i + 1, **{col: q.get(key, "" if key != "points" else 0) for col, key in MATRIX_COLUMNS}}
+                 for i, q in enumerate(self.items)],
+                columns=["STT", *(col for col, _ in MATRIX_COLUMNS)],
+            )
+        return self._df.copy()
+
+    def apply_cell_edits(self, edited_rows: Dict[Any, Dict[str, Any]]) -> List[int]:
+        """
+        Áp các ô đã sửa dạng {dòng: {tên cột: giá trị}} (edited_rows của st.data_editor);
+        chỉ các câu có ô khác giá trị cũ mới bị tính lại. Trả về chỉ số các câu đã đổi.
+        Dòng tính theo vị trí => edits phải lấy từ bảng có cùng rows_key() với hiện tại.
+        """
+        changed: List[int] = []
+        for row, cells in edited_rows.items():
+            i = int(row)
+            if not 0 <= i < len(self.items):
+                continue
+            changes = {COLUMN_TO_KEY[c]: _cell_value(COLUMN_TO_KEY[c], v) for c, v in cells.items() if c in COLUMN_TO_KEY}
+            if changes and self.update(i, changes):
+                changed.append(i)
+        return changed
+
+
+def diff_frames(base: pd.DataFrame, edited: pd.DataFrame) -> Dict[int, Dict[str, Any]]:
+    """So 2 bảng cùng số dòng theo từng ô (vector hoá), trả về dạng edited_rows chỉ gồm ô khác nhau."""
+    cols = [c for c, _ in MATRIX_COLUMNS if c in base.columns and c in edited.columns]
+    a = base[cols].reset_index(drop=True)
+    b = edited[cols].reset_index(drop=True).iloc[:len(a)]
+    a = a.iloc[:len(b)]
+    mask = a.ne(b) & ~(a.isna() & b.isna())
+    out: Dict[int, Dict[str, Any]] = {}
+    for i, c in zip(*mask.to_numpy().nonzero()):
+        out.setdefault(int(i), {})[cols[c]] = b.iat[i, c]
+    return out
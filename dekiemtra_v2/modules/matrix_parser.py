@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Nhãn trùng với LEVELS/Q_TYPES ở ui_tabs để câu sinh ra dùng chung kiểm tra định dạng
+LEVEL_NAMES = {1: "Mức 1: Biết", 2: "Mức 2: Hiểu", 3: "Mức 3: Vận dụng"}
+MC_TYPE = "Trắc nghiệm (4 lựa chọn)"
+ESSAY_TYPE = "Tự luận ngắn"
+_TYPE_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"dung\s*/?\s*sai|\bd\s*/\s*s\b"), "Đúng/Sai"),
+    (re.compile(r"ghep|noi cot"), "Ghép nối (Nối cột)"),
+    (re.compile(r"dien|hoan thanh"), "Điền khuyết (Hoàn thành câu)"),
+    (re.compile(r"\btn\b|trac nghiem|nhieu lua chon|\bmcq\b"), MC_TYPE),
+    (re.compile(r"\btl\b|tu luan"), ESSAY_TYPE),
+]
+_LEVEL_RE = re.compile(r"muc\s*(\d)|\bm\s*([123])\b")
+_LEVEL_WORDS = {"biet": 1, "nhan biet": 1, "hieu": 2, "thong hieu": 2, "van dung": 3}
+_NUM_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)")
+_TOTAL_RE = re.compile(r"^(tong|ti le|ty le|cong)\b")
+
+HEADER_SCAN_ROWS = 8
+DEFAULT_POINTS = 1.0
+QUESTIONS_PER_JOB = 4       # số câu tối đa trong 1 lời gọi AI
+QUESTION_SEPARATOR = "====="
+
+
+@dataclass
+class MatrixCell:
+    topic: str
+    level: str
+    q_type: str
+    count: int
+    points: float           # điểm mỗi câu
+
+
+@dataclass
+class MatrixJob:
+    topic: str
+    items: List[Tuple[str, str, float]]   # (mức, dạng, điểm) theo đúng thứ tự cần sinh
+
+
+def _fold(text: str) -> str:
+    t = unicodedata.normalize("NFD", (text or "").lower().replace("đ", "d"))
+    return re.sub(r"\s+", " ", "".join(ch for ch in t if unicodedata.category(ch) != "Mn")).strip()
+
+
+def _number(text: str) -> Optional[float]:
+    m = _NUM_RE.match(text or "")
+    return float(m.group(1).replace(",", ".")) if m else None
+
+
+def _level_of(folded: str, strict: bool = False) -> Optional[int]:
+    """Mức 1/2/3 trong text đã fold; strict: chữ "biết/hiểu/vận dụng" phải đứng đầu ô (tránh nhầm với tên bài)."""
+    m = _LEVEL_RE.search(folded)
+    if m:
+        n = int(m.group(1) or m.group(2))
+        return n if n in LEVEL_NAMES else None
+    for word, n in sorted(_LEVEL_WORDS.items(), key=lambda kv: -len(kv[0])):
+        if (folded == word or folded.startswith(word + " ")) if strict else re.search(rf"\b{word}\b", folded):
+            return n
+    return None
+
+
+def _type_of(folded: str) -> Optional[str]:
+    for pat, name in _TYPE_PATTERNS:
+        if pat.search(folded):
+            return name
+    return None
+
+
+def _col(headers: Sequence[str], *keys: str) -> Optional[int]:
+    for i, h in enumerate(headers):
+        if any(k in h for k in keys):
+            return i
+    return None
+
+
+def _parse_long(rows: List[List[str]]) -> List[MatrixCell]:
+    """Dạng bảng dọc: mỗi dòng 1 ô (Chủ đề | Mức | Dạng | Số câu | Điểm)."""
+    for hi, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        h = [_fold(c) for c in row]
+        c_topic = _col(h, "chu de", "mach kien thuc", "noi dung", "bai hoc")
+        c_level, c_type, c_count = _col(h, "muc"), _col(h, "dang", "hinh thuc", "loai cau"), _col(h, "so cau")
+        if None in (c_topic, c_level, c_count):
+            continue
+        c_points = _col(h, "diem")
+        cells: List[MatrixCell] = []
+        for r in rows[hi + 1:]:
+            get = lambda c: (r[c] if c is not None and c < len(r) else "")  # noqa: E731
+            topic, count = get(c_topic).strip(), _number(get(c_count))
+            level = _level_of(_fold(get(c_level)))
+            if not topic or _TOTAL_RE.match(_fold(topic)) or not count or level is None:
+                continue
+            pts = _number(get(c_points))
+            per_q = DEFAULT_POINTS if not pts else (pts / count if "tong" in h[c_points] else pts)
+            cells.append(MatrixCell(topic, LEVEL_NAMES[level], _type_of(_fold(get(c_type))) or MC_TYPE, int(count), per_q))
+        return cells
+    return []
+
+
+def _parse_wide(rows: List[List[str]]) -> List[MatrixCell]:
+    """
+    Dạng ma trận ngang hay gặp: cột = Mức (1/2/3) x Dạng (TN/TL), dòng = chủ đề,
+    mỗi chủ đề 1 dòng "Số câu" và (tuỳ chọn) 1 dòng "Số điểm". Ô gộp dọc ở các cột đầu
+    (docx đã lặp lại khi đọc, xlsx chỉ có giá trị ở ô đầu) được lấp xuống từ dòng trên.
+    """
+    level_rows = [i for i, r in enumerate(rows[:HEADER_SCAN_ROWS]) if any(_level_of(_fold(c), strict=True) for c in r[1:])]
+    if not level_rows:
+        return []
+    body_start = level_rows[-1] + 1
+    # dòng tiêu đề phụ (TN/TL...) ngay dưới dòng "Mức": chưa có số nào
+    while body_start < min(len(rows), HEADER_SCAN_ROWS) and not any(_number(c) for c in rows[body_start][1:]):
+        body_start += 1
+    width = max(len(r) for r in rows)
+    header = [r + [""] * (width - len(r)) for r in rows[:body_start]]
+    for r in header:  # ô gộp ngang trong xlsx chỉ có giá trị ở ô đầu => lấp sang phải
+        for c in range(2, width):
+            r[c] = r[c] or r[c - 1]
+
+    col_keys: Dict[int, Tuple[int, str]] = {}
+    for c in range(1, width):
+        text = " ".join(_fold(r[c]) for r in header)
+        lv = None if "tong" in text else _level_of(text)
+        if lv is not None:
+            col_keys[c] = (lv, _type_of(text) or MC_TYPE)
+    if not col_keys:
+        return []
+
+    first = min(col_keys)
+    cells: List[MatrixCell] = []
+    cell_at: Dict[Tuple[str, int], MatrixCell] = {}
+    above = [""] * first
+    for r in rows[body_start:]:
+        lead = above = [x or above[i] for i, x in enumerate(r[:first] + [""] * (first - len(r)))]
+        folded = [_fold(x) for x in lead]
+        if any("cau so" in f or "ti le" in f for f in folded):
+            continue  # dòng liệt kê số thứ tự câu / tỉ lệ %
+        topic = next((x for x, f in zip(lead, folded) if x and not re.search(r"so cau|so diem|^diem$", f)), "")
+        if not topic or _TOTAL_RE.match(_fold(topic)):
+            continue
+        is_points = any("so diem" in f or f == "diem" for f in folded)
+        for c, (lv, qt) in col_keys.items():
+            v = _number(r[c]) if c < len(r) else None
+            if not v:
+                continue
+            if is_points:
+                cell = cell_at.get((topic, c))
+                if cell is not None:
+                    cell.points = round(v / cell.count, 2)
+            elif (topic, c) not in cell_at:
+                cell = cell_at[(topic, c)] = MatrixCell(topic, LEVEL_NAMES[lv], qt, int(v), DEFAULT_POINTS)
+                cells.append(cell)
+    return cells
+
+
+def parse_matrix_rows(rows: List[List[str]]) -> List[MatrixCell]:
+    """Dòng bảng ma trận (đã đọc từ xlsx/docx) -> các ô (chủ đề x mức x dạng, số câu, điểm/câu)."""
+    rows = [[(c or "").strip() for c in r] for r in rows if any((c or "").strip() for c in r)]
+    if not rows:
+        return []
+    return _parse_long(rows) or _parse_wide(rows)
+
+
+def plan_jobs(cells: List[MatrixCell], per_job: int = QUESTIONS_PER_JOB) -> List[MatrixJob]:
+    """Chia các ô thành việc nhỏ cùng chủ đề (tối đa per_job câu) để sinh song song, giữ thứ tự ma trận."""
+    jobs: List[MatrixJob] = []
+    by_topic: Dict[str, List[Tuple[str, str, float]]] = {}
+    for cell in cells:
+        by_topic.setdefault(cell.topic, []).extend([(cell.level, cell.q_type, cell.points)] * cell.count)
+    for topic, items in by_topic.items():
+        for i in range(0, len(items), per_job):
+            jobs.append(MatrixJob(topic, items[i:i + per_job]))
+    return jobs
+
+
+def split_questions(text: str, expected: int) -> List[str]:
+    """Tách kết quả của 1 việc theo dòng phân cách; thừa thì bỏ, thiếu thì trả ít hơn expected."""
+    parts = [p.strip() for p in re.split(rf"^\s*{QUESTION_SEPARATOR}+\s*$", text or "", flags=re.MULTILINE)]
+    return [p for p in parts if p][:expected]
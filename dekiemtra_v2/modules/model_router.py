@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_LATENCY_SECONDS = 6.0   # ước lượng cho model chưa đo
+EWMA_ALPHA = 0.3
+OUTCOME_WINDOW = 20             # số kết quả gần nhất để tính tỉ lệ lỗi
+RATE_LIMIT_WINDOW_SECONDS = 60.0
+FAILURE_THRESHOLD = 3           # lỗi liên tiếp => mở cầu dao
+OPEN_SECONDS = 30.0
+RATE_LIMIT_OPEN_SECONDS = 20.0
+MAX_OPEN_SECONDS = 300.0
+
+
+@dataclass
+class ModelHealth:
+    latency: Optional[float] = None
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=OUTCOME_WINDOW))
+    rate_limits: Deque[float] = field(default_factory=deque)
+    consecutive_failures: int = 0
+    trips: int = 0
+    open_until: float = 0.0
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - (sum(self.outcomes) / len(self.outcomes))
+
+
+class ModelRouter:
+    """
+    Chọn model theo sức khoẻ gần đây, tách riêng theo (hash API key, model):
+    quota/429 tính theo từng key nên key này bị giới hạn không làm mở cầu dao của key khác.
+    - Độ trễ EWMA, tỉ lệ lỗi, số lần 429 trong 60s
+    - Cầu dao: model lỗi liên tiếp / bị 429 sẽ tạm bị bỏ qua, hết hạn thì thử lại (half-open)
+    - Model khoẻ và nhanh nhất được thử trước; hoà điểm thì giữ thứ tự ưu tiên gốc
+    """
+
+    def __init__(self):
+        self._health: Dict[Tuple[str, str], ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, model: str) -> ModelHealth:
+        h = self._health.get((key, model))
+        if h is None:
+            h = self._health[(key, model)] = ModelHealth()
+        return h
+
+    def _score(self, h: ModelHealth, now: float) -> float:
+        while h.rate_limits and now - h.rate_limits[0] > RATE_LIMIT_WINDOW_SECONDS:
+            h.rate_limits.popleft()
+        latency = h.latency if h.latency is not None else DEFAULT_LATENCY_SECONDS
+        return latency * (1.0 + 4.0 * h.error_rate()) + 5.0 * len(h.rate_limits)
+
+    def order(self, models: List[str], key: str = "") -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            healthy = []
+            tripped = []
+            for i, m in enumerate(models):
+                h = self._get(key, m)
+                if h.open_until > now:
+                    tripped.append((h.open_until, i, m))
+                else:
+                    healthy.append((self._score(h, now), i, m))
+        if healthy:
+            return [m for _, _, m in sorted(healthy)]
+        # Tất cả đang mở cầu dao: thử model sắp hết hạn trước
+        return [m for _, _, m in sorted(tripped)]
+
+    def record_success(self, model: str, latency: float, key: str = "") -> None:
+        with self._lock:
+            h = self._get(key, model)
+            h.latency = latency if h.latency is None else (EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * h.latency)
+            h.outcomes.append(True)
+            h.consecutive_failures = 0
+            h.trips = 0
+            h.open_until = 0.0
+
+    def record_failure(self, model: str, rate_limited: bool = False, key: str = "") -> None:
+        now = time.monotonic()
+        with self._lock:
+            h = self._get(key, model)
+            h.outcomes.append(False)
+            h.consecutive_failures += 1
+            if rate_limited:
+                h.rate_limits.append(now)
+            if rate_limited or h.consecutive_failures >= FAILURE_THRESHOLD:
+                base = RATE_LIMIT_OPEN_SECONDS if rate_limited else OPEN_SECONDS
+                h.open_until = now + min(MAX_OPEN_SECONDS, base * (2 ** h.trips))
+                h.trips += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": k,
+                    "model": m,
+                    "latency": h.latency,
+                    "error_rate": h.error_rate(),
+                    "rate_limits_60s": len(h.rate_limits),
+                    "open": h.open_until > now,
+                    "score": self._score(h, now),
+                }
+                for (k, m), h in self._health.items()
+            ]
+
+
+_ROUTER = ModelRouter()
+
+
+def get_model_router() -> ModelRouter:
+    return _ROUTER
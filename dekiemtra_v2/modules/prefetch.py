@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from modules.ai_client import GeminiClient
+
+PREFETCH_SESSION_ID = "prefetch"
+# Số bài kế cận được gợi ý YCCĐ trước mỗi khi chọn bài (0 = tắt)
+YCCD_PREFETCH_LESSONS = int(os.environ.get("YCCD_PREFETCH_LESSONS", "3"))
+PREFETCH_WORKERS = 2
+# Chỉ chạy nền khi còn ít nhất ngần này quota request rảnh và không ai đang xếp hàng
+PREFETCH_MIN_SPARE = 0.5
+
+
+class Prefetcher:
+    """
+    Chạy nền các lời gọi AI đoán trước (dùng chung mọi session của process):
+    cùng khoá đang chạy thì không gửi lại, nhường quota cho người dùng thật.
+    Kết quả chỉ ghi vào cache phản hồi trên đĩa; UI đọc lại qua GeminiClient.peek_cache.
+    """
+
+    def __init__(self, max_workers: int = PREFETCH_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._inflight: set = set()
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def submit(self, key: Any, fn: Callable[[], Any]) -> bool:
+        with self._lock:
+            if key in self._inflight:
+                return False
+            self._inflight.add(key)
+
+        def _run() -> None:
+            try:
+                fn()
+            except Exception:
+                pass  # đoán trước hỏng thì thôi, lần bấm thật sẽ gọi lại
+            finally:
+                with self._lock:
+                    self._inflight.discard(key)
+
+        self._pool.submit(_run)
+        return True
+
+    def warm(self, api_key: str, prompts: Dict[Any, str], gen_config: Optional[Dict[str, Any]]) -> List[Any]:
+        """
+        Gửi nền các prompt chưa có trong cache; trả về các khoá đã xếp lịch.
+        Việc bị bỏ qua (hết quota rảnh) hay lỗi không được ghi nhớ => lần gọi warm sau sẽ xếp lại.
+        """
+        client = GeminiClient(api_key, session_id=PREFETCH_SESSION_ID, rate_limit_wait=0, record_health=False)
+        if not client.ready():
+            return []
+
+        def _job(prompt: str) -> None:
+            if client.rate_limiter().spare() < PREFETCH_MIN_SPARE:
+                return
+            if client.peek_cache(prompt, gen_config) is None:
+                client.generate(prompt, gen_config=gen_config)
+
+        return [key for key, prompt in prompts.items() if self.submit(key, lambda p=prompt: _job(p))]
+
+
+def next_lessons(lessons: Sequence[str], current: str, limit: int = YCCD_PREFETCH_LESSONS) -> List[str]:
+    """Các bài dễ được chọn tiếp: các bài sau bài hiện tại trước, rồi tới các bài phía trước."""
+    lessons = list(lessons)
+    i = lessons.index(current) if current in lessons else -1
+    ordered = lessons[i + 1:] + lessons[:max(i, 0)]
+    return ordered[:max(0, limit)]
+
+
+_PREFETCHER: Optional[Prefetcher] = None
+_PREFETCHER_LOCK = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    global _PREFETCHER
+    with _PREFETCHER_LOCK:
+        if _PREFETCHER is None:
+            _PREFETCHER = Prefetcher()
+        return _PREFETCHER
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+MAX_PROCESS_WORKERS = min(4, os.cpu_count() or 1)
+# Module chứa hàm worker (phải ở mức module để process con import được); nạp sẵn trong forkserver
+WORKER_MODULES = ["modules.data_loader", "modules.docx_export"]
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_POOL_UNAVAILABLE = False
+
+
+def _mp_context() -> multiprocessing.context.BaseContext:
+    """
+    forkserver (Unix) hoặc spawn, không dùng fork mặc định: server chạy nhiều luồng (Streamlit, gRPC),
+    fork lúc 1 luồng khác đang giữ lock thì process con có thể treo vĩnh viễn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(WORKER_MODULES)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Process pool dùng chung cả process (tạo 1 lần, giữ suốt vòng đời app) cho việc nặng CPU
+    như đọc PDF nhiều trang, dựng nhiều file Word; mọi session cùng chia MAX_PROCESS_WORKERS process.
+    None nếu máy 1 nhân hoặc không tạo được process con => người gọi tự chạy tuần tự.
+    """
+    global _POOL, _POOL_UNAVAILABLE
+    with _POOL_LOCK:
+        if _POOL is None and not _POOL_UNAVAILABLE and MAX_PROCESS_WORKERS > 1:
+            try:
+                _POOL = ProcessPoolExecutor(max_workers=MAX_PROCESS_WORKERS, mp_context=_mp_context())
+            except Exception:
+                _POOL_UNAVAILABLE = True
+        return _POOL
+
+
+def discard_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Bỏ pool đã hỏng (process con chết giữa chừng); lần gọi get_process_pool sau sẽ tạo pool mới."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import csv
+import io
+import math
+import re
+from typing import List, Optional
+
+# Ước lượng cho tiếng Việt: mỗi âm tiết ~1.4 token, mỗi dấu câu/ký hiệu 1 token
+TOKENS_PER_WORD = 1.4
+TRIM_MARKER = "[...ĐÃ CẮT BỚT PHẦN CUỐI ({n} dòng)...]"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SYMBOL_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES_RE = re.compile(r"[ \t ]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (không gọi API): theo số từ + ký hiệu, chặn dưới bằng ~4 ký tự/token."""
+    if not text:
+        return 0
+    words = len(_WORD_RE.findall(text))
+    symbols = len(_SYMBOL_RE.findall(text))
+    return max(math.ceil(words * TOKENS_PER_WORD) + symbols, len(text) // 4)
+
+
+def _split_rows(lines: List[str], sep: str) -> List[List[str]]:
+    if sep == ",":
+        return [[c.strip() for c in r] for r in csv.reader(lines)]
+    return [[c.strip() for c in ln.split(sep.strip() or sep)] for ln in lines]
+
+
+def compact_table_text(text: str, sep: Optional[str] = None) -> str:
+    """
+    Rút gọn text bảng/ma trận trước khi đưa vào prompt: gộp khoảng trắng, bỏ dòng trống.
+    Có sep ("," cho CSV, " | " cho bảng DOCX) thì bỏ thêm các cột trống hoàn toàn và dòng tiêu đề
+    lặp lại (bảng kéo sang trang mới). Dòng dữ liệu trùng nhau luôn giữ nguyên: text không có sep
+    (PDF hay tách mỗi ô 1 dòng, vd "1\n1\n2") không biết đâu là tiêu đề nên không bỏ dòng nào.
+    """
+    lines = [_SPACES_RE.sub(" ", ln).strip() for ln in (text or "").splitlines()]
+    lines = [ln for ln in lines if ln]
+    if not lines:
+        return ""
+
+    if not sep:
+        return "\n".join(lines)
+
+    rows = _split_rows(lines, sep)
+    width = max(len(r) for r in rows)
+    keep = [c for c in range(width) if any(c < len(r) and r[c] for r in rows)]
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n") if sep == "," else None
+    lines = []
+    for r in rows:
+        cells = [r[c] if c < len(r) else "" for c in keep]
+        if not any(cells):
+            continue
+        if writer is not None:
+            out.seek(0)
+            out.truncate()
+            writer.writerow(cells)
+            lines.append(out.getvalue().rstrip("\n"))
+        else:
+            lines.append(sep.join(cells))
+    if not lines:
+        return ""
+
+    header = lines[0]
+    if sum(1 for c in _split_rows([header], sep)[0] if c) < 2:
+        return "\n".join(lines)  # dòng đầu không giống tiêu đề bảng
+    return "\n".join([header] + [ln for ln in lines[1:] if ln != header])
+
+
+def fit_to_budget(text: str, max_tokens: int, marker: str = TRIM_MARKER) -> str:
+    """
+    Giữ text trong ngân sách token, cắt theo ranh giới dòng (không cắt giữa dòng bảng);
+    dòng đầu đã quá ngân sách thì mới cắt theo từ. Có cắt thì thêm dòng đánh dấu.
+    """
+    text = text or ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    budget = max_tokens - estimate_tokens(marker.format(n=len(lines)))
+    kept: List[str] = []
+    used = 0
+    for ln in lines:
+        cost = estimate_tokens(ln) + 1
+        if used + cost > budget:
+            break
+        kept.append(ln)
+        used += cost
+    dropped = len(lines) - len(kept)
+    if not kept and lines:
+        words = lines[0].split(" ")
+        while words and estimate_tokens(" ".join(words)) > budget:
+            words = words[: max(1, len(words) * 9 // 10)] if len(words) > 1 else []
+        kept = [" ".join(words)] if words else []
+    return "\n".join(kept) + "\n\n" + marker.format(n=dropped)
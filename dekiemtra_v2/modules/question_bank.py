@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules.cache_utils import cache_dir
+
+_LOOKUP_COLS = ("grade", "subject", "topic", "lesson", "type", "level")
+_FIELDS = ("id", "semester", "grade", "subject", "topic", "lesson", "yccd", "type", "level", "points", "content", "model", "content_hash")
+
+
+def question_hash(content: str) -> str:
+    """Hash nội dung đã chuẩn hoá khoảng trắng/chữ hoa để nhận ra câu trùng."""
+    norm = re.sub(r"\s+", " ", (content or "").strip().lower())
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class QuestionBank:
+    """
+    Ngân hàng câu hỏi cục bộ (SQLite), dùng chung mọi session/process:
+    - Chỉ mục theo (lớp, môn, chủ đề, bài, dạng, mức) để lấy lại câu cũ trước khi gọi AI
+    - Tìm toàn văn (FTS5, không phân biệt dấu) trên nội dung/chủ đề/bài; thiếu FTS5 thì dùng LIKE
+    - Trùng nội dung (sau chuẩn hoá) chỉ lưu 1 lần
+    """
+
+    def __init__(self, path: Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.fts = False
+        self._lock = threading.Lock()
+        self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        try:
+            yield con
+        finally:
+            con.close()
+
+    def _init_db(self) -> None:
+        try:
+            with self._connect() as con:
+                try:
+                    con.execute("PRAGMA journal_mode=WAL")
+                except sqlite3.Error:
+                    pass  # DB chỉ đọc/đang bị khoá: giữ chế độ journal hiện có
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS questions ("
+                    " id INTEGER PRIMARY KEY, semester TEXT, grade TEXT, subject TEXT, topic TEXT, lesson TEXT,"
+                    " yccd TEXT, type TEXT, level TEXT, points REAL, content TEXT, model TEXT,"
+                    " content_hash TEXT UNIQUE, created REAL)"
+                )
+                con.execute(f"CREATE INDEX IF NOT EXISTS idx_questions_lookup ON questions({', '.join(_LOOKUP_COLS)})")
+                self.fts = self._init_fts(con)
+        except sqlite3.Error:
+            # Như ResponseCache: không mở/tạo được DB thì các thao tác sau chỉ trả rỗng, app vẫn chạy
+            self.fts = False
+
+    @staticmethod
+    def _init_fts(con: sqlite3.Connection) -> bool:
+        """Bảng tìm toàn văn FTS5 + trigger đồng bộ; SQLite không có FTS5 thì False (tìm bằng LIKE)."""
+        try:
+            con.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+                " content, topic, lesson, content='questions', content_rowid='id',"
+                " tokenize='unicode61 remove_diacritics 2')"
+            )
+            con.execute(
+                "CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN"
+                " INSERT INTO questions_fts(rowid, content, topic, lesson) VALUES (new.id, new.content, new.topic, new.lesson);"
+                " END"
+            )
+            con.execute(
+                "CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN"
+                " INSERT INTO questions_fts(questions_fts, rowid, content, topic, lesson)"
+                " VALUES ('delete', old.id, old.content, old.topic, old.lesson);"
+                " END"
+            )
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _row(r: sqlite3.Row) -> Dict[str, Any]:
+        return {k: r[k] for k in _FIELDS}
+
+    def add(self, q: Dict[str, Any]) -> Optional[int]:
+        content = (q.get("content") or "").strip()
+        if not content:
+            return None
+        try:
+            with self._connect() as con:
+                cur = con.execute(
+                    "INSERT OR IGNORE INTO questions(semester, grade, subject, topic, lesson, yccd, type, level,"
+                    " points, content, model, content_hash, created) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                    (
+                        q.get("semester", ""), q.get("grade", ""), q.get("subject", ""), q.get("topic", ""),
+                        q.get("lesson", ""), q.get("yccd", ""), q.get("type", ""), q.get("level", ""),
+                        float(q.get("points", 0) or 0), content, q.get("model") or "", question_hash(content), time.time(),
+                    ),
+                )
+                return cur.lastrowid if cur.rowcount else None
+        except sqlite3.Error:
+            return None
+
+    def find(
+        self,
+        grade: str,
+        subject: str,
+        topic: str,
+        lesson: str,
+        q_type: str,
+        level: str,
+        limit: int = 20,
+        exclude_hashes: Iterable[str] = (),
+    ) -> List[Dict[str, Any]]:
+        """Câu đã có cho đúng (lớp, môn, chủ đề, bài, dạng, mức), mới nhất trước, bỏ các hash trong exclude."""
+        skip = set(exclude_hashes)
+        try:
+            with self._connect() as con:
+                rows = con.execute(
+                    f"SELECT * FROM questions WHERE {' AND '.join(c + ' = ?' for c in _LOOKUP_COLS)}"
+                    " ORDER BY id DESC LIMIT ?",
+                    (grade, subject, topic, lesson, q_type, level, limit + len(skip)),
+                ).fetchall()
+        except sqlite3.Error:
+            return []
+        return [self._row(r) for r in rows if r["content_hash"] not in skip][:limit]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        terms = re.findall(r"\w+", query or "")
+        if not terms:
+            return []
+        try:
+            with self._connect() as con:
+                if self.fts:
+                    match = " ".join(f'"{t}"*' for t in terms)
+                    rows = con.execute(
+                        "SELECT q.* FROM questions_fts f JOIN questions q ON q.id = f.rowid"
+                        " WHERE questions_fts MATCH ? ORDER BY rank LIMIT ?",
+                        (match, limit),
+                    ).fetchall()
+                else:
+                    where = " AND ".join("(content LIKE ? OR topic LIKE ? OR lesson LIKE ?)" for _ in terms)
+                    args: List[Any] = []
+                    for t in terms:
+                        args += [f"%{t}%"] * 3
+                    rows = con.execute(
+                        f"SELECT * FROM questions WHERE {where} ORDER BY id DESC LIMIT ?", (*args, limit)
+                    ).fetchall()
+        except sqlite3.Error:
+            return []
+        return [self._row(r) for r in rows]
+
+    def iter_contents(self, batch: int = 5000, after: int = 0) -> Iterator[Tuple[int, str]]:
+        """Duyệt (id, nội dung) theo id tăng dần, từng lô; after > 0 để chỉ lấy các câu mới hơn."""
+        last = after
+        while True:
+            try:
+                with self._connect() as con:
+                    rows = con.execute(
+                        "SELECT id, content FROM questions WHERE id > ? ORDER BY id LIMIT ?", (last, batch)
+                    ).fetchall()
+            except sqlite3.Error:
+                return
+            if not rows:
+                return
+            for r in rows:
+                yield r["id"], r["content"]
+            last = rows[-1]["id"]
+
+    def count(self) -> int:
+        try:
+            with self._connect() as con:
+                return int(con.execute("SELECT COUNT(*) FROM questions").fetchone()[0])
+        except sqlite3.Error:
+            return 0
+
+
+_BANK: Optional[QuestionBank] = None
+_BANK_LOCK = threading.Lock()
+
+
+def get_question_bank() -> QuestionBank:
+    global _BANK
+    with _BANK_LOCK:
+        if _BANK is None:
+            _BANK = QuestionBank(cache_dir() / "question_bank.sqlite3")
+        return _BANK
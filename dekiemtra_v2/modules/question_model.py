@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Tuple
+
+PARSE_CACHE_ENTRIES = 8192
+
+# Dòng đáp án của câu trắc nghiệm 4 lựa chọn: "Đáp án: A/B/C/D"
+MC_ANSWER_RE = re.compile(r"(?im)^(\s*đáp\s*án\s*:\s*)([abcd])\s*$")
+ANSWER_LINE_RE = re.compile(r"(?im)^\s*đáp\s*án\s*:\s*(.+)$")
+OPTION_LINE_RE = re.compile(r"^(\s*)([A-D])([\.\)])\s*(.*)$")
+_RUBRIC_RE = re.compile(r"(?is)gợi\s*ý\s*chấm\s*:?\s*(.+)$")
+_NUMBERED_RE = re.compile(r"(?is)^\s*câu\s+\d+")
+# Tiền tố số câu AI tự đánh: "Câu 3:", "Câu 3.", "Câu 3 (1 điểm):"
+NUMBER_PREFIX_RE = re.compile(r"(?i)^\s*câu\s+\d+\s*(?:\([^)\n]*\))?\s*[:.]?\s*")
+_OPTION_MARKERS = ("A.", "B.", "C.", "D.")
+
+
+def is_multiple_choice(q_type: str) -> bool:
+    qt = (q_type or "").lower()
+    return "trắc nghiệm" in qt or "4 lựa chọn" in qt
+
+
+@dataclass(slots=True)
+class ParsedQuestion:
+    """
+    Câu hỏi đã tách cấu trúc (dựng 1 lần, dùng chung cho kiểm tra định dạng, xuất Word, sinh mã đề).
+    slots=True (cần Python 3.10+): không có __dict__ => ngân hàng câu lớn tốn ít bộ nhớ hơn.
+    """
+
+    source: str                                   # nội dung gốc (để biết bản parse còn đúng không)
+    body: str                                     # nội dung bỏ dòng "Đáp án:" (phần in trên đề)
+    stem: str                                     # phần dẫn trước lựa chọn A-D
+    options: Tuple[Tuple[str, str, str], ...]     # (nhãn, nội dung, dấu . hoặc ))
+    option_lines: Tuple[int, ...]                 # vị trí dòng của từng lựa chọn trong source
+    answer: str                                   # giá trị "Đáp án:" đầu tiên
+    mc_answer: str                                # A/B/C/D nếu dòng đáp án đúng khuôn trắc nghiệm
+    rubric: str                                   # phần "Gợi ý chấm"
+    markers: FrozenSet[str]                       # các chuỗi "A." .. "D." xuất hiện trong câu
+    has_answer_label: bool
+    has_hint: bool
+    has_columns: bool                             # có cả "Cột A" và "Cột B"
+    has_blank: bool                               # có chỗ trống ...... / … / ___
+    numbered: bool                                # đã tự đánh "Câu n"
+
+
+@lru_cache(maxsize=PARSE_CACHE_ENTRIES)
+def parse_question(content: str) -> ParsedQuestion:
+    source = content or ""
+    t = source.strip()
+    low = t.lower()
+
+    m = ANSWER_LINE_RE.search(t)
+    answer = m.group(1).strip() if m else ""
+    body = ANSWER_LINE_RE.sub("", t).strip() if m else t
+
+    options = []
+    option_lines = []
+    for i, line in enumerate(source.splitlines()):
+        om = OPTION_LINE_RE.match(line)
+        if om:
+            options.append((om.group(2), om.group(4).strip(), om.group(3)))
+            option_lines.append(i)
+
+    stem = body
+    if options:
+        lines = body.splitlines()
+        for j, line in enumerate(lines):
+            if OPTION_LINE_RE.match(line):
+                stem = "\n".join(lines[:j]).strip()
+                break
+
+    mc = MC_ANSWER_RE.search(t)
+    rb = _RUBRIC_RE.search(t)
+    return ParsedQuestion(
+        source=source,
+        body=body,
+        stem=stem,
+        options=tuple(options),
+        option_lines=tuple(option_lines),
+        answer=answer,
+        mc_answer=mc.group(2).upper() if mc else "",
+        rubric=rb.group(1).strip() if rb else "",
+        markers=frozenset(o for o in _OPTION_MARKERS if o in t),
+        has_answer_label="đáp án" in low,
+        has_hint="gợi ý" in low,
+        has_columns="cột a" in low and "cột b" in low,
+        has_blank="......" in t or "…" in t or "___" in t,
+        numbered=bool(_NUMBERED_RE.match(body)),
+    )
+
+
+def strip_number(content: str) -> str:
+    """Bỏ tiền tố "Câu n:" ở đầu câu (khi đổi thứ tự câu, số cũ không còn đúng)."""
+    return NUMBER_PREFIX_RE.sub("", content or "", count=1)
+
+
+def get_parsed(q: Dict[str, Any]) -> ParsedQuestion:
+    """Bản parse của câu (lấy từ lru_cache theo nội dung, không ghi gì vào dict của người gọi)."""
+    return parse_question(q.get("content", "") or "")
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from modules.cache_utils import cache_dir
+
+DEFAULT_TTL_SECONDS = float(os.environ.get("DEKIEMTRA_RESPONSE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get("DEKIEMTRA_RESPONSE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def make_key(prompt: str, model: str, gen_config: Optional[Dict[str, Any]]) -> str:
+    cfg = json.dumps(gen_config or {}, sort_keys=True, ensure_ascii=False, default=str)
+    h = hashlib.sha256()
+    for part in (prompt or "", model or "", cfg):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache phản hồi AI trên đĩa (SQLite), dùng chung mọi tab/session/process:
+    - Khoá = hash(prompt, model, gen_config)
+    - Hết hạn theo TTL, giới hạn dung lượng (xoá theo LRU)
+    - Đếm hit/miss để biết tiết kiệm được bao nhiêu lượt gọi API
+    Lỗi SQLite chỉ coi như miss, không làm hỏng luồng sinh đề.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            yield con
+        finally:
+            con.close()
+
+    def _init_db(self) -> None:
+        try:
+            with self._connect() as con:
+                con.execute("PRAGMA journal_mode=WAL")
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, model TEXT, text TEXT,"
+                    " created REAL, accessed REAL, size INTEGER)"
+                )
+                con.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        except sqlite3.Error:
+            pass
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(
+        self, prompt: str, models: List[str], gen_config: Optional[Dict[str, Any]], count: bool = True
+    ) -> Optional[Tuple[str, str]]:
+        """Tìm (model, text) theo thứ tự models; trả None nếu chưa có/hết hạn."""
+        keys = {make_key(prompt, m, gen_config): m for m in models}
+        if not keys:
+            return None
+        now = time.time()
+        found: Dict[str, str] = {}
+        try:
+            with self._connect() as con:
+                marks = ",".join("?" * len(keys))
+                rows = con.execute(
+                    f"SELECT key, text, created FROM responses WHERE key IN ({marks})", list(keys)
+                ).fetchall()
+                expired = [k for k, _, created in rows if now - created > self.ttl_seconds]
+                if expired:
+                    con.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in expired])
+                found = {k: text for k, text, created in rows if k not in expired}
+                if found:
+                    con.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(now, k) for k in found])
+        except sqlite3.Error:
+            found = {}
+
+        for k, m in keys.items():
+            if k in found:
+                if count:
+                    self._count(True)
+                return m, found[k]
+        if count:
+            self._count(False)
+        return None
+
+    def get(self, prompt: str, model: str, gen_config: Optional[Dict[str, Any]]) -> Optional[str]:
+        hit = self.lookup(prompt, [model], gen_config)
+        return hit[1] if hit else None
+
+    def put(self, prompt: str, model: str, gen_config: Optional[Dict[str, Any]], text: str) -> None:
+        now = time.time()
+        size = len((text or "").encode("utf-8")) + len((prompt or "").encode("utf-8"))
+        try:
+            with self._connect() as con:
+                con.execute(
+                    "INSERT OR REPLACE INTO responses(key, model, text, created, accessed, size) VALUES (?, ?, ?, ?, ?, ?)",
+                    (make_key(prompt, model, gen_config), model, text, now, now, size),
+                )
+                self._evict(con, now)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, con: sqlite3.Connection, now: float) -> None:
+        con.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = con.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Xoá bản truy cập lâu nhất cho tới khi còn ~90% giới hạn
+        target = int(self.max_bytes * 0.9)
+        victims: List[Tuple[str]] = []
+        for key, size in con.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size or 0
+        con.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self) -> None:
+        try:
+            with self._connect() as con:
+                con.execute("DELETE FROM responses")
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = 0, 0
+        try:
+            with self._connect() as con:
+                entries, size = con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_CACHE: Optional[ResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Một instance duy nhất cho cả process (mọi session Streamlit dùng chung)."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(cache_dir() / "responses.sqlite3")
+        return _CACHE
@@ -3,18 +3,37 @@ from __future__ import annotations
 
 import html
 import random
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import AbstractSet, Any, Callable, Dict, List, Optional, Tuple
 
 import pandas as pd
 import streamlit as st
 
-from modules.validators import validate_question_format, validate_exam_list, total_points
-from modules.docx_export import create_exam_docx, create_matrix_docx
-
-
-def _box(text: str) -> None:
+from modules.dedup import find_duplicate, find_in_exam
+from modules.prefetch import YCCD_PREFETCH_LESSONS, get_prefetcher, next_lessons
+from modules.question_bank import QuestionBank, get_question_bank, question_hash
+from modules.question_model import get_parsed, parse_question
+from modules.validators import validate_question_format
+from modules.exam_state import ExamState, diff_frames
+from modules.matrix_parser import QUESTION_SEPARATOR, MatrixCell, MatrixJob, plan_jobs, split_questions
+from modules.data_loader import CurriculumIndex, extract_matrix_cells
+from modules.docx_export import VariantSpec, bulk_export_zip, exam_docx_bytes, matrix_docx_bytes
+
+Q_TYPES = [
+    "Trắc nghiệm (4 lựa chọn)",
+    "Đúng/Sai",
+    "Ghép nối (Nối cột)",
+    "Điền khuyết (Hoàn thành câu)",
+    "Tự luận ngắn",
+]
+LEVELS = ["Mức 1: Biết", "Mức 2: Hiểu", "Mức 3: Vận dụng"]
+BANK_MODEL_LABEL = "Ngân hàng câu hỏi"
+EXAM_PAGE_SIZE = 20  # số câu hiển thị mỗi trang ở danh sách đề Tab 2
+DUP_MAX_RETRIES = 2  # số lần tự tạo lại khi câu AI trả về gần trùng câu đã có trong đề
+
+
+def _box(text: str, target=None) -> None:
     safe = html.escape(text or "")
-    st.markdown(
+    (target or st).markdown(
         f"<div style='background:#f0f2f6;padding:14px;border-radius:10px;border-left:5px solid #1565C0;'>"
         f"<pre style='margin:0;white-space:pre-wrap;font-family:ui-monospace,Menlo,Consolas,monospace'>{safe}</pre>"
         f"</div>",
@@ -22,6 +41,25 @@ def _box(text: str) -> None:
     )
 
 
+def _stream_to_box(stream) -> Any:
+    """Hiện text dần theo từng đoạn model trả về; xong thì xoá khung tạm, trả GenResult."""
+    holder = st.empty()
+    buf = ""
+    for piece in stream:
+        buf += piece
+        _box(buf + " ▌", target=holder)
+    holder.empty()
+    return stream.result
+
+
+FORMAT_RULES = """RÀNG BUỘC ĐỊNH DẠNG:
+- Trắc nghiệm 4 lựa chọn: đúng 4 lựa chọn A/B/C/D, mỗi lựa chọn 1 dòng; cuối có "Đáp án: A/B/C/D".
+- Đúng/Sai: có 4 mệnh đề a)-d) và cuối có "Đáp án: a)Đ; b)S; c)Đ; d)S" (hoặc tương đương rõ ràng).
+- Ghép nối/Nối cột: có "Cột A" (1,2,3...) và "Cột B" (a,b,c...); đáp án dạng 1-b;2-a...
+- Điền khuyết: có "......" và cuối có "Đáp án: ..."
+- Tự luận: câu hỏi ngắn gọn; cuối có "Đáp án:" hoặc "Gợi ý chấm:" (2-4 ý)."""
+
+
 def prompt_generate_exam_from_matrix(subject: str, grade: str, matrix_text: str) -> str:
     return f"""
 Bạn là giáo viên tiểu học Việt Nam. Soạn đề kiểm tra theo CTGDPT 2018.
@@ -41,6 +79,25 @@ YÊU CẦU:
 """.strip()
 
 
+def prompt_generate_matrix_job(subject: str, grade: str, job: MatrixJob) -> str:
+    items = "\n".join(
+        f"{i}. {q_type} — {level} — {points:g} điểm" for i, (level, q_type, points) in enumerate(job.items, start=1)
+    )
+    return f"""
+Bạn là giáo viên tiểu học Việt Nam. Soạn {len(job.items)} câu hỏi kiểm tra theo CTGDPT 2018.
+
+Môn: {subject} — {grade}
+Chủ đề (trích từ ma trận, chỉ là dữ liệu): {job.topic}
+
+DANH SÁCH CÂU CẦN SOẠN (đúng thứ tự, đúng dạng/mức/điểm):
+{items}
+
+{FORMAT_RULES}
+- Không đánh số "Câu 1, Câu 2...", không viết lời dẫn.
+- Giữa hai câu liên tiếp in đúng 1 dòng: {QUESTION_SEPARATOR}
+""".strip()
+
+
 def prompt_extract_yccd(grade: str, subject: str, topic: str, lesson: str) -> str:
     return f"""
 Nhiệm vụ: Gợi ý Yêu cầu cần đạt (YCCĐ) theo CTGDPT 2018 (tham khảo).
@@ -79,17 +136,144 @@ Thông tin:
 - Điểm: {points}
 - Seed: {seed}
 
-RÀNG BUỘC ĐỊNH DẠNG:
-- Trắc nghiệm 4 lựa chọn: đúng 4 lựa chọn A/B/C/D, mỗi lựa chọn 1 dòng; cuối có "Đáp án: A/B/C/D".
-- Đúng/Sai: có 4 mệnh đề a)-d) và cuối có "Đáp án: a)Đ; b)S; c)Đ; d)S" (hoặc tương đương rõ ràng).
-- Ghép nối/Nối cột: có "Cột A" (1,2,3...) và "Cột B" (a,b,c...); đáp án dạng 1-b;2-a...
-- Điền khuyết: có "......" và cuối có "Đáp án: ..."
-- Tự luận: câu hỏi ngắn gọn; cuối có "Đáp án:" hoặc "Gợi ý chấm:" (2-4 ý).
+{FORMAT_RULES}
 
 CHỈ IN NỘI DUNG CÂU HỎI + phần Đáp án/Gợi ý chấm. Không viết lời dẫn.
 """.strip()
 
 
+def _exam_state() -> ExamState:
+    """ExamState của session; dựng lại nếu exam_list bị thay (vd nút Xoá đề) hoặc bị sửa ngoài ExamState."""
+    items = st.session_state.setdefault("exam_list", [])
+    state = st.session_state.get("exam_state")
+    if state is None or state.items is not items or not state.consistent():
+        state = st.session_state["exam_state"] = ExamState(items)
+    return state
+
+
+def _question_record(
+    semester: str,
+    grade: str,
+    subject: str,
+    topic: str,
+    lesson: str,
+    yccd: str,
+    q_type: str,
+    level: str,
+    points: float,
+    text: str,
+    model: Optional[str],
+) -> Dict[str, Any]:
+    parsed = parse_question(text)
+    ok, errs = validate_question_format(text, q_type, parsed)
+    return {
+        "semester": semester,
+        "grade": grade,
+        "subject": subject,
+        "topic": topic,
+        "lesson": lesson,
+        "yccd": yccd,
+        "type": q_type,
+        "level": level,
+        "points": float(points),
+        "content": text,
+        "model": model,
+        "format_ok": ok,
+        "format_errors": errs,
+    }
+
+
+def generate_question_batch(
+    client,
+    specs: List[Dict[str, Any]],
+    semester: str,
+    grade: str,
+    subject: str,
+    gen_config: Dict[str, Any],
+    bank: Optional[QuestionBank] = None,
+    exclude_hashes: Optional[AbstractSet[str]] = None,
+    existing: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Sinh cả danh sách câu (mỗi spec: topic/lesson/yccd/type/level/points) bằng các lời gọi song song.
+    Có ngân hàng câu hỏi thì lấy câu có sẵn (chưa dùng) trước, chỉ gọi AI cho các dòng còn thiếu.
+    Có existing (các câu đã trong đề) thì loại câu gần trùng với đề hoặc với câu trước đó trong lô.
+    Trả về (câu đạt định dạng theo thứ tự spec, danh sách lỗi).
+    """
+    used = set(exclude_hashes or ())
+    texts: List[Optional[Tuple[str, Optional[str]]]] = [None] * len(specs)
+    if bank is not None:
+        for i, sp in enumerate(specs):
+            hits = bank.find(grade, subject, sp["topic"], sp["lesson"], sp["type"], sp["level"], limit=1, exclude_hashes=used)
+            if hits:
+                used.add(hits[0]["content_hash"])
+                texts[i] = (hits[0]["content"], BANK_MODEL_LABEL)
+
+    misses = [i for i, t in enumerate(texts) if t is None]
+    prompts = [
+        prompt_generate_one_question(
+            grade, subject, specs[i]["topic"], specs[i]["lesson"], specs[i]["yccd"], specs[i]["type"],
+            specs[i]["level"], float(specs[i]["points"]), random.randint(1, 999999),
+        )
+        for i in misses
+    ]
+    results = client.generate_many(prompts, gen_config=gen_config) if prompts else []
+
+    errors: List[str] = []
+    for i, res in zip(misses, results):
+        if res.error:
+            errors.append(f"Dòng {i + 1}: {res.error}")
+        else:
+            texts[i] = (res.text or "", res.model)
+
+    accepted: List[Dict[str, Any]] = []
+    for i, (sp, got) in enumerate(zip(specs, texts), start=1):
+        if got is None:
+            continue
+        rec = _question_record(
+            semester, grade, subject, sp["topic"], sp["lesson"], sp["yccd"], sp["type"], sp["level"],
+            float(sp["points"]), got[0], got[1],
+        )
+        if not rec["format_ok"]:
+            errors.append(f"Dòng {i}: sai định dạng ({'; '.join(rec['format_errors'])})")
+            continue
+        if existing is not None:
+            dup = find_in_exam(rec["content"], [*existing, *accepted])
+            if dup is not None:
+                errors.append(f"Dòng {i}: bỏ vì {dup.describe()}")
+                continue
+        accepted.append(rec)
+    return accepted, errors
+
+
+def generate_exam_from_cells(
+    client,
+    cells: List[MatrixCell],
+    subject: str,
+    grade: str,
+    exam_term: str,
+    gen_config: Dict[str, Any],
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Sinh đề theo các ô ma trận đã tách: mỗi nhóm (cùng chủ đề, vài câu) là 1 lời gọi, chạy song song;
+    kết quả tách theo dòng phân cách rồi ghép thành list câu có cấu trúc theo thứ tự ma trận.
+    """
+    jobs = plan_jobs(cells)
+    results = client.generate_many([prompt_generate_matrix_job(subject, grade, j) for j in jobs], gen_config=gen_config)
+    records: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    for n, (job, res) in enumerate(zip(jobs, results), start=1):
+        if res.error:
+            errors.append(f"Nhóm {n} ({job.topic}): {res.error}")
+            continue
+        texts = split_questions(res.text or "", len(job.items))
+        if len(texts) < len(job.items):
+            errors.append(f"Nhóm {n} ({job.topic}): thiếu {len(job.items) - len(texts)} câu")
+        for (level, q_type, points), text in zip(job.items, texts):
+            records.append(_question_record(exam_term, grade, subject, job.topic, "", "", q_type, level, points, text, res.model))
+    return records, errors
+
+
 def render_tab_matrix_to_exam(
     client,
     school_name: str,
@@ -109,29 +293,90 @@ def render_tab_matrix_to_exam(
     st.caption("Upload ma trận (xlsx/docx/pdf). App trích text (rút gọn nếu dài) để AI sinh đề theo ma trận.")
     up = st.file_uploader("Chọn file ma trận:", type=["xlsx", "docx", "pdf"])
     text = None
+    cells: List[MatrixCell] = []
     if up is not None:
         text, err = extract_text_from_upload(up.name, up.getvalue())
         if err:
             st.error(err)
         else:
             st.code((text or "")[:2000], language="text")
+        cells = extract_matrix_cells(up.name, up.getvalue())
+        if cells:
+            with st.expander(f"🧩 Tách được {len(cells)} ô ma trận • {sum(c.count for c in cells)} câu"):
+                st.dataframe(pd.DataFrame([{
+                    "Chủ đề": c.topic, "Mức": c.level, "Dạng": c.q_type, "Số câu": c.count, "Điểm/câu": c.points,
+                } for c in cells]), use_container_width=True, hide_index=True)
+
+    by_cells = st.checkbox(
+        "⚡ Sinh song song theo từng ô ma trận (đề dài không bị cắt)",
+        value=bool(cells), disabled=not cells, key="mx_by_cells",
+        help="Chỉ dùng được khi tách được bảng ma trận từ file xlsx/docx.",
+    )
 
     if st.button("🚀 Sinh đề theo ma trận", type="primary", disabled=(not client.ready() or not text)):
-        with st.spinner("AI đang sinh đề..."):
-            prompt = prompt_generate_exam_from_matrix(subject, grade, text or "")
-            res = client.generate(prompt, gen_config=gen_config)
-        if res.error:
-            st.error(res.error)
+        records: List[Dict[str, Any]] = []
+        if by_cells and cells:
+            with st.spinner(f"AI đang sinh {sum(c.count for c in cells)} câu song song..."):
+                records, errors = generate_exam_from_cells(client, cells, subject, grade, exam_term, gen_config)
+            if errors:
+                st.warning("Một số nhóm chưa sinh được:\n- " + "\n- ".join(errors))
+        if records:
+            state = _exam_state()
+            # Bấm lại (các ô trúng cache) => thay lô Tab 1 lần trước, câu đã sửa ở Tab 2/3 thì giữ lại
+            for qid, h in st.session_state.pop("mx_batch", {}).items():
+                i = state.index_of(qid)
+                if i is not None and state.hash_of(qid) == h:
+                    state.remove(i)
+            seen = set(state.hashes())
+            good, bad, dups = [], [], 0
+            for q in records:
+                h = question_hash(q["content"])
+                if h in seen:
+                    dups += 1
+                    continue
+                seen.add(h)
+                (good if q["format_ok"] else bad).append(q)
+            state.extend(good)
+            st.session_state["mx_batch"] = {q["_id"]: state.hash_of(q["_id"]) for q in good}
+            st.session_state["mx_rejected"] = bad
+            st.session_state["exam_result"] = "\n\n".join(
+                q["content"] if get_parsed(q).numbered else f"Câu {i} ({q['points']:g} điểm): {q['content']}"
+                for i, q in enumerate(good, start=1)
+            )
+            st.success(
+                f"Đã thêm {len(good)}/{len(records)} câu vào đề (xem/chỉnh ở Tab 2, Tab 3)"
+                + (f"; bỏ {dups} câu đã có trong đề." if dups else ".")
+            )
         else:
-            st.session_state["exam_result"] = res.text or ""
-            st.success(f"Đã sinh đề (model: {res.model})")
+            # không tách được ô (hoặc mọi nhóm lỗi) => sinh cả đề trong 1 lời gọi như cũ
+            prompt = prompt_generate_exam_from_matrix(subject, grade, text or "")
+            with st.spinner("AI đang sinh đề..."):
+                res = _stream_to_box(client.generate_stream(prompt, gen_config=gen_config))
+            if res.error:
+                st.error(res.error)
+            else:
+                st.session_state["exam_result"] = res.text or ""
+                st.success(f"Đã sinh đề (model: {res.model}{' • từ cache' if res.cached else ''})")
+
+    rejected = st.session_state.get("mx_rejected") or []
+    if rejected:
+        with st.expander(f"⚠️ {len(rejected)} câu sai định dạng chưa được thêm vào đề", expanded=True):
+            for q in rejected:
+                st.markdown(f"**{q['topic']}** • {q['type']} • {q['level']} — " + "; ".join(q["format_errors"]))
+                _box(q["content"])
+            if st.button("➕ Vẫn thêm các câu này (sửa sau ở Tab 3)", key="mx_add_rejected"):
+                state = _exam_state()
+                state.extend(rejected)
+                st.session_state.setdefault("mx_batch", {}).update({q["_id"]: state.hash_of(q["_id"]) for q in rejected})
+                st.session_state["mx_rejected"] = []
+                st.rerun()
 
     if st.session_state.get("exam_result"):
         st.subheader("Nội dung đề (có thể chỉnh sửa)")
         st.session_state["exam_result"] = st.text_area("Đề:", value=st.session_state["exam_result"], height=420)
 
         colA, colB = st.columns(2)
-        doc_exam = create_exam_docx(
+        doc_exam = exam_docx_bytes(
             school_name,
             subject,
             grade,
@@ -146,7 +391,7 @@ def render_tab_matrix_to_exam(
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             type="primary",
         )
-        doc_ans = create_exam_docx(
+        doc_ans = exam_docx_bytes(
             school_name,
             subject,
             grade,
@@ -165,32 +410,103 @@ def render_tab_matrix_to_exam(
         st.info("🔐 Chưa có API key. Nhập ở Sidebar hoặc đặt trong st.secrets để dùng AI.")
 
 
-def render_tab_question_builder(client, curriculum, curriculum_df: Optional[pd.DataFrame], gen_config: Dict[str, Any]):
+def _select(label: str, options: List[str], key: str, default_index: int = 0) -> Optional[str]:
+    """Selectbox theo key; giá trị cũ không còn trong options (đổi cấp trên) thì về mặc định."""
+    if st.session_state.get(key) not in options:
+        st.session_state[key] = options[min(default_index, len(options) - 1)] if options else None
+    return st.selectbox(label, options, key=key)
+
+
+def _has_cached(client, prompt: str, gen_config: Dict[str, Any]) -> bool:
+    """Đã có phản hồi trong cache chưa (chỉ đọc cache, lỗi thì coi như chưa) — an toàn khi render."""
+    try:
+        return client.peek_cache(prompt, gen_config) is not None
+    except Exception:
+        return False
+
+
+def _prefetch_yccd(
+    client,
+    gen_config: Dict[str, Any],
+    grade: str,
+    subject: str,
+    topic: str,
+    lesson: str,
+    lessons: List[str],
+) -> None:
+    """
+    Gợi ý YCCĐ trước (chạy nền) cho vài bài kế cận trong cùng chủ đề.
+    Bài chỉ được đánh dấu xong khi kết quả đã nằm trong cache; việc bị bỏ qua/lỗi sẽ được xếp lại lần sau.
+    """
+    if not client.ready() or YCCD_PREFETCH_LESSONS <= 0:
+        return
+    warmed = st.session_state.setdefault("yccd_prefetched", set())
+    todo: Dict[str, str] = {}
+    for ls in next_lessons(lessons, lesson):
+        key = f"{grade}|{subject}|{topic}|{ls}"
+        if key in warmed:
+            continue
+        prompt = prompt_extract_yccd(grade, subject, topic, ls)
+        if _has_cached(client, prompt, gen_config):
+            warmed.add(key)
+        else:
+            todo[key] = prompt
+    if todo:
+        try:
+            get_prefetcher().warm(client.api_key, todo, gen_config)
+        except Exception:
+            pass  # chạy trước chỉ là tối ưu: lỗi ở đây không được làm hỏng trang
+
+
+def render_tab_question_builder(
+    client,
+    curriculum,
+    curriculum_df: Optional[pd.DataFrame],
+    gen_config: Dict[str, Any],
+    curriculum_index: Optional[CurriculumIndex] = None,
+):
     st.header("✍️ Tab 2 — Soạn từng câu (GV chọn Chủ đề/Bài/YCCĐ/Dạng/Mức/Điểm)")
 
     if not curriculum and curriculum_df is None:
         st.warning("Chưa nạp dữ liệu CT (DOCX/Excel). Bạn có thể nạp DOCX ở Sidebar hoặc dùng dữ liệu mẫu.")
         st.info("Bạn vẫn có thể nhập tay Chủ đề/Bài ở dưới.")
 
+    index = curriculum_index if curriculum_index is not None else (CurriculumIndex(curriculum) if curriculum else None)
+
+    if index is not None:
+        query = st.text_input("🔎 Tìm bài học/chủ đề (gõ không dấu cũng được):", key="qb_search")
+        hits = index.search(query) if query else []
+        if query and not hits:
+            st.caption("Không tìm thấy bài phù hợp.")
+        if hits:
+            cs1, cs2 = st.columns([4, 1])
+            pick = cs1.selectbox(
+                "Kết quả:",
+                range(len(hits)),
+                format_func=lambda i: f"{hits[i][4] or '(chưa có bài)'} — {hits[i][3]} • {hits[i][0]} • {hits[i][1]} • {hits[i][2]}",
+            )
+            if cs2.button("Chọn bài này", key="qb_search_pick"):
+                for k, v in zip(["qb_grade", "qb_subject", "qb_hk", "qb_topic", "qb_lesson"], hits[pick]):
+                    st.session_state[k] = v
+                st.rerun()
+
     col1, col2, col3 = st.columns([1, 1.2, 1])
     with col1:
-        grade = st.selectbox("Lớp:", sorted(list(curriculum.keys())) if curriculum else ["Lớp 1","Lớp 2","Lớp 3","Lớp 4","Lớp 5"], index=4)
+        grade = _select("Lớp:", index.options() if index else ["Lớp 1", "Lớp 2", "Lớp 3", "Lớp 4", "Lớp 5"], "qb_grade", 4)
     with col2:
-        if curriculum and grade in curriculum:
-            subject = st.selectbox("Môn:", sorted(list(curriculum[grade].keys())))
+        if index and index.options(grade):
+            subject = _select("Môn:", index.options(grade), "qb_subject")
         else:
             subject = st.text_input("Môn:", value="Khoa học")
     with col3:
         semester = st.text_input("Học kì:", value="Học kì I")
 
-    if curriculum and grade in curriculum and subject in curriculum[grade]:
-        hk_dict = curriculum[grade][subject]
-        hk = st.selectbox("Chọn học kì trong dữ liệu:", sorted(list(hk_dict.keys())), index=0)
+    if index and index.options(grade, subject):
+        hk = _select("Chọn học kì trong dữ liệu:", index.options(grade, subject), "qb_hk")
         semester = hk
-        topics = sorted(list(hk_dict[hk].keys()))
-        topic = st.selectbox("Chủ đề:", topics)
-        lessons = hk_dict[hk][topic]
-        lesson = st.selectbox("Bài học:", lessons)
+        topic = _select("Chủ đề:", index.options(grade, subject, hk), "qb_topic")
+        lesson = _select("Bài học:", index.options(grade, subject, hk, topic), "qb_lesson")
+        _prefetch_yccd(client, gen_config, grade, subject, topic, lesson, index.options(grade, subject, hk, topic))
     else:
         topic = st.text_input("Chủ đề (nhập tay):", value="Chất và sự biến đổi")
         lesson = st.text_input("Bài học (nhập tay):", value="Hỗn hợp và dung dịch")
@@ -198,15 +514,18 @@ def render_tab_question_builder(client, curriculum, curriculum_df: Optional[pd.D
     st.subheader("YCCĐ (giáo viên nhập)")
     default_yccd = "• (GV nhập)"
     cache_key = f"{grade}|{subject}|{topic}|{lesson}"
+    yccd_prompt = prompt_extract_yccd(grade, subject, topic, lesson)
     if cache_key in st.session_state.get("yccd_cache", {}):
         default_yccd = st.session_state["yccd_cache"][cache_key]
+    elif client.ready() and _has_cached(client, yccd_prompt, gen_config):
+        st.caption("⚡ Đã có sẵn gợi ý YCCĐ cho bài này — bấm **Gợi ý YCCĐ** để dùng ngay.")
 
     yccd = st.text_area("YCCĐ:", value=default_yccd, height=110, help="Khuyến nghị: 4–6 gạch đầu dòng.")
     col_g1, col_g2 = st.columns([1, 2])
     with col_g1:
         if st.button("🧠 Gợi ý YCCĐ (tham khảo)", disabled=not client.ready()):
             with st.spinner("AI đang gợi ý YCCĐ..."):
-                res = client.generate(prompt_extract_yccd(grade, subject, topic, lesson), gen_config=gen_config)
+                res = client.generate(yccd_prompt, gen_config=gen_config)
             if res.error:
                 st.error(res.error)
             else:
@@ -217,50 +536,63 @@ def render_tab_question_builder(client, curriculum, curriculum_df: Optional[pd.D
         st.caption("🔎 YCCĐ là căn cứ CT2018. App ưu tiên GV tự nhập/duyệt. AI chỉ gợi ý để tiết kiệm thời gian.")
 
     st.subheader("Thiết lập câu hỏi")
-    q_types = [
-        "Trắc nghiệm (4 lựa chọn)",
-        "Đúng/Sai",
-        "Ghép nối (Nối cột)",
-        "Điền khuyết (Hoàn thành câu)",
-        "Tự luận ngắn",
-    ]
     cA, cB, cC = st.columns([1.4, 1, 0.7])
     with cA:
-        q_type = st.selectbox("Dạng câu hỏi:", q_types, index=2)
+        q_type = st.selectbox("Dạng câu hỏi:", Q_TYPES, index=2)
     with cB:
-        level = st.selectbox("Mức độ:", ["Mức 1: Biết", "Mức 2: Hiểu", "Mức 3: Vận dụng"], index=1)
+        level = st.selectbox("Mức độ:", LEVELS, index=1)
     with cC:
         points = st.number_input("Điểm:", min_value=0.25, max_value=10.0, value=1.0, step=0.25)
 
+    bank = get_question_bank()
+    st.session_state.setdefault("qb_bank_seen", [])
+    used_hashes = _exam_state().hashes()
+    use_bank = st.checkbox("📚 Ưu tiên câu có sẵn trong ngân hàng (không tốn lượt gọi AI)", value=True, key="qb_use_bank")
+    bank_hits = (
+        bank.find(grade, subject, topic, lesson, q_type, level, limit=50,
+                  exclude_hashes=set(used_hashes) | set(st.session_state["qb_bank_seen"]))
+        if use_bank else []
+    )
+    if bank_hits:
+        st.caption(f"📚 Ngân hàng có {len(bank_hits)} câu phù hợp (cùng bài/dạng/mức) chưa dùng.")
+    reject_dups = st.checkbox("🧬 Tự loại câu gần trùng với câu đã có trong đề", value=True, key="qb_reject_dups")
+
     def _gen_one():
-        seed = random.randint(1, 999999)
-        prompt = prompt_generate_one_question(grade, subject, topic, lesson, yccd, q_type, level, float(points), seed)
-        with st.spinner("AI đang tạo câu hỏi..."):
-            res = client.generate(prompt, gen_config=gen_config)
-        if res.error:
-            st.error(res.error)
+        exam_list = st.session_state["exam_list"]
+        while bank_hits:
+            hit = bank_hits.pop(0)
+            st.session_state["qb_bank_seen"].append(hit["content_hash"])
+            dup = find_in_exam(hit["content"], exam_list)
+            if reject_dups and dup is not None:
+                continue
+            st.session_state["current_preview"] = hit["content"]
+            st.session_state["temp_question_data"] = _question_record(
+                semester, grade, subject, topic, lesson, yccd, q_type, level, float(points), hit["content"], BANK_MODEL_LABEL
+            )
+            st.session_state["qb_dup_note"] = dup.describe() if dup else ""
+            return
+        if not client.ready():
+            st.warning("Hết câu phù hợp trong ngân hàng; cần API key để tạo câu mới.")
             return
-        text = res.text or ""
-        ok, errs = validate_question_format(text, q_type)
-        st.session_state["current_preview"] = text
-        st.session_state["temp_question_data"] = {
-            "semester": semester,
-            "grade": grade,
-            "subject": subject,
-            "topic": topic,
-            "lesson": lesson,
-            "yccd": yccd,
-            "type": q_type,
-            "level": level,
-            "points": float(points),
-            "content": text,
-            "model": res.model,
-            "format_ok": ok,
-            "format_errors": errs,
-        }
+        for _ in range(1 + (DUP_MAX_RETRIES if reject_dups else 0)):
+            seed = random.randint(1, 999999)
+            prompt = prompt_generate_one_question(grade, subject, topic, lesson, yccd, q_type, level, float(points), seed)
+            with st.spinner("AI đang tạo câu hỏi..."):
+                res = _stream_to_box(client.generate_stream(prompt, gen_config=gen_config))
+            if res.error:
+                st.error(res.error)
+                return
+            dup = find_duplicate(res.text or "", exam_list)
+            if not (reject_dups and dup is not None and dup.source == "exam"):
+                break
+        st.session_state["current_preview"] = res.text or ""
+        st.session_state["temp_question_data"] = _question_record(
+            semester, grade, subject, topic, lesson, yccd, q_type, level, float(points), res.text or "", res.model
+        )
+        st.session_state["qb_dup_note"] = dup.describe() if dup else ""
 
     colp1, colp2 = st.columns(2)
-    if colp1.button("✨ Tạo câu hỏi (Preview)", type="primary", disabled=not client.ready()):
+    if colp1.button("✨ Tạo câu hỏi (Preview)", type="primary", disabled=not (client.ready() or bank_hits)):
         _gen_one()
 
     if not client.ready():
@@ -273,27 +605,97 @@ def render_tab_question_builder(client, curriculum, curriculum_df: Optional[pd.D
         temp = st.session_state.get("temp_question_data") or {}
         if temp.get("format_ok") is False:
             st.warning("Câu hỏi có thể chưa đúng định dạng. Lỗi: " + "; ".join(temp.get("format_errors", [])))
+        if st.session_state.get("qb_dup_note"):
+            st.warning(f"🧬 Câu này {st.session_state['qb_dup_note']}.")
 
         colx, coly = st.columns(2)
-        if colx.button("✅ Thêm vào đề", disabled=(not st.session_state.get("temp_question_data"))):
-            st.session_state["exam_list"].append(st.session_state["temp_question_data"])
+        dup_in_exam = reject_dups and temp and find_in_exam(temp.get("content", ""), st.session_state["exam_list"])
+        if colx.button("✅ Thêm vào đề", disabled=(not temp) or bool(dup_in_exam)):
+            q = _exam_state().add(st.session_state["temp_question_data"])
+            if q.get("format_ok"):
+                bank.add(q)  # ngân hàng chỉ nhận câu đã đúng định dạng
             st.session_state["current_preview"] = ""
             st.session_state["temp_question_data"] = None
+            st.session_state["qb_dup_note"] = ""
             st.success("Đã thêm câu vào đề.")
             st.rerun()
 
-        if coly.button("🔄 Tạo câu khác", disabled=not client.ready()):
+        if coly.button("🔄 Tạo câu khác", disabled=not (client.ready() or bank_hits)):
             _gen_one()
             st.rerun()
 
-    if st.session_state.get("exam_list"):
+    with st.expander("⚡ Tạo hàng loạt theo bảng (nhiều câu trong 1 lần chạy)"):
+        st.caption("Mỗi dòng là 1 câu. Các câu được sinh song song; câu đạt định dạng sẽ tự thêm vào đề.")
+        blueprint = pd.DataFrame([{
+            "Chủ đề": topic,
+            "Bài học": lesson,
+            "YCCĐ": yccd,
+            "Dạng": q_type,
+            "Mức": level,
+            "Điểm": float(points),
+        }])
+        edited_bp = st.data_editor(
+            blueprint,
+            num_rows="dynamic",
+            use_container_width=True,
+            key="qb_blueprint",
+            column_config={
+                "Dạng": st.column_config.SelectboxColumn("Dạng", options=Q_TYPES, required=True),
+                "Mức": st.column_config.SelectboxColumn("Mức", options=LEVELS, required=True),
+                "Điểm": st.column_config.NumberColumn("Điểm", min_value=0.25, max_value=10.0, step=0.25),
+            },
+        )
+        if st.button("🚀 Tạo cả bảng", disabled=not client.ready(), key="qb_batch_run"):
+            specs = [
+                {
+                    "topic": str(r.get("Chủ đề") or topic),
+                    "lesson": str(r.get("Bài học") or lesson),
+                    "yccd": str(r.get("YCCĐ") or ""),
+                    "type": str(r.get("Dạng") or q_type),
+                    "level": str(r.get("Mức") or level),
+                    "points": float(r.get("Điểm")) if pd.notna(r.get("Điểm")) else float(points),
+                }
+                for _, r in edited_bp.iterrows()
+            ]
+            with st.spinner(f"AI đang tạo {len(specs)} câu song song..."):
+                accepted, errors = generate_question_batch(
+                    client, specs, semester, grade, subject, gen_config,
+                    bank=bank if use_bank else None, exclude_hashes=used_hashes,
+                    existing=st.session_state["exam_list"] if reject_dups else None,
+                )
+            _exam_state().extend(accepted)
+            for rec in accepted:
+                if rec.get("format_ok"):
+                    bank.add(rec)
+            if accepted:
+                st.success(f"Đã thêm {len(accepted)}/{len(specs)} câu vào đề.")
+            if errors:
+                st.warning("Bỏ qua: " + "; ".join(errors))
+
+    with st.expander(f"🔎 Tìm trong ngân hàng câu hỏi ({bank.count()} câu)"):
+        bq = st.text_input("Từ khoá (nội dung/chủ đề/bài, gõ không dấu được):", key="qb_bank_query")
+        for row in bank.search(bq, limit=10) if bq else []:
+            st.markdown(f"**{row['lesson']}** • {row['type']} • {row['level']} • {row['grade']} {row['subject']}")
+            _box(row["content"])
+            if st.button("➕ Thêm câu này vào đề", key=f"qb_bank_add_{row['id']}"):
+                _exam_state().add(_question_record(
+                    row["semester"] or semester, row["grade"], row["subject"], row["topic"], row["lesson"],
+                    row["yccd"], row["type"], row["level"], float(row["points"] or points), row["content"], BANK_MODEL_LABEL,
+                ))
+                st.rerun()
+
+    state = _exam_state()
+    if len(state):
         st.divider()
-        st.subheader(f"Đề hiện có: {len(st.session_state['exam_list'])} câu — Tổng điểm: {total_points(st.session_state['exam_list']):.2f}")
-        for i, q in enumerate(list(st.session_state["exam_list"]), start=1):
-            with st.expander(f"Câu {i} • {q.get('type')} • {q.get('points')}đ • {q.get('level')}"):
+        st.subheader(f"Đề hiện có: {len(state)} câu — Tổng điểm: {state.total:.2f}")
+        st.caption(" • ".join(f"{lv}: {b.count} câu/{b.points:g}đ" for lv, b in sorted(state.by_level.items())))
+        pages = (len(state) - 1) // EXAM_PAGE_SIZE + 1
+        page = st.number_input("Trang", 1, pages, 1, key="qb_exam_page") - 1 if pages > 1 else 0
+        for i, q in state.page(page, EXAM_PAGE_SIZE):
+            with st.expander(f"Câu {i + 1} • {q.get('type')} • {q.get('points')}đ • {q.get('level')}"):
                 st.write(q.get("content", ""))
-                if st.button("🗑️ Xoá câu này", key=f"del_q_{i}"):
-                    st.session_state["exam_list"].pop(i-1)
+                if st.button("🗑️ Xoá câu này", key=f"del_q_{q['_id']}"):
+                    state.remove_id(q["_id"])
                     st.rerun()
 
 
@@ -304,61 +706,44 @@ def render_tab_matrix_export(school_name: str, curriculum_df: Optional[pd.DataFr
         st.info("Chưa có câu hỏi. Hãy tạo câu ở Tab 2 hoặc sinh đề ở Tab 1.")
         return
 
-    first = st.session_state["exam_list"][0]
+    state = _exam_state()
+    first = state.items[0]
     subject = first.get("subject", "Môn")
     grade = first.get("grade", "Lớp")
 
-    matrix_data = []
-    for i, q in enumerate(st.session_state["exam_list"]):
-        matrix_data.append({
-            "STT": i + 1,
-            "Học kì": q.get("semester", ""),
-            "Lớp": q.get("grade", ""),
-            "Môn": q.get("subject", ""),
-            "Chủ đề": q.get("topic", ""),
-            "Bài học": q.get("lesson", ""),
-            "YCCĐ": q.get("yccd", ""),
-            "Dạng": q.get("type", ""),
-            "Mức": q.get("level", ""),
-            "Điểm": q.get("points", 0),
-            "Nội dung": q.get("content", ""),
-        })
-    df = pd.DataFrame(matrix_data)
-
     st.subheader("Bảng câu hỏi (có thể chỉnh trực tiếp)")
-    edited = st.data_editor(df, num_rows="fixed", use_container_width=True, key="mx_editor")
+    # edited_rows của data_editor tính theo vị trí dòng => key đổi theo thứ tự câu, thêm/xoá câu là bỏ ô sửa dở
+    editor_key = f"mx_editor_{state.rows_key()}"
+    for k in [k for k in st.session_state if str(k).startswith("mx_editor_") and k != editor_key]:
+        del st.session_state[k]
+    edited = st.data_editor(state.dataframe(), num_rows="fixed", use_container_width=True, disabled=["STT"], key=editor_key)
 
     col1, col2, col3 = st.columns([1, 1, 1.2])
     if col1.button("💾 Lưu thay đổi", type="primary"):
-        for i, row in edited.iterrows():
-            if i < len(st.session_state["exam_list"]):
-                st.session_state["exam_list"][i].update({
-                    "semester": row.get("Học kì", ""),
-                    "grade": row.get("Lớp", ""),
-                    "subject": row.get("Môn", ""),
-                    "topic": row.get("Chủ đề", ""),
-                    "lesson": row.get("Bài học", ""),
-                    "yccd": row.get("YCCĐ", ""),
-                    "type": row.get("Dạng", ""),
-                    "level": row.get("Mức", ""),
-                    "points": float(row.get("Điểm", 0) or 0),
-                    "content": row.get("Nội dung", ""),
-                })
-        st.success("Đã lưu thay đổi.")
+        # Chỉ áp các ô đã sửa (edited_rows của data_editor); không có thì so từng ô với bảng gốc
+        editor_state = st.session_state.get(editor_key)
+        edits = editor_state.get("edited_rows") if isinstance(editor_state, dict) else None
+        if edits is None:
+            edits = diff_frames(state.dataframe(), edited)
+        changed = state.apply_cell_edits(edits)
+        st.success(f"Đã lưu thay đổi ({len(changed)} câu)." if changed else "Không có thay đổi.")
         st.rerun()
 
-    ok, errs = validate_exam_list(st.session_state["exam_list"])
-    if not ok:
+    errs = state.errors()
+    if errs:
         st.warning("Kiểm tra nhanh: " + "; ".join(errs))
+    bad_format = state.format_issues()
+    if bad_format:
+        st.caption("⚠️ Câu chưa đúng định dạng theo dạng câu hỏi: " + ", ".join(map(str, bad_format)))
 
     exam_term = col2.text_input("Tên kỳ kiểm tra (in trên đề):", value="ĐỀ KIỂM TRA CUỐI HỌC KÌ", key="exam_term_export")
 
-    doc_exam = create_exam_docx(
+    doc_exam = exam_docx_bytes(
         school_name=school_name,
         subject=subject,
         grade=grade,
         exam_term=exam_term,
-        exam_list=st.session_state["exam_list"],
+        exam_list=state.items,
         include_answers=False,
     )
     col3.download_button(
@@ -369,12 +754,12 @@ def render_tab_matrix_export(school_name: str, curriculum_df: Optional[pd.DataFr
         type="primary",
     )
 
-    doc_ans = create_exam_docx(
+    doc_ans = exam_docx_bytes(
         school_name=school_name,
         subject=subject,
         grade=grade,
         exam_term=exam_term,
-        exam_list=st.session_state["exam_list"],
+        exam_list=state.items,
         include_answers=True,
     )
     st.download_button(
@@ -384,7 +769,7 @@ def render_tab_matrix_export(school_name: str, curriculum_df: Optional[pd.DataFr
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
     )
 
-    matrix_doc = create_matrix_docx(subject=subject, grade=grade, exam_list=st.session_state["exam_list"])
+    matrix_doc = matrix_docx_bytes(subject=subject, grade=grade, exam_list=state.items)
     st.download_button(
         "📥 Tải WORD (Bảng ma trận)",
         matrix_doc,
@@ -392,6 +777,42 @@ def render_tab_matrix_export(school_name: str, curriculum_df: Optional[pd.DataFr
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
     )
 
+    with st.expander("📦 Xuất hàng loạt (nhiều mã đề × nhiều lớp → 1 file zip)"):
+        cb1, cb2, cb3 = st.columns([1.2, 1, 0.6])
+        classes_raw = cb1.text_input("Các lớp (cách nhau dấu phẩy):", value="", key="bulk_classes", help="Bỏ trống = không in tên lớp")
+        codes_raw = cb2.text_input("Các mã đề:", value="A, B, C, D", key="bulk_codes")
+        base_seed = int(cb3.number_input("Seed:", min_value=0, value=2018, step=1, key="bulk_seed"))
+        cc1, cc2, cc3 = st.columns(3)
+        with_answers = cc1.checkbox("Kèm bản có đáp án", value=True, key="bulk_answers")
+        include_matrix = cc2.checkbox("Kèm bảng ma trận", value=True, key="bulk_matrix")
+        shuffle_choices = cc3.checkbox("Đảo A/B/C/D câu trắc nghiệm", value=True, key="bulk_shuffle_choices")
+
+        classes = [c.strip() for c in classes_raw.split(",") if c.strip()] or [""]
+        codes = [c.strip() for c in codes_raw.split(",") if c.strip()]
+        if st.button("📦 Tạo file zip", disabled=not codes, key="bulk_run"):
+            # Cùng mã đề => cùng thứ tự câu ở mọi lớp
+            variants = [
+                VariantSpec(code=code, class_name=cls, seed=base_seed * 1000 + i, shuffle_choices=shuffle_choices)
+                for cls in classes
+                for i, code in enumerate(codes)
+            ]
+            with st.spinner(f"Đang dựng {len(variants) * (2 if with_answers else 1) + int(include_matrix)} file Word..."):
+                zip_bytes, report = bulk_export_zip(
+                    school_name, subject, grade, exam_term, state.items,
+                    variants, with_answers=with_answers, include_matrix=include_matrix,
+                )
+            st.session_state["bulk_zip"] = (zip_bytes, report)
+        if st.session_state.get("bulk_zip"):
+            zip_bytes, report = st.session_state["bulk_zip"]
+            st.download_button(
+                "📥 Tải file zip",
+                zip_bytes,
+                file_name=f"De_{subject}_{grade}_hang_loat.zip".replace(" ", "_"),
+                mime="application/zip",
+                key="bulk_download",
+            )
+            st.dataframe(pd.DataFrame(report), use_container_width=True)
+
     if curriculum_df is not None and not curriculum_df.empty:
         with st.expander("Xem dữ liệu CT đã nạp (preview)"):
             st.dataframe(curriculum_df.head(50), use_container_width=True)
@@ -1,71 +1,47 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import re
-from typing import Dict, List, Tuple
+from typing import List, Optional, Tuple
 
+from modules.question_model import ParsedQuestion, is_multiple_choice, parse_question
 
-def validate_question_format(text: str, q_type: str) -> Tuple[bool, List[str]]:
+
+def validate_question_format(
+    text: str, q_type: str, parsed: Optional[ParsedQuestion] = None
+) -> Tuple[bool, List[str]]:
     errors: List[str] = []
-    t = (text or "").strip()
-    if not t:
+    if not (text or "").strip():
         return False, ["Nội dung câu hỏi rỗng."]
+    p = parsed if parsed is not None and parsed.source == text else parse_question(text)
 
     qt = (q_type or "").lower()
 
-    if "trắc nghiệm" in qt or "4 lựa chọn" in qt:
+    if is_multiple_choice(qt):
         for opt in ["A.", "B.", "C.", "D."]:
-            if opt not in t:
+            if opt not in p.markers:
                 errors.append(f"Thiếu lựa chọn {opt}")
-        m = re.search(r"(?im)^\s*đáp\s*án\s*:\s*([abcd])\s*$", t)
-        if not m:
+        if not p.mc_answer:
             errors.append("Thiếu hoặc sai dòng 'Đáp án: A/B/C/D'")
 
     elif "đúng/sai" in qt or "dung/sai" in qt:
-        if "đáp án" not in t.lower():
+        if not p.has_answer_label:
             errors.append("Nên có phần 'Đáp án:' cho Đúng/Sai để xuất đề ổn định.")
 
     elif "ghép" in qt or "nối cột" in qt or "noi cot" in qt:
-        if "cột a" not in t.lower() or "cột b" not in t.lower():
+        if not p.has_columns:
             errors.append("Thiếu 'Cột A' hoặc 'Cột B'.")
-        if "đáp án" not in t.lower():
+        if not p.has_answer_label:
             errors.append("Thiếu 'Đáp án:' (dạng 1-b;2-a...).")
 
     elif "điền khuyết" in qt or "hoàn thành" in qt or "dien khuyet" in qt:
-        if "......" not in t and "…" not in t and "___" not in t:
+        if not p.has_blank:
             errors.append("Câu điền khuyết nên có chỗ trống (...... hoặc ___).")
-        if "đáp án" not in t.lower():
+        if not p.has_answer_label:
             errors.append("Thiếu 'Đáp án:' cho câu điền khuyết.")
 
     else:
-        if "đáp án" not in t.lower() and "gợi ý" not in t.lower():
+        if not p.has_answer_label and not p.has_hint:
             errors.append("Khuyến nghị có 'Đáp án:' hoặc 'Gợi ý chấm' để xuất đề ổn định.")
 
     return (len(errors) == 0), errors
 
-
-def validate_exam_list(exam_list: List[Dict]) -> Tuple[bool, List[str]]:
-    errors: List[str] = []
-    if not exam_list:
-        return False, ["Chưa có câu hỏi nào trong đề."]
-
-    total = 0.0
-    for i, q in enumerate(exam_list, start=1):
-        try:
-            total += float(q.get("points", 0) or 0)
-        except Exception:
-            errors.append(f"Câu {i}: điểm không hợp lệ.")
-
-    if total <= 0:
-        errors.append("Tổng điểm = 0. Bạn hãy nhập điểm cho từng câu.")
-    return (len(errors) == 0), errors
-
-
-def total_points(exam_list: List[Dict]) -> float:
-    s = 0.0
-    for q in exam_list:
-        try:
-            s += float(q.get("points", 0) or 0)
-        except Exception:
-            pass
-    return s
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List
+
+from modules.question_model import MC_ANSWER_RE, get_parsed, is_multiple_choice, parse_question, strip_number
+
+OPTION_LABELS = ["A", "B", "C", "D"]
+
+
+def shuffle_options(content: str, rng: random.Random) -> str:
+    """
+    Đảo thứ tự 4 lựa chọn A-D của câu trắc nghiệm và sửa dòng "Đáp án:" cho khớp.
+    Câu không đúng khuôn (thiếu lựa chọn, nhiều lựa chọn trên 1 dòng, thiếu đáp án) giữ nguyên.
+    """
+    p = parse_question(content)
+    if [o[0] for o in p.options] != OPTION_LABELS or not p.mc_answer:
+        return content
+    correct = OPTION_LABELS.index(p.mc_answer)
+
+    perm = list(range(len(OPTION_LABELS)))
+    rng.shuffle(perm)
+    lines = content.splitlines()
+    for k, i in enumerate(p.option_lines):
+        _, text, sep = p.options[perm[k]]
+        indent = lines[i][: len(lines[i]) - len(lines[i].lstrip())]
+        lines[i] = f"{indent}{OPTION_LABELS[k]}{sep} {text}".rstrip()
+    new_label = OPTION_LABELS[perm.index(correct)]
+    return MC_ANSWER_RE.sub(lambda mm: f"{mm.group(1)}{new_label}", "\n".join(lines))
+
+
+def make_variant(
+    exam_list: List[Dict[str, Any]],
+    seed: int,
+    shuffle_questions: bool = True,
+    shuffle_choices: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Sinh 1 mã đề từ đề gốc, không gọi API: đảo thứ tự câu và đảo A/B/C/D trong câu trắc nghiệm.
+    Cùng seed => cùng kết quả (tái lập được). Không sửa đề gốc.
+    Bỏ "Câu n:" cũ ở đầu nội dung để file Word đánh số lại theo thứ tự mới (khớp bảng đáp án).
+    """
+    rng = random.Random(seed)
+    order = list(range(len(exam_list)))
+    if shuffle_questions:
+        rng.shuffle(order)
+
+    out: List[Dict[str, Any]] = []
+    for i in order:
+        q = dict(exam_list[i])
+        if get_parsed(q).numbered:
+            q["content"] = strip_number(q["content"])
+        if shuffle_choices and is_multiple_choice(q.get("type", "")):
+            q["content"] = shuffle_options(q.get("content", ""), random.Random(f"{seed}:{i}"))
+        out.append(q)
+    return out
+
+
+def make_variants(
+    exam_list: List[Dict[str, Any]],
+    codes: List[str],
+    base_seed: int = 0,
+    shuffle_questions: bool = True,
+    shuffle_choices: bool = True,
+) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        code: make_variant(exam_list, base_seed * 1000 + i, shuffle_questions, shuffle_choices)
+        for i, code in enumerate(codes)
+    }
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+# Chạy pytest từ dekiemtra_v2/ hay từ gốc repo đều import được package modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+import modules.ai_client as ac
+
+
+@pytest.fixture
+def discovery(monkeypatch):
+    calls = []
+
+    def fake(api_key):
+        calls.append(api_key)
+        if api_key == "bad":
+            raise RuntimeError("403 API key not valid")
+        return [] if api_key == "empty" else ["models/gemini-1.5-flash"]
+
+    monkeypatch.setattr(ac, "_discover_models", fake)
+    return calls
+
+
+def test_catalog_caches_failures_and_empty_lists(discovery):
+    catalog = ac._ModelCatalog(failure_ttl_seconds=60)
+    assert [catalog.get("bad") for _ in range(3)] == [[], [], []]
+    assert [catalog.get("empty") for _ in range(3)] == [[], [], []]
+    assert discovery == ["bad", "empty"]
+    assert "403" in catalog.last_error("bad") and catalog.last_error("empty") is None
+    assert catalog.cached("bad") == [] and catalog.cached("never") is None
+
+
+def test_catalog_retries_after_failure_ttl(discovery):
+    catalog = ac._ModelCatalog(failure_ttl_seconds=0)
+    catalog.get("bad")
+    catalog.get("bad")
+    assert discovery == ["bad", "bad"]
+    assert catalog.get("good") == catalog.get("good") == ["models/gemini-1.5-flash"]
+    assert discovery.count("good") == 1
+
+
+def test_peek_cache_never_calls_discovery(discovery, monkeypatch):
+    lookups = []
+    monkeypatch.setattr(ac, "_MODEL_CATALOG", ac._ModelCatalog())
+    monkeypatch.setattr(ac, "get_response_cache", lambda: type("C", (), {
+        "lookup": staticmethod(lambda prompt, models, cfg, count=True: lookups.append(models) or ("m", "cached")),
+    })())
+    client = ac.GeminiClient("good")
+    assert client.peek_cache("Gợi ý YCCĐ") is None          # chưa có danh sách model => không gọi mạng
+    assert discovery == [] and lookups == []
+    ac._MODEL_CATALOG.get("good")
+    assert client.peek_cache("Gợi ý YCCĐ").text == "cached"
+    assert ac.GeminiClient("bad").peek_cache("x") is None
+    assert discovery == ["good"]
+
+
+def test_cancelled_async_acquire_leaves_the_queue():
+    limiter = ac.RateLimiter(rpm=60, tpm=1_000_000, headroom=1.0)
+    limiter._req = 0.0  # hết quota request: phải chờ ~1 giây
+
+    async def scenario():
+        waiter = asyncio.ensure_future(limiter.aacquire(1, "s1", timeout=30))
+        await asyncio.sleep(0.05)
+        assert dict((k, len(q)) for k, q in limiter._queues.items()) == {"s1": 1}
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not limiter._queues
+        return await limiter.aacquire(1, "s2", timeout=2)
+
+    assert asyncio.run(scenario()) is True
+    assert not limiter._queues
+
+
+def test_async_and_sync_acquire_share_the_bucket():
+    limiter = ac.RateLimiter(rpm=2, tpm=1_000_000, headroom=1.0)
+    assert limiter.acquire(1, "a", timeout=0)
+    assert asyncio.run(limiter.aacquire(1, "b", timeout=0))
+    assert not limiter.acquire(1, "a", timeout=0)
+    assert not asyncio.run(limiter.aacquire(1, "b", timeout=0))
+    limiter.refund(1)
+    assert asyncio.run(limiter.aacquire(1, "b", timeout=0))
+
+
+class _CodedError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def test_error_classification_uses_status_code_first():
+    not_found = _CodedError(404, "models/gemini-x is not found for API version v1beta, or is not supported for generateContent")
+    assert not ac._is_rate_limited(not_found) and not ac._is_transient(not_found)
+    bad_request = _CodedError(400, "Invalid quota project")
+    assert not ac._is_rate_limited(bad_request)
+    exhausted = _CodedError(429, "Resource has been exhausted")
+    assert ac._is_rate_limited(exhausted) and ac._is_transient(exhausted)
+    assert ac._is_transient(_CodedError(503, "The model is overloaded"))
+
+
+def test_error_classification_text_fallback_matches_whole_words():
+    assert not ac._is_rate_limited(RuntimeError("400 generateContent: invalid argument"))
+    assert not ac._is_transient(RuntimeError("Failed to generate content (moderate)"))
+    assert not ac._is_rate_limited(RuntimeError("request id 14290 failed"))
+    assert ac._is_rate_limited(RuntimeError("429 Too Many Requests"))
+    assert ac._is_rate_limited(RuntimeError("RESOURCE_EXHAUSTED: rate limit reached"))
+    assert ac._is_transient(RuntimeError("Deadline Exceeded"))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("docx")
+
+from modules.data_loader import load_curriculum_from_table  # noqa: E402
+
+
+def test_csv_with_short_title_row():
+    data = (
+        "KẾ HOẠCH DẠY HỌC NĂM HỌC 2024-2025\n"
+        "\n"
+        "Học kì,Lớp,Môn,Chủ đề,Tên bài học,Tiết\n"
+        "Học kì I,Lớp 5,Khoa học,Chất,\"Hỗn hợp, dung dịch\",2\n"
+        "Học kì I,Lớp 5,Khoa học,Chất,Tách chất\n"
+    ).encode("utf-8-sig")
+    df, nested, _ = load_curriculum_from_table("ct.csv", data)
+    assert df["bai"].tolist() == ["Hỗn hợp, dung dịch", "Tách chất"]
+    assert df["tiet"].tolist() == ["2", ""]
+    assert nested["Lớp 5"]["Khoa học"]["Học kì I"]["Chất"] == ["Hỗn hợp, dung dịch", "Tách chất"]
+
+
+def test_unreadable_csv_returns_warning():
+    df, nested, warn = load_curriculum_from_table("ct.csv", "Lớp;Môn\n".encode("utf-16"))
+    assert df.empty and nested == {} and warn.startswith("Lỗi đọc file")
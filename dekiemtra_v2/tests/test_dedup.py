@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from modules.dedup import DedupIndex, find_in_exam, signature, similarity
+
+Q1 = "Câu 1: Một cửa hàng có 25 quả cam, bán đi 12 quả. Hỏi cửa hàng còn lại bao nhiêu quả cam?\nĐáp án: 13"
+Q1_RENUMBERED = "Câu 7: Một cửa hàng có 25 quả cam, bán đi 12 quả. Hỏi cửa hàng còn lại bao nhiêu quả cam?\nĐáp án: 13 quả"
+Q2 = "Câu 2: Vẽ đoạn thẳng AB dài 5 cm rồi đánh dấu trung điểm M của đoạn thẳng đó.\nĐáp án: AM = 2,5 cm"
+
+
+def test_signature_is_stable_and_ignores_numbering_and_answer():
+    assert similarity(signature(Q1), signature(Q1_RENUMBERED)) == 1.0
+    assert similarity(signature(Q1), signature(Q2)) < 0.3
+
+
+def test_find_in_exam():
+    exam = [{"content": Q2}, {"content": Q1}]
+    hit = find_in_exam(Q1_RENUMBERED, exam)
+    assert hit is not None and hit.source == "exam" and hit.ref == 2
+    assert find_in_exam(Q2, [{"content": Q1}]) is None
+    assert find_in_exam(Q1, []) is None
+
+
+def test_empty_bodies_are_never_duplicates():
+    empty = ["", "   ", "Câu 3:", "Đáp án: A", "...."]
+    assert all(signature(t).size == 0 for t in empty)
+    assert find_in_exam("", [{"content": t} for t in empty]) is None
+    assert find_in_exam(Q1, [{"content": ""}, {"content": Q1}]).ref == 2
+    idx = DedupIndex()
+    for i, t in enumerate(empty):
+        idx.add(i, t)
+    assert len(idx) == 0 and idx.query("") is None
+
+
+def test_index_query():
+    idx = DedupIndex()
+    idx.add(10, Q1)
+    idx.add(11, Q2)
+    key, sim = idx.query(Q1_RENUMBERED)
+    assert key == 10 and sim >= 0.8
+    assert idx.query("Câu 5: Kể tên ba loài động vật sống dưới nước mà em biết.") is None
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import io
+import zipfile
+
+import pytest
+
+from modules import docx_reader
+from modules.docx_reader import iter_docx_table_rows, read_docx_table_rows
+
+_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _cell(text="", span=1, vmerge=None, extra=""):
+    props = ""
+    if span > 1:
+        props += f'<w:gridSpan w:val="{span}"/>'
+    if vmerge is not None:
+        props += f'<w:vMerge w:val="{vmerge}"/>' if vmerge else "<w:vMerge/>"
+    paras = "".join(f"<w:p><w:r><w:t>{line}</w:t></w:r></w:p>" for line in text.split("\n")) if text else "<w:p/>"
+    return f"<w:tc><w:tcPr>{props}</w:tcPr>{paras}{extra}</w:tc>"
+
+
+def _table(*rows):
+    return "<w:tbl>" + "".join("<w:tr>" + "".join(r) + "</w:tr>" for r in rows) + "</w:tbl>"
+
+
+def _docx(*blocks):
+    xml = f'<?xml version="1.0" encoding="UTF-8"?><w:document {_NS}><w:body>{"".join(blocks)}</w:body></w:document>'
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("word/document.xml", xml)
+    return buf.getvalue()
+
+
+def test_merged_cells_follow_python_docx():
+    data = _docx(
+        "<w:p><w:r><w:t>MA TRẬN ĐỀ</w:t></w:r></w:p>",
+        _table(
+            [_cell("Chủ đề", vmerge="restart"), _cell("Mức 1", span=2)],
+            [_cell(vmerge=""), _cell("TN"), _cell("TL")],
+            [_cell(" Số học "), _cell("2"), _cell("")],
+        ),
+    )
+    assert list(iter_docx_table_rows(data)) == [
+        ["Chủ đề", "Mức 1", "Mức 1"],
+        ["Chủ đề", "TN", "TL"],
+        ["Số học", "2", ""],
+    ]
+
+
+def test_runs_breaks_hyperlinks_and_multiple_paragraphs():
+    cell = (
+        '<w:tc><w:p><w:r><w:t>Số</w:t><w:tab/><w:t>câu</w:t><w:br/><w:t>TN</w:t></w:r>'
+        '<w:hyperlink><w:r><w:t> (xem)</w:t></w:r></w:hyperlink></w:p>'
+        "<w:p><w:r><w:t>dòng 2</w:t></w:r></w:p></w:tc>"
+    )
+    assert list(iter_docx_table_rows(_docx(_table([cell])))) == [["Số\tcâu\nTN (xem)\ndòng 2"]]
+
+
+def test_nested_tables_are_not_rows_and_tables_reset_merges():
+    nested = _table([_cell("lồng")])
+    data = _docx(
+        _table([_cell("A", vmerge="restart", extra=nested), _cell("B")]),
+        _table([_cell(vmerge=""), _cell("C")]),
+    )
+    # ô vMerge "continue" đầu bảng mới không kế thừa từ bảng trước
+    assert list(iter_docx_table_rows(data)) == [["A", "B"], ["", "C"]]
+
+
+def test_read_rows_fast_path():
+    data = _docx(_table([_cell("x"), _cell("y")]), "<w:p/>")
+    assert read_docx_table_rows(data) == [["x", "y"]]
+
+
+def test_bad_zip_falls_back_to_python_docx(monkeypatch):
+    calls = []
+
+    def fake(data):
+        calls.append(data)
+        return [["dự phòng"]]
+
+    monkeypatch.setattr(docx_reader, "_python_docx_rows", fake)
+    assert read_docx_table_rows(b"not a zip") == [["dự phòng"]]
+    missing_body = io.BytesIO()
+    with zipfile.ZipFile(missing_body, "w") as zf:
+        zf.writestr("word/other.xml", "<x/>")
+    assert read_docx_table_rows(missing_body.getvalue()) == [["dự phòng"]]
+    assert read_docx_table_rows(_docx(_table([_cell("x")])), fast=False) == [["dự phòng"]]
+    assert len(calls) == 3
+
+
+def test_fast_reader_matches_python_docx():
+    docx = pytest.importorskip("docx")
+    doc = docx.Document()
+    doc.add_paragraph("MA TRẬN ĐỀ")
+    t = doc.add_table(rows=4, cols=4)
+    t.cell(0, 0).text = "Chủ đề"
+    t.cell(0, 0).merge(t.cell(1, 0))          # gộp dọc
+    t.cell(0, 1).text = "Mức 1"
+    t.cell(0, 1).merge(t.cell(0, 2))          # gộp ngang
+    t.cell(1, 1).text = "TN"
+    t.cell(1, 2).text = "TL"
+    t.cell(2, 0).text = " Số học "
+    t.cell(2, 1).text = "2"
+    t.cell(2, 3).add_paragraph("đoạn 2")      # ô có nhiều đoạn (đoạn đầu rỗng)
+    t.cell(3, 0).merge(t.cell(3, 3))          # cả dòng gộp
+    t.cell(3, 0).paragraphs[0].add_run("Tổng")
+    t.cell(2, 2).add_table(rows=1, cols=2).cell(0, 0).text = "lồng"
+    second = doc.add_table(rows=2, cols=2)
+    second.cell(0, 0).merge(second.cell(1, 0))
+    second.cell(0, 1).text = "B"
+    buf = io.BytesIO()
+    doc.save(buf)
+    data = buf.getvalue()
+
+    fast = read_docx_table_rows(data, fast=True)
+    assert fast == docx_reader._python_docx_rows(data)
+    assert fast[0][:3] == ["Chủ đề", "Mức 1", "Mức 1"]
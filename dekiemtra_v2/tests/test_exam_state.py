@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from modules.exam_state import ExamState, diff_frames
+from modules.question_bank import question_hash
+
+MC = "Trắc nghiệm (4 lựa chọn)"
+ESSAY = "Tự luận ngắn"
+
+
+def _q(content, points=1.0, q_type=ESSAY, level="Mức 1: Biết"):
+    return {"content": content, "points": points, "type": q_type, "level": level}
+
+
+def _fresh_totals(state):
+    rebuilt = ExamState([dict(q) for q in state.items])
+    return rebuilt.total, {k: (b.count, b.points) for k, b in rebuilt.by_level.items()}
+
+
+def test_incremental_totals_match_rebuild():
+    state = ExamState()
+    state.extend([_q("Câu 1: a\nĐáp án: 1", 1), _q("Câu 2: b\nĐáp án: 2", 2, level="Mức 2: Hiểu")])
+    state.add(_q("Câu 3: c\nĐáp án: 3", 0.5))
+    state.update(0, {"points": 3.0, "level": "Mức 3: Vận dụng"})
+    state.remove(1)
+    assert state.total == pytest.approx(3.5)
+    assert (state.total, {k: (b.count, b.points) for k, b in state.by_level.items()}) == _fresh_totals(state)
+    assert state.errors() == []
+
+
+def test_errors_and_format_issues():
+    state = ExamState([_q("Câu 1: chọn đáp án đúng", 0, q_type=MC), _q("Câu 2: x\nĐáp án: y", "abc")])
+    assert state.format_issues() == [1]
+    errs = state.errors()
+    assert "Câu 2: điểm không hợp lệ." in errs and any("Tổng điểm = 0" in e for e in errs)
+    state.update(0, {"content": "Câu 1: 1 + 1 = ?\nA. 1\nB. 2\nC. 3\nD. 4\nĐáp án: B", "points": 1})
+    assert state.format_issues() == [] and state.items[0]["format_ok"] is True
+    assert ExamState().errors() == ["Chưa có câu hỏi nào trong đề."]
+
+
+def test_update_without_change_is_noop():
+    state = ExamState([_q("Câu 1: a\nĐáp án: 1")])
+    v = state.version
+    assert state.update(0, {"points": 1.0}) is False
+    assert state.version == v
+
+
+def test_consistent_detects_outside_changes():
+    items = [_q("Câu 1: a"), _q("Câu 2: b")]
+    state = ExamState(items)
+    assert state.consistent()
+    items[1] = _q("Câu 2: thay ngoài ExamState")  # cùng số câu nhưng dict khác
+    assert not state.consistent()
+    state = ExamState(items)
+    items.append(items.pop(0))                   # đổi thứ tự vẫn là các câu đã đăng ký
+    assert state.consistent()
+    items.pop()
+    assert not state.consistent()
+
+
+def test_dataframe_is_a_copy():
+    state = ExamState([_q("Câu 1: a", 1), _q("Câu 2: b", 2)])
+    df = state.dataframe()
+    state.update(1, {"points": 5.0})
+    assert df.at[1, "Điểm"] == 2
+    assert state.dataframe().at[1, "Điểm"] == 5
+    assert list(state.dataframe()["STT"]) == [1, 2]
+
+
+def test_apply_cell_edits_only_touches_changed_rows():
+    state = ExamState([_q("Câu 1: a", 1), _q("Câu 2: b", 2), _q("Câu 3: c", 3)])
+    changed = state.apply_cell_edits({"0": {"Điểm": 1.0}, 2: {"Điểm": "4", "Mức": "Mức 2: Hiểu", "STT": 9}, 7: {"Điểm": 1}})
+    assert changed == [2]
+    assert state.items[2]["points"] == 4.0 and state.items[2]["level"] == "Mức 2: Hiểu"
+    assert state.total == pytest.approx(7.0)
+
+
+def test_diff_frames_matches_edited_rows_shape():
+    state = ExamState([_q("Câu 1: a", 1), _q("Câu 2: b", 2)])
+    base = state.dataframe()
+    edited = base.copy()
+    edited.at[1, "Nội dung"] = "Câu 2: b đã sửa"
+    edited.at[0, "Điểm"] = 1.0
+    assert diff_frames(base, edited) == {1: {"Nội dung": "Câu 2: b đã sửa"}}
+    assert state.apply_cell_edits(diff_frames(base, edited)) == [1]
+
+
+def test_rows_key_changes_when_rows_change():
+    state = ExamState([_q("Câu 1: a"), _q("Câu 2: b")])
+    key = state.rows_key()
+    state.update(0, {"points": 2.0})
+    assert state.rows_key() == key            # sửa ô: giữ bảng đang sửa
+    removed = state.remove(1)
+    state.add(_q("Câu 3: c"))
+    assert len(state) == 2 and state.rows_key() != key  # xoá rồi thêm: cùng số dòng nhưng bảng mới
+    assert removed["_id"] != state.items[1]["_id"]
+    assert ExamState(state.items).rows_key() == state.rows_key()
+
+
+def test_hashes_track_add_update_remove():
+    state = ExamState([_q("a"), _q("A ")])
+    assert set(state.hashes()) == {question_hash("a")}
+    state.update(0, {"content": "b"})
+    assert set(state.hashes()) == {question_hash("a"), question_hash("b")}
+    state.remove(1)
+    state.add(_q("c"))
+    assert set(state.hashes()) == {question_hash(q["content"]) for q in state.items}
+    assert state.hash_of(state.items[-1]["_id"]) == question_hash("c")
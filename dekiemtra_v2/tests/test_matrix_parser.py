@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from modules.matrix_parser import (
+    ESSAY_TYPE,
+    MC_TYPE,
+    QUESTION_SEPARATOR,
+    parse_matrix_rows,
+    plan_jobs,
+    split_questions,
+)
+
+WIDE_HEADER = [
+    ["Chủ đề", "", "Mức 1", "", "Mức 2", ""],
+    ["", "", "TN", "TL", "TN", "TL"],
+]
+
+
+def _summary(cells):
+    return [(c.topic, c.level, c.q_type, c.count, c.points) for c in cells]
+
+
+def test_long_table():
+    rows = [
+        ["Chủ đề", "Mức", "Dạng", "Số câu", "Tổng điểm"],
+        ["Số học", "Mức 1", "TN", "2", "1"],
+        ["Hình học", "Mức 3", "Tự luận", "1", "2"],
+        ["Tổng", "", "", "3", "3"],
+    ]
+    assert _summary(parse_matrix_rows(rows)) == [
+        ("Số học", "Mức 1: Biết", MC_TYPE, 2, 0.5),
+        ("Hình học", "Mức 3: Vận dụng", ESSAY_TYPE, 1, 2.0),
+    ]
+
+
+def test_wide_table_repeated_merged_cells():
+    # docx: ô gộp dọc đã được lặp lại ở mọi dòng
+    rows = WIDE_HEADER + [
+        ["Số học", "Số câu", "2", "", "1", ""],
+        ["Số học", "Số điểm", "1", "", "2", ""],
+    ]
+    assert _summary(parse_matrix_rows(rows)) == [
+        ("Số học", "Mức 1: Biết", MC_TYPE, 2, 0.5),
+        ("Số học", "Mức 2: Hiểu", MC_TYPE, 1, 2.0),
+    ]
+
+
+def test_wide_table_blank_merged_cells_from_xlsx():
+    # xlsx: ô gộp dọc chỉ có giá trị ở dòng đầu
+    rows = WIDE_HEADER + [
+        ["Số học", "Số câu", "2", "", "1", ""],
+        ["", "Số điểm", "1", "", "2", ""],
+        ["Hình học", "Số câu", "", "1", "", "2"],
+        ["", "Số điểm", "", "1", "", "3"],
+        ["Tổng", "Số câu", "2", "1", "1", "2"],
+    ]
+    assert _summary(parse_matrix_rows(rows)) == [
+        ("Số học", "Mức 1: Biết", MC_TYPE, 2, 0.5),
+        ("Số học", "Mức 2: Hiểu", MC_TYPE, 1, 2.0),
+        ("Hình học", "Mức 1: Biết", ESSAY_TYPE, 1, 1.0),
+        ("Hình học", "Mức 2: Hiểu", ESSAY_TYPE, 2, 1.5),
+    ]
+
+
+def test_unrecognised_table():
+    assert parse_matrix_rows([["a", "b"], ["1", "2"]]) == []
+    assert parse_matrix_rows([]) == []
+
+
+def test_plan_jobs_splits_by_topic_in_order():
+    rows = WIDE_HEADER + [["Số học", "Số câu", "5", "", "1", ""]]
+    jobs = plan_jobs(parse_matrix_rows(rows), per_job=4)
+    assert [(j.topic, len(j.items)) for j in jobs] == [("Số học", 4), ("Số học", 2)]
+    assert jobs[1].items[-1][0] == "Mức 2: Hiểu"
+
+
+def test_split_questions():
+    text = f"Câu A\n{QUESTION_SEPARATOR}\nCâu B\n{QUESTION_SEPARATOR}\n\nCâu C"
+    assert split_questions(text, 2) == ["Câu A", "Câu B"]
+    assert split_questions("", 3) == []
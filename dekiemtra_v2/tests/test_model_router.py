@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from modules.model_router import ModelRouter
+
+
+def test_rate_limit_on_one_key_does_not_trip_other_keys():
+    router = ModelRouter()
+    router.record_failure("flash", rate_limited=True, key="k1")
+    assert router.order(["flash", "pro"], key="k1") == ["pro"]
+    assert router.order(["flash", "pro"], key="k2") == ["flash", "pro"]
+
+
+def test_success_resets_breaker_for_that_key_only():
+    router = ModelRouter()
+    for key in ("k1", "k2"):
+        router.record_failure("flash", rate_limited=True, key=key)
+    router.record_success("flash", 1.0, key="k1")
+    assert "flash" in router.order(["flash", "pro"], key="k1")
+    assert "flash" not in router.order(["flash", "pro"], key="k2")
+    assert {(s["key"], s["model"]) for s in router.snapshot()} == {("k1", "flash"), ("k2", "flash"), ("k1", "pro"), ("k2", "pro")}
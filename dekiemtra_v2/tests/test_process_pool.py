@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+
+import modules.process_pool as pp
+
+
+def test_pool_never_forks_the_server_process():
+    assert pp._mp_context().get_start_method() in ("forkserver", "spawn")
+
+
+def test_worker_runs_in_a_fresh_process():
+    with ProcessPoolExecutor(max_workers=1, mp_context=pp._mp_context()) as pool:
+        assert pool.submit(pow, 2, 10).result(timeout=60) == 1024
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from modules.prompt_budget import compact_table_text, estimate_tokens, fit_to_budget
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Số câu") >= 2
+    assert estimate_tokens("x" * 400) >= 100
+
+
+def test_plain_text_keeps_duplicate_lines():
+    # pypdf hay tách mỗi ô 1 dòng: các dòng trùng nhau là dữ liệu thật
+    text = "Số câu\n1\n1\n2\n\n   Số câu  \n1"
+    assert compact_table_text(text) == "Số câu\n1\n1\n2\nSố câu\n1"
+
+
+def test_csv_drops_repeated_header_and_empty_columns_only():
+    text = "Chủ đề,,Số câu\nSố học,,2\nSố học,,2\nChủ đề,,Số câu\nHình học,,1\n,,\n"
+    assert compact_table_text(text, sep=",") == "Chủ đề,Số câu\nSố học,2\nSố học,2\nHình học,1"
+
+
+def test_docx_rows_drop_repeated_header():
+    text = "Chủ đề | Mức 1 | \nSố học | 2 | \nChủ đề | Mức 1 | \nSố học | 2 | "
+    assert compact_table_text(text, sep=" | ") == "Chủ đề | Mức 1\nSố học | 2\nSố học | 2"
+
+
+def test_single_cell_first_row_is_not_a_header():
+    text = "1\n2\n1"
+    assert compact_table_text(text, sep=",") == "1\n2\n1"
+
+
+def test_fit_to_budget_cuts_on_line_boundaries():
+    text = "\n".join(f"Dòng {i} của bảng ma trận" for i in range(200))
+    out = fit_to_budget(text, 100)
+    assert estimate_tokens(out) <= 100
+    kept, marker = out.split("\n\n")
+    assert all(ln.startswith("Dòng ") and ln.endswith("ma trận") for ln in kept.splitlines())
+    assert f"({200 - len(kept.splitlines())} dòng)" in marker
+    assert fit_to_budget("ngắn", 100) == "ngắn"
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from modules.question_bank import QuestionBank
+
+
+def test_add_find_and_dedup(tmp_path):
+    bank = QuestionBank(tmp_path / "bank.sqlite3")
+    q = {"grade": "Lớp 3", "subject": "Toán", "topic": "Số học", "lesson": "Phép cộng",
+         "type": "Tự luận ngắn", "level": "Mức 1: Biết", "points": 1, "content": "Câu 1: 2 + 3 = ?"}
+    assert bank.add(q) is not None
+    assert bank.add({**q, "content": "  câu 1:   2 + 3 = ?"}) is None  # trùng sau chuẩn hoá
+    found = bank.find("Lớp 3", "Toán", "Số học", "Phép cộng", "Tự luận ngắn", "Mức 1: Biết")
+    assert [r["content"] for r in found] == ["Câu 1: 2 + 3 = ?"]
+    assert bank.count() == 1
+
+
+def test_unusable_database_degrades(tmp_path):
+    path = tmp_path / "broken.sqlite3"
+    path.write_bytes(b"not a database" * 100)
+    bank = QuestionBank(path)
+    assert bank.fts is False
+    assert bank.add({"content": "Câu 1"}) is None
+    assert bank.find("", "", "", "", "", "") == []
+    assert bank.count() == 0
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from modules.question_model import get_parsed, parse_question
+
+MC = "Câu 1: 2 + 2 = ?\nA. 3\nB. 4\nC. 5\nD. 6\nĐáp án: B"
+
+
+def test_parse_multiple_choice():
+    p = parse_question(MC)
+    assert p.stem == "Câu 1: 2 + 2 = ?"
+    assert [o[0] for o in p.options] == ["A", "B", "C", "D"]
+    assert p.mc_answer == "B" and p.answer == "B"
+    assert p.numbered and "Đáp án" not in p.body
+
+
+def test_get_parsed_does_not_mutate_question():
+    q = {"content": MC, "type": "Trắc nghiệm (4 lựa chọn)"}
+    before = dict(q)
+    assert get_parsed(q) is parse_question(MC)
+    assert q == before
+    q["content"] = "Điền vào chỗ trống: 1 + 1 = ......"
+    assert get_parsed(q).has_blank
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from modules.question_model import get_parsed, parse_question, strip_number
+from modules.variants import make_variant, make_variants
+
+MC = "trắc nghiệm 4 lựa chọn"
+
+
+def _mc(n, correct):
+    opts = {k: f"{k.lower()}{n}" for k in "ABCD"}
+    body = "\n".join(f"{k}. {v}" for k, v in opts.items())
+    return {"type": MC, "points": 0.5, "content": f"Câu {n} (0,5 điểm): Hỏi {n}?\n{body}\nĐáp án: {correct}"}
+
+
+def _exam():
+    return [_mc(i, "ABCD"[i % 4]) for i in range(1, 9)] + [
+        {"type": "Tự luận", "points": 2, "content": "Câu 9: Kể tên 3 con sông.\nĐáp án: Hồng, Đà, Mã"},
+    ]
+
+
+def _correct_text(content):
+    p = parse_question(content)
+    return dict((label, text) for label, text, _ in p.options)[p.mc_answer]
+
+
+def test_answer_letter_follows_the_correct_option():
+    exam = _exam()
+    by_stem = {strip_number(parse_question(q["content"]).stem): _correct_text(q["content"]) for q in exam[:8]}
+    variant = [q for q in make_variant(exam, seed=7) if q["type"] == MC]
+    assert [q["content"] for q in variant] != [strip_number(q["content"]) for q in exam[:8]]  # đã đảo thật
+    for q in variant:
+        assert _correct_text(q["content"]) == by_stem[parse_question(q["content"]).stem]
+
+
+def test_same_seed_same_variant_and_original_untouched():
+    exam = _exam()
+    before = [dict(q) for q in exam]
+    assert make_variant(exam, seed=3) == make_variant(exam, seed=3)
+    variants = make_variants(exam, ["101", "102", "103"])
+    assert len({tuple(q["content"] for q in v) for v in variants.values()}) == 3
+    assert exam == before
+
+
+def test_old_numbers_are_stripped_so_word_numbering_matches_answer_key():
+    variant = make_variant(_exam(), seed=11)
+    assert [q["content"].split("\n", 1)[0] for q in variant if q["type"] != MC] == ["Kể tên 3 con sông."]
+    for q in variant:
+        p = get_parsed(q)
+        # create_exam_docx tự in "Câu {idx}" cho câu chưa đánh số, và đáp án cũng theo idx
+        assert not p.numbered and p.answer
+        assert p.stem.startswith(("Hỏi", "Kể"))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark build_nested_curriculum trên dữ liệu CT giả lập (mặc định 100k dòng).
+
+Chạy từ thư mục dekiemtra_v2:
+    python tools/bench_curriculum.py [số_dòng]
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+APP_DIR = Path(__file__).resolve().parents[1]
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+import pandas as pd
+
+from modules.data_loader import build_nested_curriculum
+
+
+def build_nested_curriculum_legacy(df: pd.DataFrame) -> Dict[str, Any]:
+    """Bản cũ (iterrows + `bai not in list`) để so sánh."""
+    nested: Dict[str, Any] = {}
+    for _, r in df.iterrows():
+        lop = (r.get("lop") or "").strip() or "Khác"
+        mon = (r.get("mon") or "").strip() or "Khác"
+        hk = (r.get("hoc_ky") or "").strip() or "Khác"
+        cd = (r.get("chu_de") or "").strip() or "Khác"
+        bai = (r.get("bai") or "").strip() or ""
+        nested.setdefault(lop, {}).setdefault(mon, {}).setdefault(hk, {}).setdefault(cd, [])
+        if bai and bai not in nested[lop][mon][hk][cd]:
+            nested[lop][mon][hk][cd].append(bai)
+    return nested
+
+
+def synthetic_curriculum(n_rows: int, seed: int = 2018) -> pd.DataFrame:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n_rows):
+        lop = f"Lớp {rng.randint(1, 5)}"
+        mon = rng.choice(["Toán", "Tiếng Việt", "Khoa học", "Lịch sử và Địa lí", "Tin học"])
+        rows.append({
+            "hoc_ky": rng.choice(["Học kì I", "Học kì II"]),
+            "lop": lop,
+            "mon": mon,
+            "chu_de": f"Chủ đề {rng.randint(1, 8)}",
+            # nhiều bài mỗi chủ đề + dòng trùng (nhiều trường cùng kế hoạch)
+            "bai": f"Bài {rng.randint(1, 400)}" if rng.random() > 0.02 else "",
+            "tiet": str(rng.randint(1, 3)),
+            "yccd": "",
+        })
+    return pd.DataFrame(rows)
+
+
+def _timeit(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = synthetic_curriculum(n)
+
+    assert build_nested_curriculum(df) == build_nested_curriculum_legacy(df), "Kết quả khác bản cũ!"
+
+    t_old = _timeit(build_nested_curriculum_legacy, df)
+    t_new = min(_timeit(build_nested_curriculum, df) for _ in range(3))
+    print(f"{n} dòng | cũ (iterrows): {t_old:.3f}s | mới (groupby): {t_new:.3f}s | nhanh hơn x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
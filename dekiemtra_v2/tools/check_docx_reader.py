@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh đầu ra của bộ đọc DOCX nhanh (iterparse) với python-docx và đo thời gian.
+
+Chạy từ thư mục dekiemtra_v2:
+    python tools/check_docx_reader.py file1.docx [file2.docx ...]
+"""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1]
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+from modules.docx_reader import read_docx_table_rows
+
+
+def main() -> int:
+    failed = 0
+    for name in sys.argv[1:]:
+        data = Path(name).read_bytes()
+        t0 = time.perf_counter()
+        slow = read_docx_table_rows(data, fast=False)
+        t1 = time.perf_counter()
+        fast = read_docx_table_rows(data, fast=True)
+        t2 = time.perf_counter()
+        same = slow == fast
+        failed += not same
+        print(f"{'OK ' if same else 'KHÁC'} {name}: {len(fast)} dòng | python-docx {t1 - t0:.3f}s | nhanh {t2 - t1:.3f}s")
+        if not same:
+            for i, (a, b) in enumerate(zip(slow, fast)):
+                if a != b:
+                    print(f"  dòng {i}: python-docx={a!r}\n          nhanh={b!r}")
+                    break
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())